@@ -0,0 +1,13 @@
+import contextlib, shutil, tempfile
+
+
+@contextlib.contextmanager
+def temp_dir():
+    """Yield a new temporary directory, removed with its contents on
+    exit.
+    """
+    path = tempfile.mkdtemp()
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path)
@@ -0,0 +1,36 @@
+import io, os
+
+from tests import temp_dir
+from wot import archive, codec, query
+
+
+PATHS = ["tests/data/FILE1", "tests/data/FILE2", "tests/data/genesis.txt"]
+
+
+def test_build_corpus():
+    members = [("a", "abracadabra"), ("b", "cadabra abra"), ("c", "abracadabra")]
+    corpus_dict, directory = archive.build_corpus(members)
+    assert [name for name, _ in directory] == ["a", "b", "c"]
+    lengths = query.rule_lengths(corpus_dict)
+    for (name, data), (_, root) in zip(members, directory):
+        assert query.extract(corpus_dict, lengths, 0, len(data), root) == data
+    assert directory[0][1] == directory[2][1]
+
+
+def test_archive():
+    with temp_dir() as tmp_dir:
+        path = os.path.join(tmp_dir, "test.wota")
+        archive.create(path, PATHS)
+        with archive.Archive(path) as wota:
+            assert wota.names == PATHS
+            out_stream = io.BytesIO()
+            wota.extract(PATHS[1], out_stream)
+            assert out_stream.getvalue() == open(PATHS[1]).read()
+            # Only the rules of the extracted member were decoded.
+            assert len(wota.grammar.cache) < len(wota.grammar)
+        # The embedded .wot stream decodes to all members in order.
+        header_size = 8 + sum(8 + len(member) for member in PATHS)
+        with open(path, "rb") as in_file:
+            wot_data = in_file.read()[header_size:]
+        assert codec.test_decode(wot_data) == "".join(
+            open(member).read() for member in PATHS)
@@ -0,0 +1,42 @@
+from tests.bench import re_ends
+from wot import automaton, core
+
+
+def make_dict(data):
+    grammar = core.Grammar()
+    grammar.build(data)
+    return grammar.rules_to_dict()
+
+
+def test_automaton():
+    text = "abracadabra, abracadabra"
+    for pattern, expected in (("abra", [4, 11, 17, 24]),
+                              ("a[bc]", [2, 5, 9, 15, 18, 22]),
+                              ("(ab|ca)(r|d)a", [4, 8, 11, 17, 21, 24]),
+                              ("a.{2}a", [4, 11, 14, 17, 24]),
+                              ("br?a", [4, 11, 17, 24]),
+                              ("[^a-z]", [12, 13])):
+        assert list(automaton.Automaton(pattern).ends(text)) == expected
+    assert list(automaton.Automaton("RYN", True).ends("AcgTTa")) == [3, 5]
+    for pattern in ("a*", "(", "a)", "+a", "a{3,1}"):
+        try:
+            automaton.Automaton(pattern)
+        except ValueError:
+            pass
+        else:
+            assert False, pattern
+
+
+def test_matcher():
+    for path, patterns in (
+            ("tests/data/genesis.txt", ("God", "[Tt]he", "e.r", "(an|in)d")),
+            ("tests/data/FILE1", ("TATA", "GC[AT]{2,4}G", "CG+A"))):
+        data = open(path).read()
+        grammar_dict = make_dict(data)
+        for pattern in patterns:
+            matcher = automaton.Matcher(grammar_dict,
+                                        automaton.Automaton(pattern))
+            assert list(matcher.ends()) == \
+                list(matcher.automaton.ends(data))
+            assert list(matcher.ends()) == re_ends(pattern, data)
+            assert matcher.count() == len(list(matcher.ends()))
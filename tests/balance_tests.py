@@ -0,0 +1,32 @@
+import io, math
+
+from wot import balance, codec, core, query
+
+
+def make_grammar(data, engine='sequitur'):
+    grammar = core.ENGINES[engine]()
+    grammar.build(data)
+    return dict((rule_no, list(rhs))
+                for rule_no, rhs in grammar.freeze().rules_to_dict().items())
+
+
+def test_balance():
+    text = open("tests/data/OriginOfSpecies.txt").read()
+    # Growing prefixes make RePair build long chains of nested rules.
+    data = ''.join(text[:end] for end in range(0, 1200, 29))
+    for engine in ('sequitur', 'repair'):
+        grammar_dict = make_grammar(data, engine)
+        for factor in (2.0, 1.0, 0.0):
+            balanced = balance.balance(grammar_dict, factor)
+            lengths = query.rule_lengths(balanced)
+            assert query.extract(balanced, lengths, 0, len(data)) == data
+            heights = balance.rule_heights(balanced)
+            for rule_no, height in heights.items():
+                if rule_no:
+                    assert height <= max(factor, 1.5) * math.log(
+                        lengths[rule_no], 2) + 2
+            assert heights[0] <= balance.rule_heights(grammar_dict)[0]
+    encoded = codec.encode_rules_dict(balance.balance(grammar_dict), 'range')
+    out_stream = io.BytesIO()
+    codec.write_outputs(encoded, out_stream)
+    assert codec.test_decode(out_stream.getvalue()) == data
@@ -2,16 +2,19 @@
 # ______________________________________________________________________
 # Module imports
 
+import io
 import math
+import re
+import subprocess
 import sys
 import timeit
 
-from wot import codec
+from wot import automaton, codec
 
 # ______________________________________________________________________
 # Function definitions
 
-def bench_codec(path, max_time=60., quiet=True):
+def bench_codec(path, max_time=60., quiet=True, backend='huffman'):
     with open(path, 'rb') as file_obj:
         file_data = file_obj.read()
     file_len = len(file_data)
@@ -22,7 +25,7 @@ def bench_codec(path, max_time=60., quiet=True):
     for test_length in test_lengths:
         test_data = file_data[:test_length]
         t0 = timeit.default_timer()
-        encoded_str = codec.test_encode(test_data)
+        encoded_str = codec.test_encode(test_data, backend=backend)
         t1 = timeit.default_timer()
         decoded_str = codec.test_decode(encoded_str)
         t2 = timeit.default_timer()
@@ -34,20 +37,82 @@ def bench_codec(path, max_time=60., quiet=True):
         result = (encoding_time, decoding_time, total_time, compression_ratio)
         results[test_length] = result
         if not quiet:
-            print('%d: %r' % (test_length, result))
+            print('%d: %r (%.1f KB/s)' % (test_length, result,
+                                          test_length / total_time / 1024.))
         if total_time >= max_time:
             break
     return results
 
+def re_ends(pattern, data, max_len=64):
+    """Return the sorted end offsets of every match of pattern in data,
+    as automaton.Matcher.ends() counts them, using the re module.  Every
+    start with a match is tried with every length up to max_len.
+    """
+    anchored = re.compile("(?:%s)\\Z" % (pattern,))
+    ends = set()
+    for match in re.finditer("(?=%s)" % (pattern,), data):
+        start = match.start()
+        for end in xrange(start + 1, min(start + max_len, len(data)) + 1):
+            if anchored.match(data, start, end):
+                ends.add(end)
+    return sorted(ends)
+
+def bench_automaton(path, patterns, iupac=False, quiet=True):
+    """Compare counting pattern matches in the compressed domain with
+    decompressing and using the re module (which does not know IUPAC
+    codes, so iupac patterns are not checked).  Returns a map from each
+    pattern to (automaton time, decompress and re time, match count).
+    """
+    with open(path, 'rb') as file_obj:
+        encoded_str = codec.test_encode(file_obj.read())
+    grammar_dict = codec.decode_grammar_dict(io.BytesIO(encoded_str))
+    results = {}
+    for pattern in patterns:
+        t0 = timeit.default_timer()
+        count = automaton.Matcher(grammar_dict,
+                                  automaton.Automaton(pattern, iupac)).count()
+        t1 = timeit.default_timer()
+        re_count = len(re_ends(pattern, codec.test_decode(encoded_str)))
+        t2 = timeit.default_timer()
+        assert iupac or count == re_count, '%d != %d' % (count, re_count)
+        results[pattern] = (t1 - t0, t2 - t1, count)
+        if not quiet:
+            print('%s: %r' % (pattern, results[pattern]))
+    return results
+
+# ______________________________________________________________________
+
+def bench_import(module_name, repeat=5, quiet=True):
+    """Return the best wall clock time taken to start a fresh
+    interpreter and import the given module.
+    """
+    command = [sys.executable, "-c", "import %s" % module_name]
+    times = []
+    for _ in xrange(repeat):
+        t0 = timeit.default_timer()
+        subprocess.check_call(command)
+        times.append(timeit.default_timer() - t0)
+    result = min(times)
+    if not quiet:
+        print('import %s: %.3f s' % (module_name, result))
+    return result
+
 # ______________________________________________________________________
 # Main routine
 
 def main(*args):
+    print("_" * 70)
+    for module_name in ("wot.codec", "wot.mapped", "wot.mrwot"):
+        bench_import(module_name, quiet=False)
     for arg in args:
         print("_" * 70)
         print(arg)
-        print("_" * 60)
-        bench_codec(arg, quiet=False)
+        bench_automaton(arg, ("GATC", "CG[AT]{2}CG", "TATA[AT]A", "(GC)+GG"),
+                        quiet=False)
+        for backend in codec.BACKENDS:
+            print("_" * 60)
+            print(backend)
+            bench_codec(arg, quiet=False, backend=backend)
 
 # ______________________________________________________________________
 
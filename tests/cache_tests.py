@@ -0,0 +1,99 @@
+import os
+
+from mrjob.protocol import JSONProtocol
+
+from tests import temp_dir
+from wot import cache, mrwot, parallel, query
+
+
+def test_segment_cache():
+    with temp_dir() as tmp_dir:
+        segment_cache = cache.SegmentCache(tmp_dir)
+        data = "abracadabraabracadabra"
+        grammar = segment_cache.build(data, 'seg:0')
+        assert (segment_cache.hits, segment_cache.misses) == (0, 1)
+        cached = segment_cache.build(data, 'seg:1')
+        assert (segment_cache.hits, segment_cache.misses) == (1, 1)
+        assert cached.segment == 'seg:1'
+        assert cached.rules_to_dict() == grammar.rules_to_dict()
+        assert query.Index(cached).extract(0, len(data)) == data
+        # Build settings are part of the key.
+        assert cache.segment_key(data) != cache.segment_key(data, 'repair')
+        assert cache.segment_key(data) != cache.segment_key(data, min_run=4)
+
+
+def test_evict():
+    with temp_dir() as tmp_dir:
+        segment_cache = cache.SegmentCache(tmp_dir, 250)
+        for idx, key in enumerate("abc"):
+            segment_cache.put(key, key * 100)
+            os.utime(segment_cache.entry_path(key), (idx, idx))
+        segment_cache.put("d", "d" * 100)
+        assert segment_cache.get("a") is None
+        assert segment_cache.get("b") is None
+        assert segment_cache.get("c") == "c" * 100
+        assert segment_cache.size() == 200
+        assert segment_cache.total == 200
+        # Inserts under max_bytes keep a running total.
+        segment_cache.max_bytes = 1000
+        segment_cache.put("e", "e" * 100)
+        segment_cache.put("e", "e" * 50)
+        assert segment_cache.total == segment_cache.size() == 250
+
+
+def test_mapper():
+    with temp_dir() as tmp_dir:
+        data = 'abracadabraabracadabra'
+        dumps = [next(mrwot.MRWoT(args=args).mapper('seg:0', data))[1]
+                 for args in ([], ['--cache-dir', tmp_dir],
+                              ['--cache-dir', tmp_dir])]
+        assert len(os.listdir(tmp_dir)) == 1
+        for dump in dumps:
+            assert dump[0] == 'seg:0'
+            assert dict(dump[1]) == dict(
+                (rule_no, tuple(rhs)) for rule_no, rhs in dumps[0][1])
+
+
+def test_mapper_latin1():
+    with temp_dir() as tmp_dir:
+        data = u'caf\xe9 caf\xe9 na\xefve na\xefve\xff'
+        protocol = JSONProtocol()
+        dumps = []
+        for args in ([], ['--cache-dir', tmp_dir], ['--cache-dir', tmp_dir]):
+            dump = next(mrwot.MRWoT(args=args).mapper('f:0', data))[1]
+            protocol.write(None, dump)
+            dumps.append(dump)
+        for dump in dumps[1:]:
+            assert dump == dumps[0]
+            assert all(type(symbol) != str
+                       for _, rhs in dump[1] for symbol in rhs)
+
+
+def test_mapper_unicode():
+    with temp_dir() as tmp_dir:
+        data = u'caf\u2019 caf\u2019 caf\u2019 x'
+        dumps = [next(mrwot.MRWoT(args=args).mapper('f:0', data))[1]
+                 for args in ([], ['--cache-dir', tmp_dir])]
+        assert dumps[1] == dumps[0]
+        assert os.listdir(tmp_dir) == []
+        try:
+            cache.segment_key(data)
+        except UnicodeEncodeError:
+            pass
+        else:
+            assert False
+        assert cache.segment_key(u'caf\xe9') == cache.segment_key('caf\xe9')
+
+
+def test_parallel():
+    with temp_dir() as tmp_dir:
+        expected = parallel.build("tests/data/69k", 2, 10000)
+        for _ in range(2):
+            grammar, segments = parallel.build("tests/data/69k", 2, 10000,
+                                               cache_dir=tmp_dir)
+            assert segments == expected[1]
+            assert grammar.rules_to_dict() == expected[0].rules_to_dict()
+        # Identical segments (the long run of N) share an entry.
+        data = open("tests/data/69k").read()
+        assert len(os.listdir(tmp_dir)) == len(set(
+            data[start:start + 10000] for start in range(0, len(data), 10000)))
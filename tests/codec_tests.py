@@ -0,0 +1,50 @@
+import io
+
+from wot import codec
+
+
+def test_huffman():
+    codec.test_generators()
+    codec.test_grammar_dicts()
+    codec.test_codec(open("tests/data/genesis.txt").read())
+
+
+def test_range():
+    codec.test_generators('range')
+    data = open("tests/data/genesis.txt").read()
+    codec.test_codec(data, backend='range')
+    assert codec.test_encode(data, backend='range')[:4] == "WOT\x01"
+
+
+def test_budget():
+    data = open("tests/data/genesis.txt").read()
+    for engine in ("sequitur", "repair"):
+        for backend in ("huffman", "range"):
+            codec.test_codec(data, engine, backend, max_bytes=100000)
+    encoded = codec.test_encode(data, max_bytes=100000)
+    assert encoded[:4] == "WOT\x02"
+    assert encoded.count("WOT\x02") > 1
+
+
+class FailingStream(object):
+    def read(self, size):
+        raise IOError("read failed")
+
+
+def test_pipelined():
+    data = open("tests/data/genesis.txt").read()
+    for options in ({}, {'max_bytes': 100000}, {'min_run': 4},
+                    {'engine': 'repair', 'max_bytes': 100000}):
+        out_stream = io.BytesIO()
+        stats = codec.encode_pipelined(io.BytesIO(data), out_stream,
+                                       backend='range', read_size=4096,
+                                       queue_blocks=2, **options)
+        assert out_stream.getvalue() == codec.test_encode(
+            data, backend='range', **options)
+        assert stats.build > 0
+    try:
+        codec.encode_pipelined(FailingStream(), io.BytesIO())
+    except IOError:
+        pass
+    else:
+        assert False, "read error not raised"
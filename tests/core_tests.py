@@ -0,0 +1,42 @@
+import random, subprocess, sys
+
+from wot import core, mrwot, query, repair
+
+
+LIGHT_MODULES = ["archive", "client", "codec", "core", "frozen", "mapped",
+                 "parallel", "query", "server", "similarity"]
+
+
+def test_reexports():
+    assert mrwot.Grammar is core.Grammar
+    assert mrwot.merge is core.merge
+
+
+def test_light_imports():
+    # Importing the command line modules must not load mrjob (see
+    # tests/bench.py for the import time benchmark).
+    script = ("import sys\n"
+              "from wot import %s\n"
+              "heavy = [name for name in sys.modules\n"
+              "         if name.split('.')[0] in ('mrjob', 'boto')]\n"
+              "assert not heavy, heavy\n" % ", ".join(LIGHT_MODULES))
+    subprocess.check_call([sys.executable, "-c", script])
+
+
+def test_merge_repair():
+    # RePair dumps may repeat digrams, which loading must keep as is.
+    rng = random.Random(0)
+    segments = ['aab', 'aabbaaaaaaabbbabbbbaabaa']
+    for _ in xrange(40):
+        segments.append(''.join(rng.choice('ab')
+                                for _ in xrange(rng.randrange(1, 40))))
+    dumps = []
+    for segment_no, segment in enumerate(segments):
+        grammar = repair.Grammar()
+        grammar.build(segment, segment_no)
+        dumps.append(grammar.dump())
+    merged, roots = core.merge(dumps)
+    grammar_dict = merged.rules_to_dict()
+    for segment_no, segment in enumerate(segments):
+        index = query.Index(grammar_dict, roots[segment_no])
+        assert index.extract(0, index.length()) == segment
@@ -0,0 +1,70 @@
+import copy, io, math, random
+
+from wot import codec, core, edit
+
+
+def make_grammar(data):
+    grammar = core.Grammar()
+    grammar.build(data)
+    return dict((rule_no, list(rhs))
+                for rule_no, rhs in grammar.rules_to_dict().items())
+
+
+def test_edits():
+    rng = random.Random(42)
+    data = open("tests/data/OriginOfSpecies.txt").read()[:20000]
+    grammar_dict = make_grammar(data)
+    original = copy.deepcopy(grammar_dict)
+    grammar = edit.EditableGrammar(grammar_dict)
+    for _ in range(200):
+        start = rng.randrange(len(data) + 1)
+        end = min(len(data), start + rng.choice((0, 1, 7, 300, 5000)))
+        new_data = rng.choice(("", "x", "natural selection", data[:100]))
+        grammar.replace(start, end, new_data)
+        data = data[:start] + new_data + data[end:]
+        assert grammar.length() == len(data)
+        around = max(start - 50, 0)
+        assert grammar.extract(around, 100) == data[around:around + 100]
+    assert grammar.extract(0, len(data)) == data
+    # The wrapped dictionary is never modified.
+    assert grammar_dict == original
+    encoded = io.BytesIO()
+    grammar.save(encoded)
+    assert codec.test_decode(encoded.getvalue()) == data
+
+
+def test_insert_delete():
+    grammar = edit.EditableGrammar(make_grammar("abracadabraabracadabra"))
+    grammar.insert(11, "--")
+    grammar.insert(0, "<")
+    grammar.insert(25, ">")
+    assert grammar.extract(0, 26) == "<abracadabra--abracadabra>"
+    grammar.delete(1, 12)
+    grammar.delete(3, 3)
+    assert grammar.extract(0, 15) == "<--abracadabra>"
+    grammar.delete(0, grammar.length())
+    assert grammar.length() == 0
+    assert grammar.rules_to_dict() == {0: ()}
+
+
+def test_appends():
+    data = "abracadabraabracadabra"
+    grammar = edit.EditableGrammar(make_grammar(data))
+    for idx in range(2000):
+        grammar.insert(grammar.length(), "xyz"[idx % 3])
+        data += "xyz"[idx % 3]
+        # The spine stays balanced, so the root body stays small.
+        assert len(grammar[grammar.root]) <= 1
+        assert len(grammar[grammar.tree]) <= 2
+        assert grammar.height(grammar.tree) <= 2 * math.log(len(data), 2)
+    assert grammar.extract(0, len(data)) == data
+    encoded = io.BytesIO()
+    grammar.save(encoded)
+    assert codec.test_decode(encoded.getvalue()) == data
+    grammar.delete(0, grammar.length())
+    try:
+        grammar.save(io.BytesIO())
+    except ValueError:
+        pass
+    else:
+        assert False, "saved an empty expansion"
@@ -0,0 +1,65 @@
+import os, struct
+
+from tests import temp_dir
+from wot import core, frozen, query, repair, runs
+
+
+def test_freeze():
+    data = open("tests/data/genesis.txt").read()
+    for engine in (core.Grammar, repair.Grammar):
+        grammar = engine()
+        grammar.build(data, 3)
+        frozen_grammar = grammar.freeze()
+        assert frozen_grammar.dump() == grammar.dump()
+        assert frozen_grammar.rules_to_dict() == grammar.rules_to_dict()
+        lengths = query.rule_lengths(grammar.rules_to_dict())
+        for rule_no in frozen_grammar.keys():
+            assert frozen_grammar.length(rule_no) == lengths[rule_no]
+            assert frozen_grammar.uses(rule_no) == sum(
+                rhs.count(rule_no) for rhs in frozen_grammar.values())
+        assert frozen_grammar.length() == len(data)
+        assert query.Index(frozen_grammar).extract(100, 50) == data[100:150]
+
+
+def test_bytes():
+    grammar = core.Grammar()
+    grammar.build("abracadabraabracadabra", 3)
+    frozen_grammar = grammar.freeze()
+    thawed = frozen.FrozenGrammar.frombuffer(frozen_grammar.tobytes(), 3)
+    assert thawed.dump() == grammar.dump()
+    assert thawed.lengths == frozen_grammar.lengths
+    assert thawed.usage == frozen_grammar.usage
+
+
+def test_layout():
+    grammar = core.Grammar()
+    grammar.build(runs.encode_runs("abracadabra" + "a" * 40 + "b" * 30, 16))
+    frozen_grammar = grammar.freeze()
+    rule_count = len(frozen_grammar)
+    symbol_count = len(frozen_grammar.symbols)
+    # Fixed width little-endian integers whatever the platform.
+    buf = frozen_grammar.tobytes()
+    assert len(buf) == (frozen.HEADER.size + 8 * (4 * rule_count + 1) +
+                        4 * symbol_count + 8 * 2 * len(frozen_grammar.runs))
+    pos = frozen.HEADER.size
+    assert struct.unpack_from("<%dq" % (rule_count,), buf, pos) == tuple(
+        frozen_grammar.numbers)
+    with temp_dir() as tmp_dir:
+        path = os.path.join(tmp_dir, "grammar.wotf")
+        with open(path, "wb") as out_file:
+            out_file.write(buf)
+        with frozen.FrozenGrammar.load(path, 3) as loaded:
+            # The tables are read from the map.
+            assert isinstance(loaded.symbols, frozen.MappedArray)
+            assert loaded.dump() == (3, frozen_grammar.dump()[1])
+            assert loaded.runs == frozen_grammar.runs
+            assert list(loaded.lengths) == list(frozen_grammar.lengths)
+            assert loaded.histogram() == frozen_grammar.histogram()
+            assert loaded.tobytes() == buf
+        assert loaded.map is None
+        try:
+            frozen.FrozenGrammar.frombuffer(buf[:-4], copy=False)
+        except ValueError:
+            pass
+        else:
+            assert False, "loaded a truncated grammar"
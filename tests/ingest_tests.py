@@ -0,0 +1,40 @@
+import gzip, json, os
+
+from tests import temp_dir
+from wot import ingest
+
+
+FASTA = ">one\nACGTACGT\nACGT\n>two\nGGGG\n>three\n" + "T" * 30 + "\n"
+
+
+def test_chunks():
+    data = open("tests/data/10k").read()
+    chunks = list(ingest.iter_chunks(open("tests/data/10k"), 4096))
+    assert [len(chunk) for chunk in chunks] == [4096, 4096, 2048]
+    assert ''.join(chunks) == data
+
+
+def test_records():
+    class Stream(object):
+        def __init__(self, data):
+            self.data = data
+        def read(self, size):
+            ret_val, self.data = self.data[:size], self.data[size:]
+            return ret_val
+    chunks = list(ingest.iter_records(Stream(FASTA), 24))
+    assert ''.join(chunks) == FASTA
+    assert chunks[:2] == [">one\nACGTACGT\nACGT\n", ">two\nGGGG\n"]
+    assert all(len(chunk) <= 24 for chunk in chunks)
+
+
+def test_segments():
+    with temp_dir() as tmp_dir:
+        path = os.path.join(tmp_dir, "sample.fa.gz")
+        with gzip.open(path, "wb") as out_file:
+            out_file.write(FASTA)
+        lines = [ingest.format_record(key, data)
+                 for key, data in ingest.iter_segments([path], 24, True)]
+        keys = [json.loads(line.split('\t')[0]) for line in lines]
+        assert keys == [path + ":%d" % index for index in range(len(lines))]
+        assert ''.join(json.loads(line.split('\t')[1])
+                       for line in lines) == FASTA
@@ -0,0 +1,36 @@
+import os
+
+from tests import temp_dir
+from wot import dimer, kmers
+
+SAMPLES = ["tests/data/FILE%d" % (idx,) for idx in range(1, 5)]
+
+
+def test_kmer_index():
+    for index in range(4 ** 3):
+        assert kmers.kmer_index(kmers.kmer_word(index, 3)) == index
+    assert [kmers.kmer_word(index, 2) for index in range(5)] == \
+        ['AA', 'AC', 'AG', 'AT', 'CA']
+
+
+def test_build():
+    with temp_dir() as tmp_dir:
+        path = os.path.join(tmp_dir, "samples.kmx")
+        kmers.build(SAMPLES, path, 2, workers=2)
+        with kmers.KmerMatrix(path) as matrix:
+            assert matrix.names == SAMPLES
+            for sample, sample_path in enumerate(SAMPLES):
+                assert matrix.histogram(sample) == \
+                    dimer.histogram(sample_path, 2)
+            assert matrix.count(2, 'GT') == matrix.row(2)[1][11]
+        kmers.build(SAMPLES, path, 6, workers=2, min_count=2, min_total=6)
+        with kmers.KmerMatrix(path) as matrix:
+            counts = [dict(zip(*matrix.row(sample)))
+                      for sample in range(len(matrix))]
+            for index in set().union(*counts):
+                column = matrix.column(index)
+                assert column == [sample_counts.get(index, 0)
+                                  for sample_counts in counts]
+                assert min(count for count in column if count) >= 2
+                assert sum(column) >= 6
+            assert matrix.stored == sum(len(row) for row in counts)
@@ -0,0 +1,43 @@
+import io, os
+
+from tests import temp_dir
+from wot import codec, mapped, query
+
+
+def check_mapped(data, backend):
+    with temp_dir() as tmp_dir:
+        wot_path = os.path.join(tmp_dir, "data.wot")
+        with open(wot_path, "wb") as out_file:
+            out_file.write(codec.test_encode(data, backend=backend))
+        out_stream = io.BytesIO()
+        mapped.decode(wot_path, out_stream, cache_symbols=64)
+        assert out_stream.getvalue() == data
+        with mapped.MappedGrammar(wot_path, cache_symbols=64) as grammar:
+            with open(wot_path, "rb") as in_file:
+                grammar_dict = codec.decode_grammar_dict(in_file)
+            assert sorted(grammar.keys()) == sorted(grammar_dict.keys())
+            for rule_no in grammar.keys():
+                assert grammar[rule_no] == list(grammar_dict[rule_no])
+            assert grammar.cached_symbols <= 64 or len(grammar.cache) == 1
+            assert query.Index(grammar).extract(100, 20) == data[100:120]
+
+
+def test_huffman():
+    check_mapped(open("tests/data/genesis.txt").read(), 'huffman')
+
+
+def test_range():
+    check_mapped(open("tests/data/genesis.txt").read(), 'range')
+
+
+def test_framed():
+    data = open("tests/data/genesis.txt").read()
+    with temp_dir() as tmp_dir:
+        wot_path = os.path.join(tmp_dir, "data.wot")
+        for backend in ("huffman", "range"):
+            with open(wot_path, "wb") as out_file:
+                out_file.write(codec.test_encode(data, backend=backend,
+                                                 max_bytes=100000))
+            out_stream = io.BytesIO()
+            mapped.decode(wot_path, out_stream, cache_symbols=64)
+            assert out_stream.getvalue() == data
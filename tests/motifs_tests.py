@@ -0,0 +1,22 @@
+from wot import core, motifs
+
+
+def test_motifs():
+    data = open("tests/data/genesis.txt").read()
+    grammar = core.Grammar()
+    grammar.build(data)
+    report = motifs.Motifs(grammar.rules_to_dict())
+    ranked = report.rank(min_length=8)
+    assert ranked
+    assert [item[3] for item in ranked] == sorted(
+        (item[3] for item in ranked), reverse=True)
+    for rule_no, length, count, covered in ranked[:10]:
+        motif = report.motif(rule_no)
+        assert len(motif) == length >= 8
+        assert covered == length * count
+        positions = report.positions(rule_no)
+        assert len(positions) == count
+        assert all(data[position:position + length] == motif
+                   for position in positions)
+        assert report.positions(rule_no, 1) == positions[:1]
+    assert len(report.rank(limit=5)) == 5
@@ -0,0 +1,78 @@
+import io, os
+
+from tests import temp_dir
+from tests.revcomp_tests import make_dna
+from wot import codec, mapped, nucleotide, parallel
+
+
+def test_split_terminals():
+    rules_dict = {0: ['A', 1, 'C', 'G', 2, -1, 'N'], 1: [2, 2, 'T'],
+                  2: ['G', 'A']}
+    assert nucleotide.detect_alphabet({'A': 1, 'C': 2, 1: 3}) == 'ACGT'
+    assert nucleotide.detect_alphabet({'N': 1, 'T': 2}) == 'ACGTN'
+    assert nucleotide.detect_alphabet({'A': 1, 'x': 1}) is None
+    assert nucleotide.detect_alphabet({1: 1}) is None
+    split, section = nucleotide.split_terminals(rules_dict, 'ACGTN')
+    alphabet, first_leaf, lengths, packed = section
+    assert (first_leaf, lengths) == (3, [2, 1, 2, 1, 1])
+    assert split[0] == [4, 1, 5, 3, -1, 6]
+    assert split[1] == [3, 3, 7]
+    assert 2 not in split
+    unpacked = nucleotide.unpack_leaves(split, section)
+    assert [''.join(unpacked[leaf]) for leaf in range(3, 8)] == [
+        'GA', 'A', 'CG', 'N', 'T']
+
+
+def test_codec():
+    data = make_dna(2, 10)
+    for in_str in (data, data[:300] + 'N' * 20 + data[300:]):
+        for engine, backend in (('repair', 'huffman'), ('sequitur', 'range'),
+                                ('revcomp', 'range')):
+            plain = codec.encode_str(in_str, engine, backend)
+            packed = codec.encode_str(in_str, engine, backend,
+                                      nucleotide=True)
+            assert ord(packed[3]) & codec.FLAG_NUCLEOTIDE
+            assert len(packed) < len(plain)
+            assert codec.test_decode(packed) == in_str
+    # Framed members, and input that is not DNA.
+    data = make_dna(7, 10)
+    for in_str in (data, data.lower()):
+        out_stream = io.BytesIO()
+        codec.encode(io.BytesIO(in_str), out_stream, 'repair', 'range',
+                     max_bytes=2000, nucleotide=True)
+        encoded = out_stream.getvalue()
+        assert bool(ord(encoded[3]) & codec.FLAG_NUCLEOTIDE) == (
+            in_str == data)
+        assert codec.test_decode(encoded) == in_str
+
+
+def test_short():
+    # The root of a short input may be a single leaf, leaving a single
+    # symbol to entropy code.
+    for in_str in ('A', 'N', 'ACGT', 'ACGTTTGA', 'ACGTACGTACGT', 'NNNNA'):
+        for engine in sorted(codec.ENGINES):
+            for backend in codec.BACKENDS:
+                encoded = codec.encode_str(in_str, engine, backend,
+                                           nucleotide=True)
+                assert ord(encoded[3]) & codec.FLAG_NUCLEOTIDE
+                assert codec.test_decode(encoded) == in_str
+
+
+def test_mapped():
+    data = make_dna(3, 10)
+    data = data[:300] + 'N' * 20 + data[300:]
+    with temp_dir() as tmp_dir:
+        path = os.path.join(tmp_dir, "dna.wot")
+        out_path = os.path.join(tmp_dir, "dna")
+        for max_bytes in (None, 2000):
+            for backend in codec.BACKENDS:
+                with open(path, "wb") as out_file:
+                    codec.encode(io.BytesIO(data), out_file, 'repair',
+                                 backend, max_bytes, nucleotide=True)
+                with open(path, "rb") as in_file:
+                    assert ord(in_file.read(4)[3]) & codec.FLAG_NUCLEOTIDE
+                out_stream = io.BytesIO()
+                mapped.decode(path, out_stream, cache_symbols=64)
+                assert out_stream.getvalue() == data
+                assert parallel.decode(path, out_path, 2, 100) == len(data)
+                assert open(out_path, "rb").read() == data
@@ -0,0 +1,77 @@
+import multiprocessing, os
+
+from tests import temp_dir
+from wot import codec, core, parallel
+
+
+def expand(grammar, rule_no):
+    grammar_dict = dict((key, list(value))
+                        for key, value in grammar.rules_to_dict().items())
+    decoder = codec.make_decoder(grammar_dict, codec.make_memo(grammar_dict))
+    return ''.join(decoder(grammar_dict[rule_no][:]))
+
+
+def test_build():
+    data = open("tests/data/69k").read()
+    grammar, segments = parallel.build("tests/data/69k", workers=2,
+                                       segment_size=10000)
+    assert sorted(segments.keys()) == range(8)
+    for segment, rule_no in segments.items():
+        assert expand(grammar, rule_no) == \
+            data[segment * 10000:(segment + 1) * 10000]
+
+
+def test_imap_bounded():
+    read = []
+    # __________________________________________________
+    def _tasks():
+        for task in range(-100, 0):
+            read.append(task)
+            yield task
+    # __________________________________________________
+    pool = multiprocessing.Pool(2)
+    try:
+        results = parallel.imap_bounded(pool, abs, _tasks(), 4)
+        assert next(results) == 100
+        assert len(read) == 5
+        assert list(results) == range(99, 0, -1)
+    finally:
+        pool.terminate()
+
+
+def test_build_cleanup():
+    # __________________________________________________
+    def _merge(dumps):
+        next(dumps)
+        raise RuntimeError("merge failed")
+    # __________________________________________________
+    shm_dir, merge = parallel.SHM_DIR, core.merge
+    with temp_dir() as tmp_dir:
+        parallel.SHM_DIR, core.merge = tmp_dir, _merge
+        try:
+            try:
+                parallel.build("tests/data/69k", workers=2,
+                               segment_size=1000)
+            except RuntimeError:
+                pass
+            else:
+                assert False, "merge did not fail"
+            assert os.listdir(tmp_dir) == []
+        finally:
+            parallel.SHM_DIR, core.merge = shm_dir, merge
+
+
+def test_decode():
+    data = open("tests/data/69k").read()
+    with temp_dir() as tmp_dir:
+        path = os.path.join(tmp_dir, "69k.wot")
+        out_path = os.path.join(tmp_dir, "69k")
+        for encoded in (codec.test_encode(data, backend='range'),
+                        codec.test_encode(data, backend='range',
+                                          max_bytes=20000)):
+            with open(path, "wb") as out_file:
+                out_file.write(encoded)
+            for chunk_size in (None, 1000):
+                assert parallel.decode(path, out_path, 3,
+                                       chunk_size) == len(data)
+                assert open(out_path, "rb").read() == data
@@ -0,0 +1,35 @@
+from wot import core, query
+
+
+def make_index(data):
+    grammar = core.Grammar()
+    grammar.build(data)
+    return query.Index(grammar.rules_to_dict())
+
+
+def test_extract():
+    data = open("tests/data/genesis.txt").read()
+    index = make_index(data)
+    assert index.length() == len(data)
+    for start, length in ((0, 10), (5, 1000), (2400, 200), (3000, 5)):
+        assert index.extract(start, length) == data[start:start + length]
+
+
+def test_count():
+    data = open("tests/data/genesis.txt").read() + "aaaa"
+    index = make_index(data)
+    for pattern in ("the", "God", "e", "\n\n", "aa", "light from"):
+        assert index.count(pattern) == sum(
+            1 for idx in range(len(data)) if data.startswith(pattern, idx))
+
+
+def test_count_cache():
+    data = open("tests/data/genesis.txt").read()
+    index = make_index(data)
+    estimate = index.memory_estimate()
+    for start in range(0, 2000, 3):
+        index.count(data[start:start + 4])
+    assert len(index.counts) == query.COUNT_CACHE_SIZE
+    index.count(data[:query.COUNT_PATTERN_BYTES + 1])
+    assert data[:query.COUNT_PATTERN_BYTES + 1] not in index.counts
+    assert index.memory_estimate() == estimate
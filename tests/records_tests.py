@@ -0,0 +1,41 @@
+import io, os
+
+from tests import temp_dir
+from wot import codec, core, records
+
+
+FASTA = ''.join('>contig%d length=%d\n%s\n' % (
+    idx, 8 * (idx + 3), '\n'.join(['ACGTTGCA' * (idx + 3)] * (2 + idx % 3)))
+    for idx in range(20))
+
+
+def test_rank_select():
+    text = open("tests/data/code.input").read()
+    grammar = core.Grammar()
+    grammar.build(text)
+    index = records.RecordIndex(records.block_root(grammar.rules_to_dict(),
+                                                   16), '\n')
+    offsets = [pos for pos, char in enumerate(text) if char == '\n']
+    assert [index.select(idx) for idx in range(len(offsets))] == offsets
+    for offset in range(0, len(text) + 1, 97):
+        assert index.rank(offset) == text[:offset].count('\n')
+    lines = text.splitlines(True)
+    assert len(index) == len(lines)
+    assert [index.record(idx) for idx in range(len(lines))] == lines
+
+
+def test_fasta():
+    with temp_dir() as tmp_dir:
+        path = os.path.join(tmp_dir, "contigs.fa.wot")
+        for backend in codec.BACKENDS:
+            with open(path, "wb") as out_file:
+                codec.encode(io.BytesIO(FASTA), out_file, backend=backend,
+                             records='fasta')
+            with open(path, "rb") as in_file:
+                assert codec.test_decode(in_file.read()) == FASTA
+            contigs = ['>' + contig for contig in FASTA.split('>')[1:]]
+            with records.RecordIndex.load(path) as index:
+                assert len(index) == len(contigs)
+                assert index.record(7) == contigs[7]
+                assert index.find('contig19') == contigs[19]
+                assert sorted(index.names.values()) == range(len(contigs))
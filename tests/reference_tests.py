@@ -0,0 +1,63 @@
+import io, os
+
+from tests import temp_dir
+from wot import codec, reference
+
+
+def sample_of(data):
+    """Substitute every 100th byte, drop a stretch and insert another."""
+    sample = list(data)
+    for idx in xrange(50, len(sample), 100):
+        sample[idx] = 'x' if sample[idx] != 'x' else 'y'
+    sample = ''.join(sample)
+    return sample[:3000] + 'GATTACA' * 20 + sample[3500:]
+
+
+def read_data():
+    return open("tests/data/OriginOfSpecies.txt").read()[100000:110000]
+
+
+def test_cover():
+    data = read_data()
+    ref = reference.Reference(codec.decode_grammar_dict(
+        io.BytesIO(codec.test_encode(data, backend='range'))))
+    for start, end in ((0, 10000), (17, 18), (100, 3000), (5000, 10000)):
+        symbols = ref.cover(start, end)
+        assert ''.join(codec.make_decoder(ref.grammar_dict, {})(symbols)) \
+            == data[start:end]
+
+
+def test_codec():
+    data = read_data()
+    sample = sample_of(data)
+    with temp_dir() as tmp_dir:
+        path = os.path.join(tmp_dir, "reference.wot")
+        with open(path, "wb") as out_file:
+            out_file.write(codec.test_encode(data, backend='range'))
+        ref = reference.Reference.load(path)
+        for backend in codec.BACKENDS:
+            out_stream = io.BytesIO()
+            codec.encode(io.BytesIO(sample), out_stream, backend=backend,
+                         reference=ref)
+            encoded = out_stream.getvalue()
+            assert len(encoded) < len(codec.test_encode(
+                sample, backend=backend)) / 4
+            out_stream = io.BytesIO()
+            codec.decode(io.BytesIO(encoded), out_stream, ref)
+            assert out_stream.getvalue() == sample
+            # Decoding does not expand the reference.
+            decode_ref = reference.Reference.load(path)
+            out_stream = io.BytesIO()
+            codec.decode(io.BytesIO(encoded), out_stream, decode_ref)
+            assert out_stream.getvalue() == sample
+            assert decode_ref._text is None and decode_ref._anchors is None
+        # Decoding needs the same reference.
+        other = reference.Reference(codec.decode_grammar_dict(
+            io.BytesIO(codec.test_encode(data[1:], backend='range'))))
+        for bad_ref in (None, other):
+            try:
+                codec.decode_grammar_dict(io.BytesIO(encoded), bad_ref)
+            except ValueError:
+                pass
+            else:
+                assert False, "decoded with %r" % (bad_ref,)
@@ -0,0 +1,35 @@
+from wot import codec, mrwot, query, repair
+
+
+def test_repair():
+    sequence, rules = repair.repair('abcabcabc')
+    assert sequence == [3, 2]
+    assert rules == [['a', 'b'], [1, 'c'], [2, 2]]
+
+
+def test_grammar():
+    data = open("tests/data/genesis.txt").read()
+    grammar = repair.Grammar()
+    grammar.build(data[:1000])
+    grammar.build(data[1000:])
+    grammar_dict = grammar.rules_to_dict()
+    assert query.Index(grammar_dict).extract(0, len(data)) == data
+    counts = {}
+    for rhs in grammar_dict.values():
+        for symbol in rhs:
+            if type(symbol) == int:
+                counts[symbol] = counts.get(symbol, 0) + 1
+    assert sorted(counts.keys()) == range(1, len(grammar_dict))
+    assert min(counts.values()) > 1
+
+
+def test_codec():
+    codec.test_codec(open("tests/data/10k").read(), 'repair')
+
+
+def test_mapper():
+    job = mrwot.MRWoT(args=['--engine', 'repair'])
+    (key, dump), = job.mapper('seg:0', 'abracadabraabracadabra')
+    assert dump[0] == 'seg:0'
+    assert query.Index(dict(dump[1])).extract(0, 22) == \
+        'abracadabraabracadabra'
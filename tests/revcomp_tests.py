@@ -0,0 +1,137 @@
+import os, random, re, shutil, tempfile
+
+from wot import automaton, balance, codec, edit, motifs, query, repair, \
+    revcomp, server, similarity
+
+
+TMP_DIR = None
+DATA = None
+WOT_PATH = None
+
+
+def setup():
+    global TMP_DIR, DATA, WOT_PATH
+    TMP_DIR = tempfile.mkdtemp()
+    DATA = make_dna(3)
+    WOT_PATH = os.path.join(TMP_DIR, "dna.wot")
+    with open(WOT_PATH, "wb") as out_file:
+        out_file.write(codec.test_encode(DATA, 'revcomp', 'range'))
+
+
+def teardown():
+    shutil.rmtree(TMP_DIR)
+
+
+def load_dict():
+    with open(WOT_PATH, "rb") as in_file:
+        return codec.decode_grammar_dict(in_file)
+
+
+def make_dna(seed, count=40):
+    """Random repeats, each on either strand, between unique stretches."""
+    rng = random.Random(seed)
+    # __________________________________________________
+    def _random(length):
+        return ''.join(rng.choice('ACGT') for _ in xrange(length))
+    # __________________________________________________
+    repeats = [_random(rng.randrange(50, 200)) for _ in xrange(8)]
+    parts = []
+    for _ in xrange(count):
+        repeat = rng.choice(repeats)
+        parts.append(repeat if rng.random() < 0.5
+                     else revcomp.reverse_complement(repeat))
+        parts.append(_random(10))
+    return ''.join(parts)
+
+
+def expand(grammar_dict):
+    decoder = codec.make_decoder(grammar_dict, codec.make_memo(grammar_dict))
+    return ''.join(decoder(list(grammar_dict[0])))
+
+
+def test_reverse_complement():
+    assert revcomp.reverse_complement('AACGTn\n') == '\nnACGTT'
+    forward = ''.join(random.Random(1).choice('ACGT') for _ in xrange(300))
+    data = forward + 'N' + revcomp.reverse_complement(forward)
+    grammar = revcomp.Grammar()
+    grammar.build(data)
+    grammar_dict = dict((rule_no, list(rhs))
+                        for rule_no, rhs in grammar.rules_to_dict().items())
+    assert expand(grammar_dict) == data
+    # Both strands are the same rule.
+    assert len(grammar_dict[0]) <= 5
+
+
+def test_codec():
+    data = make_dna(2)
+    plain = repair.Grammar()
+    plain.build(data)
+    grammar = revcomp.Grammar()
+    grammar.build(data)
+    assert (sum(len(rhs) for rhs in grammar.rules_to_dict().values()) <
+            sum(len(rhs) for rhs in plain.rules_to_dict().values()))
+    for backend in codec.BACKENDS:
+        encoded = codec.test_encode(data, 'revcomp', backend)
+        assert ord(encoded[3]) & codec.FLAG_REVCOMP
+        assert codec.test_decode(encoded) == data
+    runs_data = data[:500] + 'A' * 40 + revcomp.reverse_complement(
+        data[:500]) + 'T' * 40
+    for in_str, options in ((runs_data, {'min_run': 16}),
+                            (data, {'max_bytes': 200000})):
+        encoded = codec.test_encode(in_str, 'revcomp', 'range', **options)
+        assert codec.test_decode(encoded) == in_str
+
+
+def test_forward_rules():
+    grammar = revcomp.Grammar()
+    grammar.build(DATA)
+    grammar_dict = grammar.rules_to_dict()
+    assert any(type(symbol) == int and symbol < 0
+               for rhs in grammar_dict.values() for symbol in rhs)
+    forward = revcomp.forward_rules(grammar_dict)
+    assert all(type(symbol) != int or symbol > 0
+               for rhs in forward.values() for symbol in rhs)
+    assert expand(forward) == DATA
+    assert load_dict().keys() == forward.keys()
+
+
+def test_query():
+    index = query.Index(load_dict())
+    assert index.extract(0, index.length()) == DATA
+    assert index.count('ACG') == DATA.count('ACG')
+
+
+def test_server():
+    index = server.load_index(WOT_PATH)
+    assert index.extract(100, 50) == DATA[100:150]
+
+
+def test_motifs():
+    report = motifs.Motifs(load_dict())
+    for rule_no, length, count, _ in report.rank(min_length=20)[:5]:
+        assert DATA.count(report.motif(rule_no)) >= count
+
+
+def test_automaton():
+    ends = [pos + 4 for pos in xrange(len(DATA) - 3)
+            if re.match('AC[GT]A', DATA[pos:pos + 4])]
+    assert list(automaton.ends(load_dict(), 'AC[GT]A')) == ends
+    assert automaton.count(load_dict(), 'AC[GT]A') == len(ends)
+
+
+def test_similarity():
+    profile = similarity.load_profile(WOT_PATH)
+    assert profile.length() == len(DATA)
+    assert similarity.compare(profile, profile)[0] == 1.
+
+
+def test_edit():
+    grammar = edit.EditableGrammar.load(WOT_PATH)
+    grammar.replace(10, 20, 'NNNN')
+    assert grammar.extract(0, grammar.length()) == (DATA[:10] + 'NNNN' +
+                                                     DATA[20:])
+
+
+def test_balance():
+    balanced = balance.balance(load_dict())
+    assert expand(balanced) == DATA
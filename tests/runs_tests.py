@@ -0,0 +1,65 @@
+import io, os
+
+from tests import temp_dir
+from wot import codec, core, frozen, mapped, runs
+
+
+DATA = ("ACGT" + "N" * 1000 + "ACGTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTA"
+        + "N" * 5000 + "ACGT" + "N" * 1000)
+
+
+def test_run_encoder():
+    encoder = runs.RunEncoder(8)
+    terminals = []
+    for start in range(0, len(DATA), 37):
+        terminals.extend(encoder.feed(DATA[start:start + 37]))
+    terminals.extend(encoder.flush())
+    assert terminals == runs.encode_runs(DATA, 8)
+    assert "".join(terminals) == DATA
+    assert [terminal for terminal in terminals if len(terminal) > 1] == [
+        "N" * 1000, "T" * 42, "N" * 5000, "N" * 1000]
+
+
+def test_codec():
+    data = DATA + open("tests/data/FILE1").read()
+    for engine in ("sequitur", "repair"):
+        for backend in ("huffman", "range"):
+            encoded = codec.test_encode(data, engine, backend, min_run=16)
+            assert ord(encoded[3]) & codec.FLAG_RUNS
+            assert codec.test_decode(encoded) == data
+    grammar = core.Grammar()
+    grammar.build(runs.encode_runs(data))
+    frozen_grammar = grammar.freeze()
+    assert frozen_grammar.length() == len(data)
+    thawed = frozen.FrozenGrammar.frombuffer(frozen_grammar.tobytes())
+    assert thawed.rules_to_dict() == grammar.rules_to_dict()
+
+
+def test_single_run():
+    # The whole input is one run terminal, so the histogram has a single
+    # symbol.
+    with temp_dir() as tmp_dir:
+        wot_path = os.path.join(tmp_dir, "data.wot")
+        for data in ('a' * 200, 'a' * 200 + 'b' * 300):
+            for engine in sorted(codec.ENGINES):
+                for backend in codec.BACKENDS:
+                    encoded = codec.test_encode(data, engine, backend,
+                                                min_run=8)
+                    assert codec.test_decode(encoded) == data
+            with open(wot_path, "wb") as out_file:
+                out_file.write(codec.test_encode(data, min_run=8))
+            out_stream = io.BytesIO()
+            mapped.decode(wot_path, out_stream)
+            assert out_stream.getvalue() == data
+
+
+def test_mapped():
+    with temp_dir() as tmp_dir:
+        wot_path = os.path.join(tmp_dir, "data.wot")
+        for backend in ("huffman", "range"):
+            with open(wot_path, "wb") as out_file:
+                out_file.write(codec.test_encode(DATA, backend=backend,
+                                                 min_run=16))
+            out_stream = io.BytesIO()
+            mapped.decode(wot_path, out_stream, cache_symbols=64)
+            assert out_stream.getvalue() == DATA
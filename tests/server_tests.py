@@ -0,0 +1,99 @@
+import os, threading, time
+
+from tests import temp_dir
+from wot import client, codec, mapped, server
+
+
+def test_server():
+    data = open("tests/data/genesis.txt").read()
+    with temp_dir() as tmp_dir:
+        wot_path = os.path.join(tmp_dir, "genesis.txt.wot")
+        with open(wot_path, "wb") as out_file:
+            out_file.write(codec.test_encode(data))
+        address = os.path.join(tmp_dir, "wot.sock")
+        query_server = server.make_server(address)
+        thread = threading.Thread(target=query_server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            with client.Client(address) as conn:
+                assert conn.length(wot_path) == len(data)
+                assert conn.extract(wot_path, 100, 50) == data[100:150]
+                assert conn.count(wot_path, "the") == data.count("the")
+                try:
+                    conn.count(wot_path, "")
+                except client.QueryError:
+                    pass
+                else:
+                    assert False, "Expected a QueryError"
+        finally:
+            query_server.shutdown()
+            query_server.server_close()
+        # Stale sockets are replaced, other files are left alone.
+        server.make_server(address).server_close()
+        try:
+            server.make_server(wot_path)
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected a ValueError"
+        assert os.path.exists(wot_path)
+
+
+def test_cache_eviction():
+    cache = server.IndexCache(1, loader=lambda path: server.query.Index(
+        {0: ['a', 'b']}))
+    cache.get("tests/data/1k")
+    cache.get("tests/data/10k")
+    assert cache.entries.keys() == [os.path.abspath("tests/data/10k")]
+
+
+def test_cache_concurrency():
+    started = threading.Event()
+    release = threading.Event()
+    loads = []
+    # __________________________________________________
+    def _loader(path):
+        loads.append(path)
+        if path.endswith("10k"):
+            started.set()
+            release.wait(10)
+        return server.query.Index({0: ['a', 'b']})
+    # __________________________________________________
+    cache = server.IndexCache(loader=_loader)
+    cached = cache.get("tests/data/1k")
+    threads = [threading.Thread(target=cache.get, args=("tests/data/10k",))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    started.wait(10)
+    # A cold load does not hold up hits on other indexes.
+    start = time.time()
+    assert cache.get("tests/data/1k") is cached
+    assert time.time() - start < 5
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert sorted(loads) == [os.path.abspath("tests/data/10k"),
+                             os.path.abspath("tests/data/1k")]
+
+
+def test_load_index():
+    data = open("tests/data/genesis.txt").read()
+    with temp_dir() as tmp_dir:
+        wot_path = os.path.join(tmp_dir, "genesis.txt.wot")
+        for kwargs, is_mapped in (({}, True), ({'backend': 'range'}, True),
+                                  ({'max_bytes': 1000}, False),
+                                  ({'engine': 'revcomp'}, False)):
+            with open(wot_path, "wb") as out_file:
+                out_file.write(codec.test_encode(data, **kwargs))
+            index = server.load_index(wot_path)
+            assert isinstance(index.grammar_dict,
+                              mapped.MappedGrammar) == is_mapped
+            assert index.length() == len(data)
+            assert index.extract(100, 50) == data[100:150]
+            assert index.count("the") == data.count("the")
+            if is_mapped:
+                # Mapped indexes are sized by their body cache.
+                assert index.memory_estimate() > (
+                    8 * index.grammar_dict.cache_symbols)
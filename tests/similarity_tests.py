@@ -0,0 +1,39 @@
+import os
+
+from tests import temp_dir
+from wot import codec, core, similarity
+
+
+def make_profile(data):
+    grammar = core.Grammar()
+    grammar.build(data)
+    return similarity.Profile(grammar.rules_to_dict())
+
+
+def test_compare():
+    data = open("tests/data/genesis.txt").read()
+    profile = make_profile(data)
+    assert similarity.compare(profile, profile) == (1., 1., 1.)
+    jaccard, coverage_a, coverage_b = similarity.compare(
+        profile, make_profile(data[:2000] + "xyzzy" * 20))
+    assert 0. < jaccard < 1.
+    assert 0. < coverage_a < 1. and 0. < coverage_b < 1.
+    assert similarity.compare(make_profile("abcabcabc"),
+                              make_profile("xyzxyzxyz"))[:2] == (0., 0.)
+
+
+def test_compare_all():
+    with temp_dir() as tmp_dir:
+        paths = []
+        for name in ("FILE1", "FILE2", "genesis.txt"):
+            paths.append(os.path.join(tmp_dir, name + ".wot"))
+            with open(paths[-1], "wb") as out_file:
+                out_file.write(codec.encode_str(
+                    open(os.path.join("tests/data", name)).read()))
+        results = list(similarity.compare_all(paths, workers=2))
+        assert [pair[:2] for pair in results] == [
+            (paths[0], paths[1]), (paths[0], paths[2]), (paths[1], paths[2])]
+        for path_a, path_b, result in results:
+            assert result == similarity.compare(
+                similarity.load_profile(path_a),
+                similarity.load_profile(path_b))
@@ -1 +1,6 @@
-__all__ = ['sequitur', 'mapreduce', 'dimer']
+__all__ = ['sequitur', 'mapreduce', 'dimer', 'parallel', 'ingest', 'query',
+           'server', 'client', 'repair', 'rangecoder', 'mapped', 'archive',
+           'similarity', 'frozen', 'core',
+           'automaton', 'motifs', 'runs', 'cache',
+           'reference', 'edit', 'records', 'balance', 'revcomp', 'kmers',
+           'nucleotide']
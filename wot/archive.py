@@ -0,0 +1,172 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Multi-file archives sharing one corpus grammar.
+
+Each member file gets its own grammar, and the member grammars are
+merged the same way the MRWoT reducer merges segments, so content that
+is shared between members is stored once.  The archive holds a
+directory mapping member names to their root rules, followed by an
+ordinary .wot stream whose root rule lists the member roots in order
+(so decoding the stream with wot.codec yields the concatenation of
+all members).  Members are extracted through wot.mapped, decoding only
+the rules reachable from the member root.
+
+Archive layout (integers are 32 bit little endian):
+
+    "WOTA", member count,
+    for each member: name length, name, root rule number,
+    .wot stream
+"""
+
+from wot import codec, core, mapped
+import getopt, struct, sys
+
+# ______________________________________________________________________
+
+MAGIC = "WOTA"
+USAGE = """Usage:
+    $ python -m wot.archive -c [-b backend] [-e engine] archive file1...
+    $ python -m wot.archive -l archive
+    $ python -m wot.archive -x archive member1...
+
+Flags:
+
+    -b    Entropy coding backend, 'huffman' (default) or 'range'.
+          Members of range coded archives cannot be extracted without
+          decoding the whole grammar.
+    -c    Create an archive from the given files.
+    -e    Grammar construction engine, 'sequitur' (default) or
+          'repair'.
+    -h    Print this help.
+    -l    List the members of an archive.
+    -x    Extract the given members to stdout.
+"""
+
+# ______________________________________________________________________
+
+def build_corpus(members, engine='sequitur'):
+    """Build a corpus grammar from (name, data) pairs.  Returns a rules
+    dictionary whose root rule refers to each member root in order,
+    and a list of (name, root rule number) pairs.
+    """
+    names = []
+    def _dumps():
+        for name, data in members:
+            if name in names:
+                raise ValueError("Duplicate archive member %r" % (name,))
+            names.append(name)
+            grammar = core.ENGINES[engine]()
+            grammar.build(data, name)
+            yield grammar.dump()
+    grammar, segments = core.merge(_dumps())
+    if grammar is None:
+        raise ValueError("No archive members")
+    rules_dict = grammar.rules_to_dict()
+    # Move the first member's root out of the way of the corpus root.
+    old_root = max(rules_dict.keys()) + 1
+    # __________________________________________________
+    def _renumber(symbol):
+        return old_root if symbol == 0 else symbol
+    # __________________________________________________
+    corpus_dict = dict((_renumber(rule_no),
+                        tuple(_renumber(symbol) if type(symbol) == int
+                              else symbol for symbol in rhs))
+                       for rule_no, rhs in rules_dict.items())
+    directory = [(name, _renumber(segments[name])) for name in names]
+    corpus_dict[0] = tuple(root for _, root in directory)
+    return corpus_dict, directory
+
+# ______________________________________________________________________
+
+def write_archive(ostream, corpus_dict, directory, backend='huffman'):
+    single_int = struct.Struct("<I")
+    ostream.write(MAGIC)
+    ostream.write(single_int.pack(len(directory)))
+    for name, root in directory:
+        ostream.write(single_int.pack(len(name)))
+        ostream.write(name)
+        ostream.write(single_int.pack(root))
+    codec.write_outputs(codec.encode_rules_dict(corpus_dict, backend),
+                        ostream)
+    ostream.flush()
+
+# ______________________________________________________________________
+
+def create(path, member_paths, engine='sequitur', backend='huffman'):
+    """Create an archive at path from a list of files."""
+    def _members():
+        for member_path in member_paths:
+            with open(member_path, 'rb') as in_file:
+                yield member_path, in_file.read()
+    corpus_dict, directory = build_corpus(_members(), engine)
+    with open(path, 'wb') as out_file:
+        write_archive(out_file, corpus_dict, directory, backend)
+
+# ______________________________________________________________________
+
+class Archive(object):
+    """Read access to an archive.  members maps member names to root
+    rule numbers in the shared grammar.
+    """
+    def __init__(self, path, cache_symbols=mapped.CACHE_SYMBOLS):
+        single_int = struct.Struct("<I")
+        self.members = {}
+        self.names = []
+        with open(path, 'rb') as in_file:
+            def _getint():
+                return single_int.unpack(in_file.read(4))[0]
+            if in_file.read(4) != MAGIC:
+                raise ValueError("Not a wot archive: %r" % (path,))
+            for _ in xrange(_getint()):
+                name = in_file.read(_getint())
+                self.members[name] = _getint()
+                self.names.append(name)
+            offset = in_file.tell()
+        self.grammar = mapped.MappedGrammar(path, cache_symbols, offset)
+
+    def close(self):
+        self.grammar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def extract(self, name, ostream):
+        """Write the contents of a member to ostream."""
+        self.grammar.expand(ostream, self.members[name])
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "b:ce:hlx")
+    backend = 'huffman'
+    engine = 'sequitur'
+    mode = None
+    for opt in opts:
+        key, val = opt
+        if key == '-b':
+            backend = val
+        elif key == '-e':
+            engine = val
+        elif key == '-h':
+            print(USAGE)
+        elif key in ('-c', '-l', '-x'):
+            mode = key
+    if mode == '-c':
+        create(args[0], args[1:], engine, backend)
+    elif mode == '-l':
+        with Archive(args[0]) as archive:
+            for name in archive.names:
+                print(name)
+    elif mode == '-x':
+        with Archive(args[0]) as archive:
+            for name in args[1:]:
+                archive.extract(name, sys.stdout)
+        sys.stdout.flush()
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
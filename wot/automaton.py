@@ -0,0 +1,429 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Compressed-domain regular expression matching.
+
+Patterns are compiled to a Thompson NFA and run as a lazily built DFA
+over bytes.  A Matcher walks a grammar dictionary (see wot.query) and
+memoizes, for every rule and DFA start state, the state reached at the
+end of the rule's expansion and the number of matches found inside it,
+so each repeated rule is scanned once per state no matter how often it
+occurs.  Matches are reported by their end offsets (one past the last
+byte), so overlapping matches are all counted, as with query.count().
+
+The pattern syntax is a small subset of Python's re module: literals,
+'.', character classes ('[ACGT]', '[^N]', '[a-z]'), grouping,
+alternation, the '*', '+' and '?' quantifiers and bounded repetition
+('{m}', '{m,}', '{m,n}').  Backslash escapes the next character.  In
+IUPAC mode, the nucleotide codes (A, C, G, T, R, Y, S, W, K, M, B, D,
+H, V and N) match their bases in either case.
+"""
+
+from wot import codec, query
+import getopt, sys
+
+# ______________________________________________________________________
+
+USAGE = """Usage:
+    $ python -m wot.automaton [-hip] pattern file1.wot...
+
+Counts the matches of a regular expression in each .wot file without
+decompressing it.
+
+Flags:
+
+    -h    Print this help.
+    -i    Interpret IUPAC nucleotide codes in the pattern.
+    -p    Also print the end offset of each match.
+"""
+ANY = frozenset(xrange(256))
+IUPAC = {
+    'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T',
+    'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT', 'M': 'AC',
+    'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG', 'N': 'ACGT',
+}
+
+# ______________________________________________________________________
+
+def _literal(char, iupac):
+    bases = IUPAC.get(char.upper()) if iupac else None
+    if bases is None:
+        return frozenset((ord(char),))
+    return frozenset(ord(base) for base in bases + bases.lower())
+
+# ______________________________________________________________________
+
+class Parser(object):
+    """Recursive descent parser turning a pattern into a tree of
+    ('set', bytes), ('cat', nodes), ('alt', nodes) and ('rep', node,
+    min, max) tuples, where max is None when unbounded.
+    """
+    def __init__(self, pattern, iupac=False):
+        self.pattern = pattern
+        self.pos = 0
+        self.iupac = iupac
+
+    def error(self, message):
+        return ValueError("%s at position %d of %r" % (message, self.pos,
+                                                      self.pattern))
+
+    def peek(self):
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else None
+
+    def take(self):
+        char = self.peek()
+        if char is None:
+            raise self.error("Unexpected end of pattern")
+        self.pos += 1
+        return char
+
+    def parse(self):
+        ret_val = self.parse_alternation()
+        if self.peek() is not None:
+            raise self.error("Unbalanced parenthesis")
+        return ret_val
+
+    def parse_alternation(self):
+        branches = [self.parse_concatenation()]
+        while self.peek() == '|':
+            self.pos += 1
+            branches.append(self.parse_concatenation())
+        return branches[0] if len(branches) == 1 else ('alt', branches)
+
+    def parse_concatenation(self):
+        items = []
+        while self.peek() not in (None, '|', ')'):
+            items.append(self.parse_repeat())
+        return items[0] if len(items) == 1 else ('cat', items)
+
+    def parse_repeat(self):
+        ret_val = self.parse_atom()
+        while True:
+            char = self.peek()
+            if char == '*':
+                bounds = 0, None
+            elif char == '+':
+                bounds = 1, None
+            elif char == '?':
+                bounds = 0, 1
+            elif char == '{':
+                bounds = self.parse_bounds()
+            else:
+                return ret_val
+            if char != '{':
+                self.pos += 1
+            ret_val = ('rep', ret_val) + bounds
+
+    def parse_bounds(self):
+        end = self.pattern.find('}', self.pos)
+        if end < 0:
+            raise self.error("Unterminated repetition")
+        fields = self.pattern[self.pos + 1:end].split(',')
+        try:
+            low = int(fields[0])
+            if len(fields) == 1:
+                high = low
+            elif len(fields) == 2:
+                high = int(fields[1]) if fields[1].strip() else None
+            else:
+                raise ValueError()
+        except ValueError:
+            raise self.error("Bad repetition")
+        if high is not None and high < low:
+            raise self.error("Bad repetition")
+        self.pos = end + 1
+        return low, high
+
+    def parse_atom(self):
+        char = self.take()
+        if char == '(':
+            ret_val = self.parse_alternation()
+            if self.take() != ')':
+                raise self.error("Unbalanced parenthesis")
+            return ret_val
+        elif char == '[':
+            return ('set', self.parse_class())
+        elif char == '.':
+            return ('set', ANY)
+        elif char == '\\':
+            return ('set', frozenset((ord(self.take()),)))
+        elif char in '*+?{)|':
+            raise self.error("Nothing to repeat" if char in '*+?{'
+                             else "Unexpected %r" % (char,))
+        return ('set', _literal(char, self.iupac))
+
+    def parse_class(self):
+        negate = self.peek() == '^'
+        if negate:
+            self.pos += 1
+        ret_val = set()
+        first = True
+        while first or self.peek() != ']':
+            first = False
+            char = self.take()
+            if char == '\\':
+                char = self.take()
+            elif (self.peek() == '-' and
+                  self.pattern[self.pos + 1:self.pos + 2] not in ('', ']')):
+                self.pos += 1
+                last = self.take()
+                if last == '\\':
+                    last = self.take()
+                ret_val.update(xrange(ord(char), ord(last) + 1))
+                continue
+            ret_val.update(_literal(char, self.iupac))
+        self.pos += 1
+        return ANY.difference(ret_val) if negate else frozenset(ret_val)
+
+# ______________________________________________________________________
+
+class Automaton(object):
+    """Lazily determinized automaton finding the ends of all matches of
+    a pattern.  States are small integers; step() follows a byte and
+    accepting[state] is true when a match ends at that state.
+    """
+    def __init__(self, pattern, iupac=False):
+        self.pattern = pattern
+        # Each NFA state has a list of (byte set or None, target)
+        # edges, where None marks an epsilon edge.
+        self.edges = []
+        start, self.final = self.build(Parser(pattern, iupac).parse())
+        # Loop on any byte before the pattern, so matches may start
+        # anywhere.
+        scan = self.add_state()
+        self.edges[scan].append((ANY, scan))
+        self.edges[scan].append((None, start))
+        self.sets = []
+        self.state_map = {}
+        self.table = []
+        self.accepting = []
+        self.start = self.dfa_state(self.closure([scan]))
+        if self.accepting[self.start]:
+            raise ValueError("Pattern %r matches the empty string" %
+                             (pattern,))
+
+    def add_state(self):
+        self.edges.append([])
+        return len(self.edges) - 1
+
+    def build(self, node):
+        """Add the Thompson construction for a parse tree node, and
+        return its start and final NFA states.
+        """
+        kind = node[0]
+        start = self.add_state()
+        if kind == 'set':
+            final = self.add_state()
+            self.edges[start].append((node[1], final))
+        elif kind == 'cat':
+            final = start
+            for child in node[1]:
+                child_start, child_final = self.build(child)
+                self.edges[final].append((None, child_start))
+                final = child_final
+        elif kind == 'alt':
+            final = self.add_state()
+            for child in node[1]:
+                child_start, child_final = self.build(child)
+                self.edges[start].append((None, child_start))
+                self.edges[child_final].append((None, final))
+        else:
+            _, child, low, high = node
+            final = start
+            for _ in xrange(low):
+                child_start, child_final = self.build(child)
+                self.edges[final].append((None, child_start))
+                final = child_final
+            if high is None:
+                child_start, child_final = self.build(child)
+                self.edges[final].append((None, child_start))
+                self.edges[child_final].append((None, final))
+            else:
+                exit_state = self.add_state()
+                for _ in xrange(high - low):
+                    self.edges[final].append((None, exit_state))
+                    child_start, child_final = self.build(child)
+                    self.edges[final].append((None, child_start))
+                    final = child_final
+                self.edges[final].append((None, exit_state))
+                final = exit_state
+        return start, final
+
+    def closure(self, states):
+        ret_val = set(states)
+        stack = list(states)
+        while stack:
+            for byte_set, target in self.edges[stack.pop()]:
+                if byte_set is None and target not in ret_val:
+                    ret_val.add(target)
+                    stack.append(target)
+        return frozenset(ret_val)
+
+    def dfa_state(self, nfa_states):
+        ret_val = self.state_map.get(nfa_states)
+        if ret_val is None:
+            ret_val = len(self.sets)
+            self.state_map[nfa_states] = ret_val
+            self.sets.append(nfa_states)
+            self.table.append([-1] * 256)
+            self.accepting.append(self.final in nfa_states)
+        return ret_val
+
+    def step(self, state, byte):
+        ret_val = self.table[state][byte]
+        if ret_val < 0:
+            ret_val = self.dfa_state(self.closure(
+                [target for nfa_state in self.sets[state]
+                 for byte_set, target in self.edges[nfa_state]
+                 if byte_set is not None and byte in byte_set]))
+            self.table[state][byte] = ret_val
+        return ret_val
+
+    def run(self, state, text):
+        """Feed text from state, returning the final state and the
+        number of matches ending inside text.
+        """
+        count = 0
+        for byte in bytearray(text):
+            state = self.step(state, byte)
+            if self.accepting[state]:
+                count += 1
+        return state, count
+
+    def ends(self, text, state=None, offset=0):
+        """Generate the end offsets of matches in an uncompressed
+        string.
+        """
+        if state is None:
+            state = self.start
+        for idx, byte in enumerate(bytearray(text), offset + 1):
+            state = self.step(state, byte)
+            if self.accepting[state]:
+                yield idx
+
+# ______________________________________________________________________
+
+class Matcher(object):
+    """Runs an Automaton over the expansion of a grammar dictionary
+    without expanding it.
+    """
+    def __init__(self, grammar_dict, automaton, root=0):
+        self.grammar_dict = grammar_dict
+        self.automaton = automaton
+        self.root = root
+        # Map from (symbol, start state) to (end state, match count).
+        self.memo = {}
+        self.lengths = None
+
+    def transition(self, symbol, state):
+        """Return the state reached and the number of matches found
+        while feeding the expansion of symbol from state.
+        """
+        key = symbol, state
+        ret_val = self.memo.get(key)
+        if ret_val is not None:
+            return ret_val
+        if type(symbol) != int:
+            ret_val = self.memo[key] = self.automaton.run(state, symbol)
+            return ret_val
+        # Frames hold a rule, its start state, the position in its body,
+        # and the state and match count so far.
+        stack = [[symbol, state, 0, state, 0]]
+        while stack:
+            frame = stack[-1]
+            rule_no, entry_state, pos, crnt_state, total = frame
+            body = self.grammar_dict[rule_no]
+            while pos < len(body):
+                child = body[pos]
+                child_key = child, crnt_state
+                result = self.memo.get(child_key)
+                if result is None:
+                    if type(child) == int:
+                        break
+                    result = self.memo[child_key] = self.automaton.run(
+                        crnt_state, child)
+                crnt_state, total = result[0], total + result[1]
+                pos += 1
+            if pos < len(body):
+                frame[2:] = pos, crnt_state, total
+                stack.append([child, crnt_state, 0, crnt_state, 0])
+            else:
+                self.memo[rule_no, entry_state] = crnt_state, total
+                stack.pop()
+        return self.memo[key]
+
+    def count(self):
+        """Return the number of matches in the expansion of the root."""
+        return self.transition(self.root, self.automaton.start)[1]
+
+    def ends(self):
+        """Generate the end offsets of all matches in order, descending
+        only into rules that contain a match.
+        """
+        if self.lengths is None:
+            self.lengths = query.rule_lengths(self.grammar_dict, self.root)
+        state = self.automaton.start
+        offset = 0
+        stack = [(self.root, 0)]
+        while stack:
+            rule_no, pos = stack.pop()
+            body = self.grammar_dict[rule_no]
+            while pos < len(body):
+                child = body[pos]
+                pos += 1
+                end_state, child_count = self.transition(child, state)
+                if type(child) == int:
+                    if child_count > 0:
+                        stack.append((rule_no, pos))
+                        stack.append((child, 0))
+                        break
+                    offset += self.lengths[child]
+                elif child_count > 0:
+                    for end in self.automaton.ends(child, state, offset):
+                        yield end
+                    offset += len(child)
+                else:
+                    offset += len(child)
+                state = end_state
+
+# ______________________________________________________________________
+
+def count(grammar_dict, pattern, root=0, iupac=False):
+    """Count the matches of pattern in the expansion of root."""
+    return Matcher(grammar_dict, Automaton(pattern, iupac), root).count()
+
+# ______________________________________________________________________
+
+def ends(grammar_dict, pattern, root=0, iupac=False):
+    """Generate the end offsets of the matches of pattern in the
+    expansion of root.
+    """
+    return Matcher(grammar_dict, Automaton(pattern, iupac), root).ends()
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "hip")
+    iupac = False
+    positions = False
+    for opt in opts:
+        key, val = opt
+        if key == '-h':
+            print(USAGE)
+            return
+        elif key == '-i':
+            iupac = True
+        elif key == '-p':
+            positions = True
+    automaton = Automaton(args[0], iupac)
+    for path in args[1:]:
+        with open(path, 'rb') as in_file:
+            matcher = Matcher(codec.decode_grammar_dict(in_file), automaton)
+        sys.stdout.write('%s\t%d\n' % (path, matcher.count()))
+        if positions:
+            for end in matcher.ends():
+                sys.stdout.write('%d\n' % (end,))
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,253 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Height balancing of grammar dictionaries.
+
+Sequitur and RePair grammars can be as deep as their input is long:
+repetitive input builds chains of nested rules, and periodic input
+doubling chains.  Expanding a rule, or extracting from it top down
+(see wot.query), visits every level.  balance() rebuilds every rule
+whose height exceeds factor * log2 of its expansion length as an AVL
+grammar (Rytter 2003): binary rules whose children differ in height by
+at most one, concatenated with AVL joins.  Rebuilt rules have height at
+most about 1.44 log2 of their length, and cost O(log n) new rules each.
+Lower factors rebuild more rules and give shallower, larger grammars.
+The root body is left flat (see records.block_root() to split it).
+"""
+
+from wot import codec, query
+import getopt, math, sys
+
+# ______________________________________________________________________
+
+FACTOR = 2.0
+MAX_BODY = 8
+USAGE = """Usage:
+    $ python -m wot.balance [-h] [-b backend] [-f factor] [-m max_body]
+        [-o output] file.wot
+
+Rebalances the grammar of file.wot so that no rule is deeper than
+factor * log2 of its expansion length, writes it back to file.wot (or to
+output), and prints grammar heights and sizes before and after.
+
+Flags:
+
+    -b    Entropy coding backend, 'huffman' (default) or 'range'.
+    -f    Height factor (default %s); 0 rebuilds every rule.
+    -h    Print this help.
+    -m    Longest body (default %d) of the rules that single-use new
+          rules are inlined into.
+    -o    Output file.
+""" % (FACTOR, MAX_BODY)
+
+# ______________________________________________________________________
+
+def rule_heights(grammar_dict, root=0):
+    """Return a map from rule numbers to heights (terminals have height
+    0).
+    """
+    ret_val = {}
+    for rule_no in query.topological_order(grammar_dict, root):
+        ret_val[rule_no] = 1 + max([ret_val[symbol] for symbol
+                                    in grammar_dict[rule_no]
+                                    if type(symbol) == int] or [0])
+    return ret_val
+
+# ______________________________________________________________________
+
+class Balancer(object):
+    def __init__(self, grammar_dict, factor=FACTOR, max_body=MAX_BODY,
+                 root=0):
+        self.grammar_dict = grammar_dict
+        self.factor = factor
+        self.max_body = max_body
+        self.lengths = query.rule_lengths(grammar_dict, root)
+        self.heights = {}
+        self.rules = {}
+        self.pairs = {}
+        self.kept = set()
+        self.avl_forms = {}
+        self.first_new = self.next_rule = max(grammar_dict.keys()) + 1
+        self.symbols = {}
+        for rule_no in query.topological_order(grammar_dict, root):
+            body = [self.symbols.get(symbol, symbol)
+                    for symbol in grammar_dict[rule_no]]
+            if rule_no == root:
+                self.rules[root] = body
+            elif self.height_of(body) <= self.bound(rule_no):
+                self.rules[rule_no] = body
+                self.heights[rule_no] = self.height_of(body)
+                self.kept.add(rule_no)
+                self.symbols[rule_no] = rule_no
+            else:
+                self.symbols[rule_no] = self.concat(body)
+
+    def bound(self, rule_no):
+        return self.factor * math.log(max(self.lengths[rule_no], 2), 2)
+
+    def height(self, symbol):
+        return self.heights[symbol] if type(symbol) == int else 0
+
+    def height_of(self, body):
+        return 1 + max(self.height(symbol) for symbol in body)
+
+    def node(self, left, right):
+        """Return the binary rule expanding to left then right."""
+        ret_val = self.pairs.get((left, right))
+        if ret_val is None:
+            ret_val = self.next_rule
+            self.next_rule += 1
+            self.rules[ret_val] = [left, right]
+            self.heights[ret_val] = 1 + max(self.height(left),
+                                            self.height(right))
+            self.pairs[left, right] = ret_val
+        return ret_val
+
+    def avl_form(self, symbol):
+        """Return an AVL rule (or terminal) expanding to symbol."""
+        if symbol not in self.kept:
+            return symbol
+        ret_val = self.avl_forms.get(symbol)
+        if ret_val is None:
+            ret_val = self.concat(self.rules[symbol])
+            self.avl_forms[symbol] = ret_val
+        return ret_val
+
+    def join(self, left, right):
+        """Return an AVL rule expanding to AVL symbols left then right.
+        Takes time proportional to their height difference.
+        """
+        left_height = self.height(left)
+        right_height = self.height(right)
+        if abs(left_height - right_height) <= 1:
+            return self.node(left, right)
+        if left_height > right_height:
+            outer, inner = self.rules[left]
+            middle = self.join(inner, right)
+            if self.height(middle) <= self.height(outer) + 1:
+                return self.node(outer, middle)
+            middle_left, middle_right = self.rules[middle]
+            if self.height(middle_left) > self.height(middle_right):
+                left_left, left_right = self.rules[middle_left]
+                return self.node(self.node(outer, left_left),
+                                 self.node(left_right, middle_right))
+            return self.node(self.node(outer, middle_left), middle_right)
+        inner, outer = self.rules[right]
+        middle = self.join(left, inner)
+        if self.height(middle) <= self.height(outer) + 1:
+            return self.node(middle, outer)
+        middle_left, middle_right = self.rules[middle]
+        if self.height(middle_right) > self.height(middle_left):
+            right_left, right_right = self.rules[middle_right]
+            return self.node(self.node(middle_left, right_left),
+                             self.node(right_right, outer))
+        return self.node(middle_left, self.node(middle_right, outer))
+
+    def concat(self, symbols):
+        """Return an AVL symbol expanding to symbols, joining neighbours
+        pairwise.
+        """
+        level = [self.avl_form(symbol) for symbol in symbols]
+        while len(level) > 1:
+            level = [self.join(level[idx], level[idx + 1])
+                     if idx + 1 < len(level) else level[idx]
+                     for idx in xrange(0, len(level), 2)]
+        return level[0]
+
+    def flat(self, rule_no):
+        """Return the body of a rule, with the new rules used only once
+        inlined as long as it stays within max_body symbols.
+        """
+        ret_val = self.flat_bodies.get(rule_no)
+        if ret_val is None:
+            ret_val = []
+            body = self.rules[rule_no]
+            for idx, symbol in enumerate(body):
+                if (type(symbol) == int and symbol >= self.first_new and
+                    self.uses[symbol] == 1):
+                    child = self.flat(symbol)
+                    if (len(ret_val) + len(child) + len(body) - idx - 1 <=
+                        self.max_body):
+                        ret_val.extend(child)
+                        continue
+                ret_val.append(symbol)
+            self.flat_bodies[rule_no] = ret_val
+        return ret_val
+
+    def rules_to_dict(self, root=0):
+        """Return the rules reachable from the root, renumbered from 1."""
+        self.uses = {}
+        pending = [root]
+        while pending:
+            for symbol in self.rules[pending.pop()]:
+                if type(symbol) == int:
+                    if symbol not in self.uses:
+                        self.uses[symbol] = 0
+                        pending.append(symbol)
+                    self.uses[symbol] += 1
+        self.flat_bodies = {}
+        numbers = {}
+        pending = [symbol for symbol in self.rules[root]
+                   if type(symbol) == int]
+        while pending:
+            rule_no = pending.pop()
+            if rule_no not in numbers:
+                numbers[rule_no] = None
+                pending.extend(symbol for symbol in self.flat(rule_no)
+                               if type(symbol) == int)
+        for new_no, rule_no in enumerate(sorted(numbers), 1):
+            numbers[rule_no] = new_no
+        # __________________________________________________
+        def _renumber(body):
+            return [numbers.get(symbol, symbol) for symbol in body]
+        # __________________________________________________
+        ret_val = dict((numbers[rule_no], _renumber(self.flat(rule_no)))
+                       for rule_no in numbers)
+        ret_val[0] = _renumber(self.rules[root])
+        return ret_val
+
+# ______________________________________________________________________
+
+def balance(grammar_dict, factor=FACTOR, max_body=MAX_BODY, root=0):
+    """Return a grammar dictionary with the same expansion as
+    grammar_dict, where no rule of expansion length n is deeper than
+    about max(factor, 1.44) * log2(n).  The new root is rule 0.
+    """
+    return Balancer(grammar_dict, factor, max_body, root).rules_to_dict(root)
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "b:f:hm:o:")
+    backend = 'huffman'
+    factor = FACTOR
+    max_body = MAX_BODY
+    output = None
+    for opt in opts:
+        key, val = opt
+        if key == '-b':
+            backend = val
+        elif key == '-f':
+            factor = float(val)
+        elif key == '-h':
+            print(USAGE)
+            return
+        elif key == '-m':
+            max_body = int(val)
+        elif key == '-o':
+            output = val
+    path = args[0]
+    with open(path, 'rb') as in_file:
+        grammar_dict = codec.decode_grammar_dict(in_file)
+    balanced = balance(grammar_dict, factor, max_body)
+    for label, rules in (('before', grammar_dict), ('after', balanced)):
+        print('%s: height %d, %d rules, %d symbols' % (
+            label, rule_heights(rules)[0], len(rules),
+            sum(len(rhs) for rhs in rules.values())))
+    with open(output or path, 'wb') as out_file:
+        codec.write_outputs(codec.encode_rules_dict(balanced, backend),
+                            out_file)
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,166 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Content-addressed cache of segment grammars.
+
+Segment grammars depend only on the segment bytes and on how they were
+built (engine and minimum run length), so a rerun over mostly unchanged
+input can reuse the grammars of unchanged segments.  A SegmentCache is a
+local directory of frozen grammars (see wot.frozen) named by the SHA-1
+digest of the build settings and segment bytes.  Entries are written to
+a temporary file and renamed into place, so concurrent mappers and pool
+workers may share a directory.  Once the directory grows past max_bytes,
+least recently used entries (oldest modification time, which get()
+refreshes) are removed.  Each SegmentCache keeps a running total of the
+directory size, so the directory is only listed on the first insert and
+when the total goes over max_bytes.
+
+Frozen grammars hold byte terminals, so unicode segments are encoded as
+latin-1 (as wot.ingest decodes them); segments with characters beyond
+latin-1 raise UnicodeEncodeError and are left to uncached builds.
+"""
+
+from wot import core, frozen, runs
+import hashlib, os, tempfile
+
+# ______________________________________________________________________
+
+MAX_BYTES = 1 << 30
+SUFFIX = '.wotf'
+
+# ______________________________________________________________________
+
+def encode_segment(data):
+    """Return segment data as a byte string."""
+    if isinstance(data, unicode):
+        data = data.encode('latin-1')
+    return data
+
+def segment_key(data, engine='sequitur', min_run=None):
+    """Return the cache key of segment data built with the given
+    engine and minimum run length.
+    """
+    data = encode_segment(data)
+    hasher = hashlib.sha1('%s:%s:' % (engine, min_run or 0))
+    hasher.update(data)
+    return hasher.hexdigest()
+
+# ______________________________________________________________________
+
+class SegmentCache(object):
+    def __init__(self, path, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Running total of the entry sizes, from the last directory scan.
+        self.total = None
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key + SUFFIX)
+
+    def get(self, key):
+        """Return the frozen grammar bytes stored under key, or None."""
+        entry_path = self.entry_path(key)
+        try:
+            with open(entry_path, 'rb') as in_file:
+                ret_val = in_file.read()
+            os.utime(entry_path, None)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return ret_val
+
+    def put(self, key, frozen_bytes):
+        if self.total is None:
+            self.total = self.size()
+        entry_path = self.entry_path(key)
+        try:
+            self.total -= os.path.getsize(entry_path)
+        except OSError:
+            pass
+        fd, tmp_path = tempfile.mkstemp(prefix='.', dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as out_file:
+                out_file.write(frozen_bytes)
+            os.rename(tmp_path, entry_path)
+        except:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.total += len(frozen_bytes)
+        if self.total > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """Return (modification time, size, path) for every entry,
+        oldest first.
+        """
+        ret_val = []
+        for name in os.listdir(self.path):
+            if not name.endswith(SUFFIX) or name.startswith('.'):
+                continue
+            entry_path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            ret_val.append((stat.st_mtime, stat.st_size, entry_path))
+        ret_val.sort()
+        return ret_val
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in
+        max_bytes.  Returns the number of entries removed.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        ret_val = 0
+        for _, size, entry_path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(entry_path)
+            except OSError:
+                pass
+            total -= size
+            ret_val += 1
+        self.total = total
+        return ret_val
+
+    def build_bytes(self, data, segment=None, engine='sequitur',
+                    min_run=None):
+        """Return the frozen grammar bytes of segment data, from the
+        cache if present, otherwise built and stored.  Raises
+        UnicodeEncodeError for unicode data beyond latin-1.
+        """
+        key = segment_key(data, engine, min_run)
+        ret_val = self.get(key)
+        if ret_val is None:
+            ret_val = build_segment(data, segment, engine, min_run).tobytes()
+            self.put(key, ret_val)
+        return ret_val
+
+    def build(self, data, segment=None, engine='sequitur', min_run=None):
+        return frozen.FrozenGrammar.frombuffer(
+            self.build_bytes(data, segment, engine, min_run), segment)
+
+# ______________________________________________________________________
+
+def build_segment(data, segment=None, engine='sequitur', min_run=None):
+    """Build and return the frozen grammar of segment data."""
+    data = encode_segment(data)
+    grammar = core.ENGINES[engine]()
+    if min_run:
+        data = runs.encode_runs(data, min_run)
+    grammar.build(data, segment)
+    return grammar.freeze()
@@ -0,0 +1,52 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Client library for the wot.server query server."""
+
+import json, socket
+
+# ______________________________________________________________________
+
+class QueryError(Exception):
+    pass
+
+# ______________________________________________________________________
+
+class Client(object):
+    """Connection to a query server.  A string address is a Unix socket
+    path, and a (host, port) tuple is a TCP address.
+    """
+    def __init__(self, address='wot.sock'):
+        if isinstance(address, basestring):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        self.rfile = self.sock.makefile('rb')
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, **kws):
+        self.sock.sendall(json.dumps(kws) + '\n')
+        response = json.loads(self.rfile.readline())
+        if 'error' in response:
+            raise QueryError(response['error'])
+        return response['result']
+
+    def extract(self, path, start, length):
+        return self.request(op='extract', path=path, start=start,
+                            length=length).encode('latin-1')
+
+    def length(self, path):
+        return self.request(op='length', path=path)
+
+    def count(self, path, pattern):
+        return self.request(op='count', path=path,
+                            pattern=pattern.decode('latin-1'))
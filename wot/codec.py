@@ -2,23 +2,90 @@
 # ______________________________________________________________________
 # requires bitarray: pip install bitarray
 
-from wot import mrwot
+from wot import core, frozen, rangecoder, revcomp, runs
+from wot import nucleotide as _nucleotide
 from collections import Counter
-import sys, struct, bitarray, getopt
-import io
+import sys, struct, bitarray, getopt, array
+import io, Queue, threading, time
 
 # ______________________________________________________________________
 
 SIXTY4K = 65536
+# Blocks queued between the threads of encode_pipelined().
+PIPELINE_BLOCKS = 16
+# Frozen grammars queued for the writer thread of encode_pipelined(), so
+# at most this many plus two (one being encoded, one being built) are
+# held at once.
+PIPELINE_GRAMMARS = 1
+# Format flags, stored in the last byte of the magic number.
+FLAG_RANGE = 0x01
+# Every rule length is stored, so the stream ends after the last rule
+# and further streams (members) may follow it.
+FLAG_FRAMED = 0x02
+# The header has a table of run terminals (see wot.runs).
+FLAG_RUNS = 0x04
+# Some rules are imported from a reference grammar (see wot.reference).
+# The header holds the reference fingerprint and the table of imports,
+# ranges of the reference expansion; import i is rule i of the stream,
+# with an empty body.
+FLAG_REFERENCE = 0x08
+FINGERPRINT_BYTES = 20
+# The header holds a record index (see wot.records): the record
+# delimiter, the expansion length and delimiter count of every rule, and
+# a table of record names.
+FLAG_RECORDS = 0x10
+# Some rules are referenced as their reverse complement, written as the
+# negated rule number (see wot.revcomp).  The header has a second
+# histogram of nonterminals, counting these references, after the run
+# table.
+FLAG_REVCOMP = 0x20
+# Bodies hold only nonterminals, and the terminal runs are leaf rules
+# packed into a header section (see wot.nucleotide).  There is no byte
+# histogram.
+FLAG_NUCLEOTIDE = 0x40
+BACKENDS = ('huffman', 'range')
+# Reverse-complement grammars cannot be frozen or merged, so only the
+# codec builds them.
+ENGINES = dict(core.ENGINES, revcomp=revcomp.Grammar)
 USAGE = """Usage:
-    $ python -m wot.codec -cdh file1 [file2...]
+    $ python -m wot.codec -cdhmn [-b backend] [-e engine] [-i records]
+        [-M max_bytes] [-p queue_blocks] [-r min_run] [-R reference]
+        [-s read_size] [-w workers] file1 [file2...]
 
 Flags:
 
+    -b    Entropy coding backend, 'huffman' (default) or 'range'.
     -c    Output result to stdout (default is new file with '.wot'
           extension added for compression, removed for decompression).
     -d    Decompress (default is compress).
+    -e    Grammar construction engine, 'sequitur' (default),
+          'repair', or 'revcomp' (RePair that also matches reverse
+          complements, for DNA; see wot.revcomp).
     -h    Print this help.
+    -i    Compress with a record index, 'fasta' (records start with
+          '>') or 'lines' (see wot.records).
+    -m    Decompress in bounded memory, paging rules in from the
+          memory-mapped input as needed (see wot.mapped).
+    -M    Compress with a grammar memory budget in bytes.  Whenever a
+          grammar reaches the budget it is written out as a separate
+          member and a new grammar is started.
+    -n    Compress DNA (only A, C, G, T and N) with the nucleotide
+          profile, storing terminals packed at two or three bits each
+          (see wot.nucleotide).  Other input is compressed as usual.
+    -p    Compress with a read-ahead thread and a writer thread,
+          queueing up to this many blocks for each, and report the time
+          spent reading, building, encoding and writing on stderr (see
+          encode_pipelined()).  With -M, members are written while the
+          next one is built.  Cannot be combined with -i or -R.
+    -r    Collapse runs of at least min_run identical bytes into run
+          terminals before building the grammar (see wot.runs).
+    -R    Compress against, or decompress with, a reference .wot file,
+          storing only rules not found in the reference (see
+          wot.reference).  Compression ignores -e, -M, -n and -r.
+    -s    Read size in bytes for -p (default 65536).
+    -w    Decompress with this many worker processes, each expanding
+          part of the output straight into the output file (see
+          wot.parallel.decode()).  Needs an output file, not -c.
 """
 
 # ______________________________________________________________________
@@ -26,12 +93,12 @@ Flags:
 def unigram(grammar):
     """Create a unigram histogram for both terminals and nonterminals
     in the input grammar."""
+    if isinstance(grammar, frozen.FrozenGrammar):
+        return grammar.histogram()
     ret_val = Counter()
     for rule in grammar.rules:
         if rule is not None:
-            for symbol in rule.iter_symbols():
-                symbol_val = symbol.dump()
-                ret_val[symbol_val] += 1
+            ret_val.update(rule.symbols())
     return ret_val
 
 # ______________________________________________________________________
@@ -88,6 +155,10 @@ def build_prefix_code_map(tree):
     """Given a prefix coding tree, create a prefix coding map from
     terminal tree nodes to the corresponding bit coding.
     """
+    if type(tree) is not tuple:
+        # build_tree2() returns the bare leaf of a single symbol
+        # histogram, which still needs a bit per occurrence.
+        return {tree: bitarray.bitarray('0')}
     ret_val = {}
     crnt = bitarray.bitarray()
     def _builder(node):
@@ -133,21 +204,102 @@ def preprocess_grammar(grammar):
 
 # ______________________________________________________________________
 
-def encoder_outputs(hist, grammar_dict):
-    keys = grammar_dict.keys()
-    keys.sort()
+def header_outputs(hist, keys, flags=0, sections=None):
+    """Generate the header shared by all entropy backends: the magic
+    number (whose last byte holds the format flags), the largest rule
+    number, the symbol histogram and the number of rules minus one.
+    Grammars with run terminals get FLAG_RUNS, and the run table (the
+    run count, then the byte, length and count of each run) follows
+    the histogram.  Grammars with reverse-complement references get
+    FLAG_REVCOMP, and the counts of reverse references to rules 1 to
+    the largest rule number follow.
+
+    sections maps flags to the contents of optional header sections,
+    which follow in flag order:
+
+    FLAG_REFERENCE: a fingerprint and a list of (offset, length) ranges
+    of the reference, written as the fingerprint, the import count and
+    the ranges.
+
+    FLAG_RECORDS: the delimiter byte, the lists of rule lengths and
+    delimiter counts (in rule number order) and a list of (name,
+    record number) pairs, written as the delimiter, a (length, count)
+    pair per rule, the name count, and the record number, length and
+    bytes of each name.
+
+    FLAG_NUCLEOTIDE: the alphabet, the first leaf rule number, the list
+    of leaf lengths and the packed leaf bodies, written as the alphabet
+    length and bytes, the first leaf, the leaf count and lengths, and
+    the packed length and bytes.  The byte histogram is left out.
+    """
+    sections = sections or {}
     max_symbol = max(keys)
-    yield "WOT\x00"
+    run_terminals = sorted(symbol for symbol in hist if runs.is_run(symbol))
+    if run_terminals:
+        flags |= FLAG_RUNS
+    if any(type(symbol) == int and symbol < 0 for symbol in hist):
+        flags |= FLAG_REVCOMP
+    for flag in sections:
+        flags |= flag
+    yield "WOT" + chr(flags)
     yield max_symbol
-    for byte_val in xrange(256):
-        yield hist[chr(byte_val)]
+    if not flags & FLAG_NUCLEOTIDE:
+        for byte_val in xrange(256):
+            yield hist[chr(byte_val)]
     for sym_nr in xrange(max_symbol + 1):
         yield hist[sym_nr]
+    if run_terminals:
+        yield len(run_terminals)
+        for run in run_terminals:
+            yield ord(run[0])
+            yield len(run)
+            yield hist[run]
+    if flags & FLAG_REVCOMP:
+        for sym_nr in xrange(1, max_symbol + 1):
+            yield hist[-sym_nr]
+    if FLAG_REFERENCE in sections:
+        fingerprint, ranges = sections[FLAG_REFERENCE]
+        assert len(fingerprint) == FINGERPRINT_BYTES
+        yield fingerprint
+        yield len(ranges)
+        for offset, length in ranges:
+            yield offset
+            yield length
+    if FLAG_RECORDS in sections:
+        delimiter, lengths, counts, names = sections[FLAG_RECORDS]
+        assert len(lengths) == len(counts) == len(keys)
+        yield ord(delimiter)
+        for length, count in zip(lengths, counts):
+            yield length
+            yield count
+        yield len(names)
+        for name, record_no in names:
+            yield record_no
+            yield len(name)
+            yield name
+    if FLAG_NUCLEOTIDE in sections:
+        alphabet, first_leaf, lengths, packed = sections[FLAG_NUCLEOTIDE]
+        yield len(alphabet)
+        yield alphabet
+        yield first_leaf
+        yield len(lengths)
+        for length in lengths:
+            yield length
+        yield len(packed)
+        yield packed
     # XXX Remove this?  Can compute this value from the number of
     # empty nonterminals.
     offset_count = len(keys) - 1
     yield offset_count
-    for symbol_nr in keys[:-1]:
+
+# ______________________________________________________________________
+
+def encoder_outputs(hist, grammar_dict, flags=0, sections=None):
+    keys = grammar_dict.keys()
+    keys.sort()
+    for out_elem in header_outputs(hist, keys, flags, sections):
+        yield out_elem
+    for symbol_nr in (keys if flags & FLAG_FRAMED else keys[:-1]):
         yield len(grammar_dict[symbol_nr][1])
     for symbol_nr in keys:
         yield grammar_dict[symbol_nr][0]
@@ -156,115 +308,639 @@ def encoder_outputs(hist, grammar_dict):
 
 # ______________________________________________________________________
 
-def encode_grammar(grammar):
+def range_encoder_outputs(hist, rules_dict, order=1, flags=0,
+                          sections=None):
+    """Like encoder_outputs(), but range codes the rule bodies with an
+    adaptive model of the given order (see wot.rangecoder).  Takes
+    uncoded rule bodies, as per Grammar.rules_to_dict().
+    """
+    keys = rules_dict.keys()
+    keys.sort()
+    for out_elem in header_outputs(hist, keys, flags | FLAG_RANGE,
+                                   sections):
+        yield out_elem
+    yield order
+    for symbol_nr in keys:
+        yield len(rules_dict[symbol_nr])
+    coded = rangecoder.encode_bodies(sorted(hist.keys()),
+                                     (rules_dict[symbol_nr]
+                                      for symbol_nr in keys), order)
+    yield len(coded)
+    yield coded
+    yield ''
+
+# ______________________________________________________________________
+
+def encode_grammar(grammar, backend='huffman', order=1, framed=False,
+                   nucleotide=False):
     """Returns generator that outputs a compressed representation of
-    the input grammar.
+    the input grammar.  Framed output can be followed by further
+    members.  See encode_rules_dict() for nucleotide.
     """
+    if isinstance(grammar, frozen.FrozenGrammar):
+        return encode_rules_dict(grammar, backend, order, framed,
+                                 nucleotide=nucleotide)
+    if nucleotide:
+        return encode_rules_dict(grammar.rules_to_dict(), backend, order,
+                                 framed, nucleotide=True)
+    flags = FLAG_FRAMED if framed else 0
+    if backend == 'range':
+        return range_encoder_outputs(unigram(grammar),
+                                     grammar.rules_to_dict(), order, flags)
+    elif backend != 'huffman':
+        raise ValueError("Unknown backend %r" % (backend,))
     hist, grammar_dict = preprocess_grammar(grammar)
-    return encoder_outputs(hist, grammar_dict)
+    return encoder_outputs(hist, grammar_dict, flags)
 
 # ______________________________________________________________________
 
-def process_decode_stream(istream):
-    """Return a generator that yields values similar to those
-    generated by encode_grammar(), but as part of the decoding process.
+def encode_rules_dict(rules_dict, backend='huffman', order=1, framed=False,
+                      sections=None, nucleotide=False):
+    """Like encode_grammar(), but for a dictionary mapping rule numbers
+    to symbol sequences (see Grammar.rules_to_dict()), or a
+    frozen.FrozenGrammar.  sections is passed on to header_outputs().
+    Given nucleotide, grammars of DNA without other sections are
+    written with FLAG_NUCLEOTIDE (see wot.nucleotide).
+    """
+    flags = FLAG_FRAMED if framed else 0
+    if isinstance(rules_dict, frozen.FrozenGrammar):
+        hist = rules_dict.histogram()
+    else:
+        hist = Counter()
+        for rhs_symbols in rules_dict.values():
+            hist.update(rhs_symbols)
+    alphabet = _nucleotide.detect_alphabet(hist) if nucleotide else None
+    if alphabet is not None and not sections:
+        rules_dict, section = _nucleotide.split_terminals(rules_dict,
+                                                          alphabet)
+        sections = {FLAG_NUCLEOTIDE: section}
+        hist = Counter()
+        for rhs_symbols in rules_dict.values():
+            hist.update(rhs_symbols)
+    if backend == 'range':
+        return range_encoder_outputs(hist, rules_dict, order, flags,
+                                     sections)
+    elif backend != 'huffman':
+        raise ValueError("Unknown backend %r" % (backend,))
+    code = build_prefix_code_map(build_tree2(hist))
+    grammar_dict = {}
+    rhs = bitarray.bitarray()
+    for symbol_nr, rhs_symbols in rules_dict.items():
+        del rhs[:]
+        rhs.encode(code, rhs_symbols)
+        grammar_dict[symbol_nr] = len(rhs_symbols), rhs.tobytes()
+    return encoder_outputs(hist, grammar_dict, flags, sections)
+
+# ______________________________________________________________________
+
+def write_outputs(outputs, ostream):
+    """Write encoder outputs to a stream, packing integers."""
+    single_int = struct.Struct("<I")
+    for out_elem in outputs:
+        if isinstance(out_elem, int):
+            out_elem = single_int.pack(out_elem)
+        ostream.write(out_elem)
+
+# ______________________________________________________________________
+
+def process_header(istream, magic=None):
+    """Return a generator that yields the values generated by
+    header_outputs().  The magic number may be passed in if it has
+    already been read from the stream.
     """
     def _getint():
         return single_int.unpack(istream.read(4))[0]
     single_int = struct.Struct("<I")
-    yield istream.read(4)
+    if magic is None:
+        magic = istream.read(4)
+    yield magic
     max_symbol = _getint()
     yield max_symbol
-    for _ in xrange(256):
-        yield _getint()
+    if not ord(magic[3]) & FLAG_NUCLEOTIDE:
+        for _ in xrange(256):
+            yield _getint()
     symbols = 1
-    for _ in xrange(max_symbol + 1):
+    used = set()
+    for sym_nr in xrange(max_symbol + 1):
         count = _getint()
         if count > 0:
             symbols += 1
+            used.add(sym_nr)
         yield count
+    if ord(magic[3]) & FLAG_RUNS:
+        run_count = _getint()
+        yield run_count
+        for _ in xrange(3 * run_count):
+            yield _getint()
+    if ord(magic[3]) & FLAG_REVCOMP:
+        for sym_nr in xrange(1, max_symbol + 1):
+            count = _getint()
+            # Rules only referenced in reverse have a body too.
+            if count > 0 and sym_nr not in used:
+                symbols += 1
+            yield count
+    if ord(magic[3]) & FLAG_REFERENCE:
+        yield istream.read(FINGERPRINT_BYTES)
+        import_count = _getint()
+        yield import_count
+        for _ in xrange(2 * import_count):
+            yield _getint()
+    if ord(magic[3]) & FLAG_RECORDS:
+        yield _getint()
+        for _ in xrange(2 * symbols):
+            yield _getint()
+        name_count = _getint()
+        yield name_count
+        for _ in xrange(name_count):
+            yield _getint()
+            name_len = _getint()
+            yield name_len
+            yield istream.read(name_len)
+    if ord(magic[3]) & FLAG_NUCLEOTIDE:
+        alphabet_len = _getint()
+        yield alphabet_len
+        yield istream.read(alphabet_len)
+        yield _getint()
+        leaf_count = _getint()
+        yield leaf_count
+        for _ in xrange(leaf_count):
+            yield _getint()
+        packed_len = _getint()
+        yield packed_len
+        yield istream.read(packed_len)
     offset_count = _getint()
     assert offset_count == symbols - 1
     yield offset_count
+
+# ______________________________________________________________________
+
+def process_decode_stream(istream, magic=None):
+    """Return a generator that yields values similar to those
+    generated by encode_grammar(), but as part of the decoding process.
+    """
+    def _getint():
+        return single_int.unpack(istream.read(4))[0]
+    single_int = struct.Struct("<I")
+    header = process_header(istream, magic)
+    magic = next(header)
+    yield magic
+    framed = ord(magic[3]) & FLAG_FRAMED
+    for offset_count in header:
+        yield offset_count
     offsets = []
-    for _ in xrange(offset_count):
+    for _ in xrange(offset_count + 1 if framed else offset_count):
         offset = _getint()
         offsets.append(offset)
         yield offset
     for coded_rule_len in offsets:
         yield _getint()
         yield istream.read(coded_rule_len)
+    if not framed:
+        yield _getint()
+        yield istream.read()
+    yield ''
+
+# ______________________________________________________________________
+
+def process_range_decode_stream(istream, magic=None):
+    """Counterpart of process_decode_stream() for range_encoder_outputs().
+    """
+    def _getint():
+        return single_int.unpack(istream.read(4))[0]
+    single_int = struct.Struct("<I")
+    for offset_count in process_header(istream, magic):
+        yield offset_count
     yield _getint()
-    yield istream.read()
+    for _ in xrange(offset_count + 1):
+        yield _getint()
+    coded_len = _getint()
+    yield coded_len
+    yield istream.read(coded_len)
     yield ''
 
 # ______________________________________________________________________
 
-def decode_grammar_dict(istream):
-    """Given a stream (file or file-like object), return a dictionary
-    of the grammar rules (mapping from nonterminals to mixed lists of
-    terminals and nonterminals).
+def decode_header(ingen):
+    """Consume the header values from a decoding generator, returning
+    the format flags, the symbol histogram, the list of rule numbers
+    and a map from flags to the contents of optional header sections,
+    as passed to header_outputs().
     """
     hist = Counter()
-    ingen = process_decode_stream(istream)
-    assert next(ingen) == "WOT\x00"
+    magic = next(ingen)
+    if magic[:3] != "WOT":
+        raise ValueError("Not a .wot stream")
+    flags = ord(magic[3])
     max_symbol = next(ingen)
-    for byte_val in xrange(256):
-        count = next(ingen)
-        if count > 0:
-            hist[chr(byte_val)] = count
+    if not flags & FLAG_NUCLEOTIDE:
+        for byte_val in xrange(256):
+            count = next(ingen)
+            if count > 0:
+                hist[chr(byte_val)] = count
     symbols = [0]
     for sym_nr in xrange(max_symbol + 1):
         count = next(ingen)
         if count > 0:
             hist[sym_nr] = count
             symbols.append(sym_nr)
+    if flags & FLAG_RUNS:
+        for _ in xrange(next(ingen)):
+            run = chr(next(ingen)) * next(ingen)
+            hist[run] = next(ingen)
+    if flags & FLAG_REVCOMP:
+        for sym_nr in xrange(1, max_symbol + 1):
+            count = next(ingen)
+            if count > 0:
+                hist[-sym_nr] = count
+                if sym_nr not in hist:
+                    symbols.append(sym_nr)
+        symbols.sort()
+    sections = {}
+    if flags & FLAG_REFERENCE:
+        fingerprint = next(ingen)
+        sections[FLAG_REFERENCE] = fingerprint, [
+            (next(ingen), next(ingen)) for _ in xrange(next(ingen))]
+    if flags & FLAG_RECORDS:
+        delimiter = chr(next(ingen))
+        lengths = array.array('L')
+        counts = array.array('L')
+        for _ in symbols:
+            lengths.append(next(ingen))
+            counts.append(next(ingen))
+        names = []
+        for _ in xrange(next(ingen)):
+            record_no = next(ingen)
+            next(ingen)
+            names.append((next(ingen), record_no))
+        sections[FLAG_RECORDS] = delimiter, lengths, counts, names
+    if flags & FLAG_NUCLEOTIDE:
+        next(ingen)
+        alphabet = next(ingen)
+        first_leaf = next(ingen)
+        lengths = [next(ingen) for _ in xrange(next(ingen))]
+        next(ingen)
+        sections[FLAG_NUCLEOTIDE] = (alphabet, first_leaf, lengths,
+                                     next(ingen))
     offset_count = next(ingen)
-    offset_symbols = symbols[:-1]
-    assert offset_count == len(offset_symbols), (
-        "%d != %d!" % (offset_count, len(offset_symbols)))
-    for _ in offset_symbols:
+    assert offset_count == len(symbols) - 1, (
+        "%d != %d!" % (offset_count, len(symbols) - 1))
+    return flags, hist, symbols, sections
+
+# ______________________________________________________________________
+
+def decode_range_grammar_dict(ingen, reference=None):
+    """Decode the rest of a process_range_decode_stream() generator."""
+    flags, hist, symbols, sections = decode_header(ingen)
+    order = next(ingen)
+    lengths = [next(ingen) for _ in symbols]
+    next(ingen)
+    coded = next(ingen)
+    assert next(ingen) == ''
+    bodies = rangecoder.decode_bodies(sorted(hist.keys()), lengths, coded,
+                                      order)
+    return resolve_sections(dict(zip(symbols, bodies)), sections, reference)
+
+# ______________________________________________________________________
+
+def decode_member_dict(istream, magic, reference=None):
+    """Decode the grammar dictionary of a single stream, whose magic
+    number has already been read.
+    """
+    if magic[:3] != "WOT":
+        raise ValueError("Not a .wot stream")
+    flags = ord(magic[3])
+    if flags & ~(FLAG_RANGE | FLAG_FRAMED | FLAG_RUNS | FLAG_REFERENCE |
+                 FLAG_RECORDS | FLAG_REVCOMP | FLAG_NUCLEOTIDE):
+        raise ValueError("Unsupported .wot flags %#x" % (flags,))
+    if flags & FLAG_RANGE:
+        return decode_range_grammar_dict(
+            process_range_decode_stream(istream, magic), reference)
+    ingen = process_decode_stream(istream, magic)
+    flags, hist, symbols, sections = decode_header(ingen)
+    for _ in (symbols if flags & FLAG_FRAMED else symbols[:-1]):
         next(ingen)
     tree = build_tree2(hist)
     code = build_prefix_code_map(tree)
     grammar_dict = {}
     ba = bitarray.bitarray()
-    for sym_nr in offset_symbols:
+    for sym_nr in symbols:
         sym_count = next(ingen)
         sym_str = next(ingen)
         ba.frombytes(sym_str)
         grammar_dict[sym_nr] = ba.decode(code)[:sym_count]
         del ba[:]
-    sym_count = next(ingen)
-    sym_str = next(ingen)
-    ba.frombytes(sym_str)
-    grammar_dict[symbols[-1]] = ba.decode(code)[:sym_count]
     assert next(ingen) == ''
+    return resolve_sections(grammar_dict, sections, reference)
+
+# ______________________________________________________________________
+
+def resolve_sections(grammar_dict, sections, reference):
+    """Fill in the rules of a decoded grammar dictionary that are
+    stored in header sections.
+    """
+    if FLAG_NUCLEOTIDE in sections:
+        _nucleotide.unpack_leaves(grammar_dict, sections[FLAG_NUCLEOTIDE])
+    return resolve_imports(grammar_dict, sections.get(FLAG_REFERENCE),
+                           reference)
+
+# ______________________________________________________________________
+
+def resolve_imports(grammar_dict, imports, reference):
+    """Fill in the imported rules of a decoded grammar dictionary with
+    the reference symbols covering their ranges (see
+    wot.reference.Reference.cover()), and add the reference rules they
+    use, renumbered past the stream's own rules.  reference is a
+    wot.reference.Reference, which must match the fingerprint stored in
+    the stream.
+    """
+    if imports is None:
+        return grammar_dict
+    fingerprint, ranges = imports
+    if reference is None:
+        raise ValueError("Stream needs a reference grammar")
+    if reference.fingerprint != fingerprint:
+        raise ValueError("Stream was not compressed against this reference")
+    base = max(grammar_dict.keys()) + 1
+    pending = []
+    for import_no, (offset, length) in enumerate(ranges, 1):
+        rhs = reference.cover(offset, offset + length)
+        grammar_dict[import_no] = [
+            symbol + base if type(symbol) == int else symbol
+            for symbol in rhs]
+        pending.extend(symbol for symbol in rhs if type(symbol) == int)
+    while pending:
+        rule_no = pending.pop()
+        if rule_no + base in grammar_dict:
+            continue
+        rhs = reference.grammar_dict[rule_no]
+        grammar_dict[rule_no + base] = [
+            symbol + base if type(symbol) == int else symbol
+            for symbol in rhs]
+        pending.extend(symbol for symbol in rhs if type(symbol) == int)
+    return grammar_dict
+
+# ______________________________________________________________________
+
+def decode_grammar_dict(istream, reference=None):
+    """Given a stream (file or file-like object), return a dictionary
+    of the grammar rules (mapping from nonterminals to mixed lists of
+    terminals and nonterminals).  Streams compressed against a
+    reference grammar need the same wot.reference.Reference.
+
+    Framed streams may hold several members.  Their rules are
+    renumbered into one dictionary whose root rule refers to each
+    member's root in order.  Reverse-complement references are
+    resolved into forward rules (see wot.revcomp.forward_rules()).
+    """
+    magic = istream.read(4)
+    grammar_dict = decode_member_dict(istream, magic, reference)
+    flags = ord(magic[3])
+    if not flags & FLAG_FRAMED:
+        return (revcomp.forward_rules(grammar_dict) if flags & FLAG_REVCOMP
+                else grammar_dict)
+    members = [grammar_dict]
+    magic = istream.read(4)
+    while magic:
+        flags |= ord(magic[3])
+        members.append(decode_member_dict(istream, magic, reference))
+        magic = istream.read(4)
+    if len(members) == 1:
+        return (revcomp.forward_rules(grammar_dict) if flags & FLAG_REVCOMP
+                else grammar_dict)
+    grammar_dict = {0: []}
+    base = 1
+    for member in members:
+        for rule_no, rhs in member.items():
+            # Reverse-complement references are negative.
+            grammar_dict[rule_no + base] = [
+                symbol if type(symbol) != int
+                else symbol + base if symbol > 0 else symbol - base
+                for symbol in rhs]
+        grammar_dict[0].append(base)
+        base += max(member.keys()) + 1
+    if flags & FLAG_REVCOMP:
+        return revcomp.forward_rules(grammar_dict)
     return grammar_dict
 
 # ______________________________________________________________________
 
-def encode(istream, ostream):
-    grammar = mrwot.Grammar()
-    input_buf = istream.read(SIXTY4K)
+def read_terminals(istream, min_run=None, read_size=SIXTY4K):
+    """Generate chunks of grammar input from a stream, collapsing runs
+    of at least min_run identical bytes if min_run is given.
+    """
+    run_encoder = runs.RunEncoder(min_run) if min_run else None
+    input_buf = istream.read(read_size)
     while len(input_buf) > 0:
-        grammar.build(input_buf)
-        input_buf = istream.read(SIXTY4K)
-    single_int = struct.Struct("<I")
-    for out_elem in encode_grammar(grammar):
-        if isinstance(out_elem, int):
-            out_elem = single_int.pack(out_elem)
-        ostream.write(out_elem)
+        yield input_buf if run_encoder is None else run_encoder.feed(
+            input_buf)
+        input_buf = istream.read(read_size)
+    if run_encoder is not None:
+        yield run_encoder.flush()
+
+# ______________________________________________________________________
+
+def encode(istream, ostream, engine='sequitur', backend='huffman',
+           max_bytes=None, min_run=None, reference=None, records=None,
+           nucleotide=False):
+    """Compress istream to ostream.  Given a memory budget in bytes,
+    write framed members, starting a new grammar whenever the current
+    one reaches the budget.  Given min_run, collapse runs (see
+    wot.runs).  Given a wot.reference.Reference, only write the rules
+    not found in the reference instead.  Given records, 'fasta' or
+    'lines', write a record index (see wot.records).  Given
+    nucleotide, write DNA with the nucleotide profile (see
+    encode_rules_dict()).
+    """
+    if reference is not None:
+        rules_dict, ranges = reference.compress(istream.read())
+        write_outputs(encode_rules_dict(
+            rules_dict, backend,
+            sections={FLAG_REFERENCE: (reference.fingerprint, ranges)}),
+                      ostream)
+        ostream.flush()
+        return
+    framed = max_bytes is not None
+    if records is not None and framed:
+        raise ValueError("Record indexes need a single grammar")
+    if records is not None and engine == 'revcomp':
+        raise ValueError("Record indexes need forward rules only")
+    grammar = ENGINES[engine]()
+    for input_buf in read_terminals(istream, min_run):
+        while len(input_buf) > 0:
+            consumed = grammar.build(input_buf, max_bytes=max_bytes)
+            if consumed == len(input_buf):
+                break
+            write_outputs(encode_grammar(grammar.freeze(), backend,
+                                         framed=True,
+                                         nucleotide=nucleotide), ostream)
+            grammar = ENGINES[engine]()
+            input_buf = input_buf[consumed:]
+    grammar = grammar.freeze()
+    if records is not None:
+        from wot.records import DELIMITERS, index_grammar
+        rules_dict, section = index_grammar(grammar, DELIMITERS[records])
+        write_outputs(encode_rules_dict(rules_dict, backend,
+                                        sections={FLAG_RECORDS: section}),
+                      ostream)
+    else:
+        write_outputs(encode_grammar(grammar, backend, framed=framed,
+                                     nucleotide=nucleotide), ostream)
+    ostream.flush()
+
+# ______________________________________________________________________
+
+class PipelineStats(object):
+    """Seconds spent in each stage of encode_pipelined().  The builder
+    stalls waiting for input (read_stall) or for the writer to catch up
+    (write_stall); the reader and writer threads time their reads,
+    encoding and writes.
+    """
+    def __init__(self):
+        self.read = 0.
+        self.read_stall = 0.
+        self.build = 0.
+        self.write_stall = 0.
+        self.encode = 0.
+        self.write = 0.
+
+    def __str__(self):
+        return ("read %.2fs, build %.2fs (stalled %.2fs on input, %.2fs "
+                "on output), encode %.2fs, write %.2fs" % (
+                    self.read, self.build, self.read_stall,
+                    self.write_stall, self.encode, self.write))
+
+# ______________________________________________________________________
+
+def encode_pipelined(istream, ostream, engine='sequitur', backend='huffman',
+                     max_bytes=None, min_run=None, read_size=SIXTY4K,
+                     queue_blocks=PIPELINE_BLOCKS, nucleotide=False):
+    """Like encode(), but a reader thread reads ahead up to queue_blocks
+    blocks of read_size bytes while the grammar is built, and a writer
+    thread encodes and writes finished grammars (each framed member,
+    given max_bytes) while the next one is built.  queue_blocks only
+    bounds the read-ahead; up to PIPELINE_GRAMMARS finished grammars
+    wait for the writer.  Returns a PipelineStats.
+    """
+    stats = PipelineStats()
+    inputs = Queue.Queue(queue_blocks)
+    outputs = Queue.Queue(PIPELINE_GRAMMARS)
+    errors = []
+    stopping = []
+    framed = max_bytes is not None
+    # __________________________________________________
+    def _reader():
+        try:
+            terminals = read_terminals(istream, min_run, read_size)
+            while not stopping:
+                start = time.time()
+                input_buf = next(terminals, None)
+                stats.read += time.time() - start
+                if input_buf is None:
+                    break
+                inputs.put(input_buf)
+        except Exception:
+            errors.append(sys.exc_info())
+        finally:
+            inputs.put(None)
+    # __________________________________________________
+    def _writer():
+        single_int = struct.Struct("<I")
+        while True:
+            grammar = outputs.get()
+            if grammar is None:
+                return
+            elif errors:
+                # Keep draining the queue so the builder never blocks.
+                continue
+            try:
+                out_elems = encode_grammar(grammar, backend, framed=framed,
+                                           nucleotide=nucleotide)
+                out_buf = []
+                out_len = 0
+                while True:
+                    start = time.time()
+                    out_elem = next(out_elems, None)
+                    stats.encode += time.time() - start
+                    if out_elem is not None:
+                        if isinstance(out_elem, int):
+                            out_elem = single_int.pack(out_elem)
+                        out_buf.append(out_elem)
+                        out_len += len(out_elem)
+                        if out_len < read_size:
+                            continue
+                    # Write whole blocks rather than each integer.
+                    start = time.time()
+                    ostream.write(''.join(out_buf))
+                    stats.write += time.time() - start
+                    out_buf = []
+                    out_len = 0
+                    if out_elem is None:
+                        break
+            except Exception:
+                errors.append(sys.exc_info())
+    # __________________________________________________
+    def _put(grammar):
+        """Queue a frozen grammar for the writer, returning the seconds
+        spent waiting for room.
+        """
+        start = time.time()
+        outputs.put(grammar)
+        stall = time.time() - start
+        stats.write_stall += stall
+        return stall
+    # __________________________________________________
+    threads = [threading.Thread(target=_reader),
+               threading.Thread(target=_writer)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    input_buf = ''
+    try:
+        grammar = ENGINES[engine]()
+        while True:
+            start = time.time()
+            input_buf = inputs.get()
+            stats.read_stall += time.time() - start
+            if input_buf is None:
+                break
+            start = time.time()
+            stall = 0.
+            while len(input_buf) > 0:
+                consumed = grammar.build(input_buf, max_bytes=max_bytes)
+                if consumed == len(input_buf):
+                    break
+                stall += _put(grammar.freeze())
+                grammar = ENGINES[engine]()
+                input_buf = input_buf[consumed:]
+            stats.build += time.time() - start - stall
+        start = time.time()
+        grammar = grammar.freeze()
+        stats.build += time.time() - start
+        _put(grammar)
+    finally:
+        stopping.append(True)
+        while input_buf is not None:
+            input_buf = inputs.get()
+        outputs.put(None)
+        for thread in threads:
+            thread.join()
+    if errors:
+        exc_type, exc_value, exc_traceback = errors[0]
+        raise exc_type, exc_value, exc_traceback
     ostream.flush()
+    return stats
 
 # ______________________________________________________________________
 
-def encode_str(instr):
-    grammar = mrwot.Grammar()
+def encode_str(instr, engine='sequitur', backend='huffman',
+               nucleotide=False):
+    grammar = ENGINES[engine]()
     grammar.build(instr)
     single_int = struct.Struct("<I")
     return "".join(single_int.pack(out_elem) if isinstance(out_elem, int)
-                   else out_elem for out_elem in encode_grammar(grammar))
+                   else out_elem
+                   for out_elem in encode_grammar(grammar, backend,
+                                                  nucleotide=nucleotide))
 
 # ______________________________________________________________________
 
@@ -273,7 +949,10 @@ def make_decoder(grammar_dict, grammar_memo):
         symbols.reverse()
         while len(symbols) > 0:
             symbol = symbols.pop()
-            if symbol not in grammar_dict:
+            if type(symbol) == int and symbol < 0:
+                yield revcomp.reverse_complement(
+                    ''.join(_decoder([-symbol])))
+            elif symbol not in grammar_dict:
                 yield symbol
             elif symbol in grammar_memo:
                 yield grammar_memo[symbol]
@@ -288,12 +967,12 @@ def make_decoder(grammar_dict, grammar_memo):
 def make_memo(grammar_dict):
     return dict((item[0], ''.join(item[1]))
                 for item in grammar_dict.items()
-                if all(sym not in grammar_dict for sym in item[1]))
+                if all(type(sym) != int for sym in item[1]))
 
 # ______________________________________________________________________
 
-def decode(istream, ostream):
-    grammar_dict = decode_grammar_dict(istream)
+def decode(istream, ostream, reference=None):
+    grammar_dict = decode_grammar_dict(istream, reference)
     grammar_memo = make_memo(grammar_dict)
     decoder = make_decoder(grammar_dict, grammar_memo)
     for data in decoder(grammar_dict[0]):
@@ -302,15 +981,18 @@ def decode(istream, ostream):
 
 # ______________________________________________________________________
 
-def test_generators():
-    grm = mrwot.Grammar()
+def test_generators(backend='huffman'):
+    grm = core.Grammar()
     grm.build(USAGE)
-    enc_list = list(encode_grammar(grm))
+    enc_list = list(encode_grammar(grm, backend))
     single_int = struct.Struct("<I")
     enc_str = "".join(single_int.pack(out_elem) if isinstance(out_elem, int)
                       else out_elem for out_elem in enc_list)
     decode_stream = io.BytesIO(enc_str)
-    dec_list = list(process_decode_stream(decode_stream))
+    if backend == 'range':
+        dec_list = list(process_range_decode_stream(decode_stream))
+    else:
+        dec_list = list(process_decode_stream(decode_stream))
     decode_stream.close()
     assert enc_list == dec_list, "%r != %r!" % (enc_list, dec_list)
     return grm, enc_list, enc_str
@@ -318,7 +1000,7 @@ def test_generators():
 # ______________________________________________________________________
 
 def test_grammar_dicts():
-    grm = mrwot.Grammar()
+    grm = core.Grammar()
     grm.build(USAGE)
     grm_dict = grm.rules_to_dict()
     hist, enc_grm_dict = preprocess_grammar(grm)
@@ -341,12 +1023,13 @@ def test_grammar_dicts():
 
 # ______________________________________________________________________
 
-def test_encode(in_str = None):
+def test_encode(in_str = None, engine='sequitur', backend='huffman',
+                max_bytes=None, min_run=None):
     if in_str is None:
         in_str = USAGE
     in_stream = io.BytesIO(in_str)
     out_stream = io.BytesIO()
-    encode(in_stream, out_stream)
+    encode(in_stream, out_stream, engine, backend, max_bytes, min_run)
     in_stream.close()
     ret_val = out_stream.getvalue()
     out_stream.close()
@@ -365,10 +1048,11 @@ def test_decode(in_str):
 
 # ______________________________________________________________________
 
-def test_codec(in_str = None):
+def test_codec(in_str = None, engine='sequitur', backend='huffman',
+               max_bytes=None, min_run=None):
     if in_str is None:
         in_str = USAGE
-    encoded_str = test_encode(in_str)
+    encoded_str = test_encode(in_str, engine, backend, max_bytes, min_run)
     result = test_decode(encoded_str)
     assert in_str == result, "%r != %r!" % (in_str, result)
 
@@ -376,40 +1060,105 @@ def test_codec(in_str = None):
 
 def test():
     test_generators()
+    test_generators('range')
     test_grammar_dicts()
     test_codec()
+    test_codec(engine='repair')
+    test_codec(backend='range')
 
 # ______________________________________________________________________
 
 def main(*args):
-    opts, args = getopt.getopt(args, "cdh")
+    opts, args = getopt.getopt(args, "b:cde:hi:mM:np:r:R:s:w:")
     stdout = False
+    reference = None
+    records = None
+    max_bytes = None
+    min_run = None
+    queue_blocks = None
+    read_size = SIXTY4K
+    workers = None
+    mapped = False
+    nucleotide = False
     encoding = True
+    engine = 'sequitur'
+    backend = 'huffman'
     for opt in opts:
         key, val = opt
-        if key == '-c':
+        if key == '-b':
+            backend = val
+        elif key == '-c':
             stdout = True
         elif key == '-d':
             encoding = False
+        elif key == '-e':
+            engine = val
         elif key == "-h":
             print(USAGE)
+        elif key == '-i':
+            records = val
+        elif key == '-m':
+            mapped = True
+        elif key == '-M':
+            max_bytes = int(val)
+        elif key == '-n':
+            nucleotide = True
+        elif key == '-p':
+            queue_blocks = int(val)
+        elif key == '-r':
+            min_run = int(val)
+        elif key == '-R':
+            from wot.reference import Reference
+            reference = Reference.load(val)
+        elif key == '-s':
+            read_size = int(val)
+        elif key == '-w':
+            workers = int(val)
+    if queue_blocks is not None and (reference or records):
+        raise getopt.GetoptError("-p does not support -i or -R")
+    # __________________________________________________
+    def _encode(in_file, out_file):
+        if queue_blocks is None:
+            encode(in_file, out_file, engine, backend, max_bytes, min_run,
+                   reference, records, nucleotide)
+        else:
+            sys.stderr.write('%s: %s\n' % (in_file.name, encode_pipelined(
+                in_file, out_file, engine, backend, max_bytes, min_run,
+                read_size, queue_blocks, nucleotide)))
+    # __________________________________________________
     if encoding:
         for arg in args:
             with open(arg, 'rb') as in_file:
                 if not stdout:
                     with open(arg + '.wot', 'wb') as out_file:
-                        encode(in_file, out_file)
+                        _encode(in_file, out_file)
                 else:
-                    encode(in_file, sys.stdout)
+                    _encode(in_file, sys.stdout)
+    elif workers is not None:
+        if stdout:
+            raise getopt.GetoptError("-w needs an output file")
+        from wot.parallel import decode as parallel_decode
+        for arg in args:
+            assert arg.endswith('.wot')
+            parallel_decode(arg, arg[:-4], workers)
+    elif mapped:
+        from wot.mapped import decode as mapped_decode
+        for arg in args:
+            assert arg.endswith('.wot')
+            if not stdout:
+                with open(arg[:-4], 'wb') as out_file:
+                    mapped_decode(arg, out_file)
+            else:
+                mapped_decode(arg, sys.stdout)
     else:
         for arg in args:
             with open(arg, 'rb') as in_file:
                 assert arg.endswith('.wot')
                 if not stdout:
                     with open(arg[:-4], 'wb') as out_file:
-                        decode(in_file, out_file)
+                        decode(in_file, out_file, reference)
                 else:
-                    decode(in_file, sys.stdout)
+                    decode(in_file, sys.stdout, reference)
 
 # ______________________________________________________________________
 
@@ -0,0 +1,299 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""In-place edits of compressed grammars.
+
+An EditableGrammar wraps a grammar dictionary (see wot.query), which
+it never modifies: rules touched by an edit are copied, and the copies
+get new rule numbers, so the rules shared with the rest of the grammar
+keep their expansions.  The root body, which holds most of the symbols
+of a grammar, is first arranged as a height-balanced (AVL) tree of
+spine rules with two symbols each.  An edit splits the tree at the two
+ends of the edited range and joins the pieces around the new data,
+copying only the rules on the paths to the ends and rebalancing as it
+goes, so it takes time proportional to the grammar height (rule bodies
+are short) plus the size of the new data, whatever the size of the
+expansion.  rules_to_dict() inlines the spine rules
+back into the root and drops unreachable rules, so edited grammars
+encode like any other rules dictionary (see codec.encode_rules_dict()).
+"""
+
+from wot import codec, query
+import getopt, sys
+
+# ______________________________________________________________________
+
+USAGE = """Usage:
+    $ python -m wot.edit [-h] [-b backend] [-o output] file.wot start end
+        [text]
+
+Replaces bytes start to end (exclusive) of the expansion of file.wot
+with text (nothing by default), and writes the edited grammar back to
+file.wot, or to output.  Use start = end to insert.
+
+Flags:
+
+    -b    Entropy coding backend, 'huffman' (default) or 'range'.
+    -h    Print this help.
+    -o    Output file.
+"""
+
+# ______________________________________________________________________
+
+class EditableGrammar(object):
+    """Editable view of a grammar dictionary.  tree is the top of the
+    spine tree (None once the expansion is empty), and root is a spine
+    rule whose body holds just tree, so the grammar can be queried like
+    any other rules dictionary.
+    """
+    def __init__(self, grammar_dict, root=0):
+        self.base = grammar_dict
+        self.rules = {}
+        self.spine = set()
+        # Heights of the spine rules; other symbols are leaves.
+        self.heights = {}
+        self.lengths = query.rule_lengths(grammar_dict, root)
+        self.next_rule = max(grammar_dict.keys()) + 1
+        self.set_tree(self.add_spine(grammar_dict[root]))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as in_file:
+            return cls(codec.decode_grammar_dict(in_file))
+
+    def __getitem__(self, rule_no):
+        if rule_no in self.rules:
+            return self.rules[rule_no]
+        return self.base[rule_no]
+
+    def symbol_length(self, symbol):
+        return self.lengths[symbol] if type(symbol) == int else len(symbol)
+
+    def height(self, symbol):
+        if symbol is None or type(symbol) != int:
+            return 0
+        return self.heights.get(symbol, 0)
+
+    def add_rule(self, body, spine=False):
+        ret_val = self.next_rule
+        self.next_rule += 1
+        self.rules[ret_val] = body
+        self.lengths[ret_val] = sum(self.symbol_length(symbol)
+                                    for symbol in body)
+        if spine:
+            self.spine.add(ret_val)
+        return ret_val
+
+    def add_node(self, left, right):
+        """Return a new spine rule with body [left, right]."""
+        ret_val = self.add_rule([left, right], True)
+        self.heights[ret_val] = max(self.height(left),
+                                    self.height(right)) + 1
+        return ret_val
+
+    def add_spine(self, symbols):
+        """Return the top of a new balanced tree of spine rules
+        expanding to symbols, or None if there are none.
+        """
+        # __________________________________________________
+        def _add_spine(lo, hi):
+            if hi - lo == 1:
+                return symbols[lo]
+            mid = (lo + hi) // 2
+            return self.add_node(_add_spine(lo, mid), _add_spine(mid, hi))
+        # __________________________________________________
+        symbols = list(symbols)
+        return _add_spine(0, len(symbols)) if symbols else None
+
+    def set_tree(self, tree):
+        self.tree = tree
+        self.root = self.add_rule([] if tree is None else [tree], True)
+
+    def join(self, left, right):
+        """Return a spine tree expanding to the expansion of left
+        followed by that of right, rebalancing along the way.
+        """
+        if left is None:
+            return right
+        elif right is None:
+            return left
+        left_height = self.height(left)
+        right_height = self.height(right)
+        if abs(left_height - right_height) <= 1:
+            return self.add_node(left, right)
+        elif left_height > right_height:
+            outer, inner = self[left]
+            joined = self.join(inner, right)
+            if self.height(joined) <= self.height(outer) + 1:
+                return self.add_node(outer, joined)
+            inner, joined_outer = self[joined]
+            if self.height(joined_outer) >= self.height(inner):
+                return self.add_node(self.add_node(outer, inner),
+                                     joined_outer)
+            inner_left, inner_right = self[inner]
+            return self.add_node(self.add_node(outer, inner_left),
+                                 self.add_node(inner_right, joined_outer))
+        inner, outer = self[right]
+        joined = self.join(left, inner)
+        if self.height(joined) <= self.height(outer) + 1:
+            return self.add_node(joined, outer)
+        joined_outer, inner = self[joined]
+        if self.height(joined_outer) >= self.height(inner):
+            return self.add_node(joined_outer,
+                                 self.add_node(inner, outer))
+        inner_left, inner_right = self[inner]
+        return self.add_node(self.add_node(joined_outer, inner_left),
+                             self.add_node(inner_right, outer))
+
+    def split(self, tree, offset):
+        """Return spine trees expanding to the expansion of tree before
+        and after offset.
+        """
+        if offset == 0:
+            return None, tree
+        elif offset == self.symbol_length(tree):
+            return tree, None
+        elif tree not in self.spine or type(tree) != int:
+            return (self.add_spine(self._replace(
+                        tree, offset, self.symbol_length(tree), ())),
+                    self.add_spine(self._replace(tree, 0, offset, ())))
+        left, right = self[tree]
+        left_len = self.symbol_length(left)
+        if offset < left_len:
+            before, after = self.split(left, offset)
+            return before, self.join(after, right)
+        before, after = self.split(right, offset - left_len)
+        return self.join(left, before), after
+
+    def length(self):
+        return self.lengths[self.root]
+
+    def extract(self, start, length):
+        return query.extract(self, self.lengths, start, length, self.root)
+
+    def _replace(self, symbol, start, end, symbols):
+        """Return a list of symbols expanding to the expansion of a
+        symbol outside the spine with bytes start to end replaced by
+        the expansion of symbols.  Copies the rules on the paths to
+        start and end.
+        """
+        if start == 0 and end == self.symbol_length(symbol):
+            return list(symbols)
+        if type(symbol) != int:
+            return [part for part in (symbol[:start],) + tuple(symbols) +
+                    (symbol[end:],) if part != '']
+        body = []
+        middle = []
+        after = []
+        offset = 0
+        for child in self[symbol]:
+            child_end = offset + self.symbol_length(child)
+            if child_end <= start:
+                body.append(child)
+            elif offset >= end:
+                after.append(child)
+            else:
+                middle.append((child, offset))
+            offset = child_end
+        if not middle:
+            body.extend(symbols)
+        elif len(middle) == 1:
+            child, offset = middle[0]
+            body.extend(self._replace(child, start - offset, end - offset,
+                                      symbols))
+        else:
+            child, offset = middle[0]
+            body.extend(self._replace(child, start - offset,
+                                      self.symbol_length(child), ()))
+            body.extend(symbols)
+            child, offset = middle[-1]
+            body.extend(self._replace(child, 0, end - offset, ()))
+        body.extend(after)
+        if len(body) == 1:
+            return body
+        elif body:
+            return [self.add_rule(body)]
+        return []
+
+    def replace(self, start, end, data):
+        """Replace bytes start to end (exclusive) of the expansion with
+        data.
+        """
+        if not 0 <= start <= end <= self.length():
+            raise ValueError("Bad range %d:%d" % (start, end))
+        if len(data) > 1:
+            new_tree = self.add_rule(list(data))
+        else:
+            new_tree = data or None
+        before, rest = self.split(self.tree, start)
+        _, after = self.split(rest, end - start)
+        self.set_tree(self.join(self.join(before, new_tree), after))
+
+    def insert(self, offset, data):
+        self.replace(offset, offset, data)
+
+    def delete(self, start, end):
+        self.replace(start, end, '')
+
+    def rules_to_dict(self):
+        """Return the rules reachable from the root, with the spine
+        inlined into the root and rules renumbered from 1.
+        """
+        root_body = []
+        stack = [self.root]
+        while stack:
+            symbol = stack.pop()
+            if symbol in self.spine and type(symbol) == int:
+                stack.extend(reversed(self[symbol]))
+            else:
+                root_body.append(symbol)
+        numbers = {}
+        pending = [child for child in root_body if type(child) == int]
+        while pending:
+            rule_no = pending.pop()
+            if rule_no not in numbers:
+                numbers[rule_no] = None
+                pending.extend(symbol for symbol in self[rule_no]
+                               if type(symbol) == int)
+        for new_no, rule_no in enumerate(sorted(numbers), 1):
+            numbers[rule_no] = new_no
+        # __________________________________________________
+        def _renumber(body):
+            return tuple(numbers[symbol] if type(symbol) == int else symbol
+                         for symbol in body)
+        # __________________________________________________
+        ret_val = dict((numbers[rule_no], _renumber(self[rule_no]))
+                       for rule_no in numbers)
+        ret_val[0] = _renumber(root_body)
+        return ret_val
+
+    def save(self, ostream, backend='huffman'):
+        if self.length() == 0:
+            raise ValueError("Cannot encode an empty expansion")
+        codec.write_outputs(codec.encode_rules_dict(self.rules_to_dict(),
+                                                    backend), ostream)
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "b:ho:")
+    backend = 'huffman'
+    output = None
+    for opt in opts:
+        key, val = opt
+        if key == '-b':
+            backend = val
+        elif key == '-h':
+            print(USAGE)
+            return
+        elif key == '-o':
+            output = val
+    path, start, end = args[:3]
+    grammar = EditableGrammar.load(path)
+    grammar.replace(int(start), int(end), args[3] if len(args) > 3 else '')
+    with open(output or path, 'wb') as out_file:
+        grammar.save(out_file, backend)
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
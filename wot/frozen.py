@@ -0,0 +1,367 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Immutable, compact grammars.
+
+A FrozenGrammar holds every rule body in one packed integer array
+(terminal bytes as their value, nonterminals as their rule number plus
+256), with an array of body offsets indexed by rule position (a
+compressed sparse row layout), plus the expansion length and usage
+count of each rule.  Grammar.freeze() produces one once construction
+is finished, so the linked symbol lists and the digram map can be
+dropped.  Frozen grammars act as read-only rule dictionaries, so they
+can be passed to wot.codec and wot.query, and they serialize to a flat
+byte string of little-endian integers (64-bit rule tables, 32-bit
+symbols).  frombuffer() copies the tables into arrays, swapping byte
+order only on big endian hosts, while load() memory-maps a file and
+reads the tables from the map on access (see MappedArray), so only the
+rule number index is held in memory until the grammar is closed.
+
+Run terminals (see wot.runs) are kept in a run table and packed as
+negative numbers, -1 for the first run, -2 for the second and so on.
+"""
+
+from wot.runs import is_run
+from collections import Counter
+import array, mmap, struct, sys
+
+# ______________________________________________________________________
+
+MAGIC = "WOTF"
+TERMINAL_LIMIT = 256
+HEADER = struct.Struct("<4sQQQ")
+# struct codes of the serialized rule tables and symbols.
+TABLE_CODE = 'q'
+SYMBOL_CODE = 'i'
+
+def _array_typecodes():
+    """Return a map from item sizes to the array typecodes that hold
+    them.
+    """
+    ret_val = {}
+    for typecode in ('i', 'l', 'q'):
+        try:
+            ret_val.setdefault(array.array(typecode).itemsize, typecode)
+        except ValueError:
+            pass
+    return ret_val
+
+ARRAY_TYPECODES = _array_typecodes()
+
+# ______________________________________________________________________
+
+def pack_symbol(symbol, run_numbers=None):
+    """Pack a symbol, given a map from run terminals to their packed
+    (negative) numbers if the grammar has any.  Raises ValueError for
+    terminals that are not bytes.
+    """
+    if type(symbol) == int:
+        return symbol + TERMINAL_LIMIT
+    elif len(symbol) == 1:
+        ret_val = ord(symbol)
+        if ret_val >= TERMINAL_LIMIT:
+            raise ValueError("Terminal %r is not a byte" % symbol)
+        return ret_val
+    return run_numbers[symbol]
+
+def unpack_symbol(packed, runs=None):
+    if packed >= TERMINAL_LIMIT:
+        return packed - TERMINAL_LIMIT
+    elif packed >= 0:
+        return chr(packed)
+    return runs[-packed - 1]
+
+def run_numbers(runs):
+    """Return the map from run terminals to packed numbers for a run
+    table.
+    """
+    return dict((run, -idx) for idx, run in enumerate(runs, 1))
+
+def pack_array(values, code):
+    """Return a sequence of integers as little-endian struct values."""
+    if isinstance(values, MappedArray) and values.code == code:
+        return values.tostring()
+    typecode = ARRAY_TYPECODES.get(struct.calcsize(code))
+    if typecode is None:
+        return struct.pack('<%d%s' % (len(values), code), *values)
+    if (not isinstance(values, array.array) or values.typecode != typecode
+            or sys.byteorder == 'big'):
+        values = array.array(typecode, values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tostring()
+
+def unpack_array(buf, pos, count, code, typecode):
+    """Inverse of pack_array(): return an array of count integers read
+    from buf at pos.
+    """
+    size = struct.calcsize(code)
+    if ARRAY_TYPECODES.get(size) != typecode:
+        return array.array(typecode, struct.unpack_from(
+            '<%d%s' % (count, code), buf, pos))
+    ret_val = array.array(typecode)
+    ret_val.fromstring(buffer(buf, pos, count * size))
+    if len(ret_val) != count:
+        raise ValueError("Truncated frozen grammar")
+    if sys.byteorder == 'big':
+        ret_val.byteswap()
+    return ret_val
+
+# ______________________________________________________________________
+
+class MappedArray(object):
+    """Read-only sequence of count little-endian integers stored at pos
+    in buf (usually a memory map), decoded on access.  Slices are
+    returned as arrays of typecode.
+    """
+    # Items decoded at a time when iterating.
+    BLOCK_ITEMS = 1 << 16
+
+    def __init__(self, buf, pos, count, code, typecode):
+        self.buf = buf
+        self.pos = pos
+        self.count = count
+        self.code = code
+        self.typecode = typecode
+        self.item = struct.Struct('<' + code)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self.count)
+            if step != 1:
+                raise ValueError("Extended slices are not supported")
+            return unpack_array(self.buf, self.pos + start * self.item.size,
+                                max(stop - start, 0), self.code,
+                                self.typecode)
+        if idx < 0:
+            idx += self.count
+        if not 0 <= idx < self.count:
+            raise IndexError(idx)
+        return self.item.unpack_from(self.buf,
+                                     self.pos + idx * self.item.size)[0]
+
+    def __iter__(self):
+        for start in xrange(0, self.count, self.BLOCK_ITEMS):
+            for value in self[start:start + self.BLOCK_ITEMS]:
+                yield value
+
+    def tostring(self):
+        """Return the stored bytes."""
+        return self.buf[self.pos:self.pos + self.count * self.item.size]
+
+# ______________________________________________________________________
+
+class FrozenGrammar(object):
+    """Read-only grammar in compressed sparse row layout.  numbers holds
+    the sorted rule numbers, and the packed body of the rule at position
+    idx is symbols[offsets[idx]:offsets[idx + 1]].  lengths and usage
+    hold the expansion length and the number of references to each
+    rule, by position.  runs is the run table.
+    """
+    def __init__(self, numbers, offsets, symbols, lengths=None, usage=None,
+                 segment=None, runs=()):
+        self.numbers = numbers
+        self.offsets = offsets
+        # The memory map backing the tables, if any (see load()).
+        self.map = None
+        self.symbols = symbols
+        self.segment = segment
+        self.runs = list(runs)
+        self.positions = dict((rule_no, idx)
+                              for idx, rule_no in enumerate(numbers))
+        if usage is None:
+            usage = self.count_usage()
+        self.usage = usage
+        if lengths is None:
+            lengths = self.expansion_lengths()
+        self.lengths = lengths
+
+    @classmethod
+    def from_rules(cls, rules, segment=None):
+        """Build from an iterable of (rule number, symbols) pairs, such
+        as the rules of a grammar dump.
+        """
+        numbers = array.array('l')
+        offsets = array.array('l', [0])
+        symbols = array.array('i')
+        run_table = []
+        packed_runs = {}
+        for rule_no, rhs in sorted(rules, key=lambda rule: rule[0]):
+            numbers.append(rule_no)
+            for symbol in rhs:
+                if is_run(symbol) and symbol not in packed_runs:
+                    run_table.append(symbol)
+                    packed_runs[symbol] = -len(run_table)
+                symbols.append(pack_symbol(symbol, packed_runs))
+            offsets.append(len(symbols))
+        return cls(numbers, offsets, symbols, segment=segment,
+                   runs=run_table)
+
+    @classmethod
+    def from_dict(cls, rules_dict, segment=None):
+        return cls.from_rules(rules_dict.items(), segment)
+
+    @classmethod
+    def frombuffer(cls, buf, segment=None, copy=True):
+        """Inverse of tobytes().  buf may be any buffer.  Its contents
+        are copied into new arrays, unless copy is false, in which case
+        the tables are MappedArray views of buf.
+        """
+        magic, rule_count, symbol_count, run_count = HEADER.unpack_from(buf)
+        if magic != MAGIC:
+            raise ValueError("Not a frozen grammar")
+        pos = HEADER.size
+        arrays = []
+        for typecode, code, count in (
+                ('l', TABLE_CODE, rule_count),
+                ('l', TABLE_CODE, rule_count + 1),
+                ('l', TABLE_CODE, rule_count),
+                ('l', TABLE_CODE, rule_count),
+                ('i', SYMBOL_CODE, symbol_count),
+                ('l', TABLE_CODE, 2 * run_count)):
+            if copy:
+                arrays.append(unpack_array(buf, pos, count, code, typecode))
+            else:
+                arrays.append(MappedArray(buf, pos, count, code, typecode))
+            pos += count * struct.calcsize(code)
+        if pos > len(buf):
+            raise ValueError("Truncated frozen grammar")
+        numbers, offsets, lengths, usage, symbols, run_table = arrays
+        runs = [chr(run_table[idx]) * run_table[idx + 1]
+                for idx in xrange(0, len(run_table), 2)]
+        return cls(numbers, offsets, symbols, lengths, usage, segment, runs)
+
+    @classmethod
+    def load(cls, path, segment=None):
+        """Memory-map a frozen grammar file written by tobytes().  The
+        grammar should be closed once done with.  On big endian hosts,
+        the file is read into memory instead.
+        """
+        with open(path, 'rb') as in_file:
+            if sys.byteorder == 'big':
+                return cls.frombuffer(in_file.read(), segment)
+            frozen_map = mmap.mmap(in_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        try:
+            ret_val = cls.frombuffer(frozen_map, segment, False)
+        except:
+            frozen_map.close()
+            raise
+        ret_val.map = frozen_map
+        return ret_val
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def tobytes(self):
+        run_table = []
+        for run in self.runs:
+            run_table.extend((ord(run[0]), len(run)))
+        return ''.join((HEADER.pack(MAGIC, len(self.numbers),
+                                    len(self.symbols), len(self.runs)),
+                        pack_array(self.numbers, TABLE_CODE),
+                        pack_array(self.offsets, TABLE_CODE),
+                        pack_array(self.lengths, TABLE_CODE),
+                        pack_array(self.usage, TABLE_CODE),
+                        pack_array(self.symbols, SYMBOL_CODE),
+                        pack_array(run_table, TABLE_CODE)))
+
+    def count_usage(self):
+        ret_val = array.array('l', [0]) * len(self.numbers)
+        positions = self.positions
+        for packed in self.symbols:
+            if packed >= TERMINAL_LIMIT:
+                ret_val[positions[packed - TERMINAL_LIMIT]] += 1
+        return ret_val
+
+    def expansion_lengths(self):
+        ret_val = array.array('l', [-1]) * len(self.numbers)
+        offsets = self.offsets
+        for start_idx in xrange(len(self.numbers)):
+            stack = [start_idx]
+            while stack:
+                idx = stack[-1]
+                if ret_val[idx] >= 0:
+                    stack.pop()
+                    continue
+                total = 0
+                pending = False
+                for packed in self.symbols[offsets[idx]:offsets[idx + 1]]:
+                    if packed < 0:
+                        total += len(self.runs[-packed - 1])
+                        continue
+                    elif packed < TERMINAL_LIMIT:
+                        total += 1
+                        continue
+                    child = self.positions[packed - TERMINAL_LIMIT]
+                    if ret_val[child] < 0:
+                        stack.append(child)
+                        pending = True
+                    else:
+                        total += ret_val[child]
+                if not pending:
+                    ret_val[idx] = total
+                    stack.pop()
+        return ret_val
+
+    def index(self, rule_no):
+        return self.positions[rule_no]
+
+    def body(self, rule_no):
+        """Return the packed body of a rule."""
+        idx = self.index(rule_no)
+        return self.symbols[self.offsets[idx]:self.offsets[idx + 1]]
+
+    def __getitem__(self, rule_no):
+        return [unpack_symbol(packed, self.runs)
+                for packed in self.body(rule_no)]
+
+    def __contains__(self, rule_no):
+        return rule_no in self.positions
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __iter__(self):
+        return iter(self.numbers)
+
+    def keys(self):
+        return list(self.numbers)
+
+    def values(self):
+        return [self[rule_no] for rule_no in self.numbers]
+
+    def items(self):
+        return [(rule_no, self[rule_no]) for rule_no in self.numbers]
+
+    def length(self, rule_no=0):
+        return self.lengths[self.index(rule_no)]
+
+    def uses(self, rule_no):
+        return self.usage[self.index(rule_no)]
+
+    def histogram(self):
+        """Return a Counter of the terminals and nonterminals used in
+        rule bodies, as per codec.unigram().
+        """
+        counts = Counter(self.symbols)
+        return Counter(dict((unpack_symbol(packed, self.runs), count)
+                            for packed, count in counts.items()))
+
+    def dump(self):
+        return self.segment, tuple((rule_no, tuple(self[rule_no]))
+                                   for rule_no in self.numbers)
+
+    def rules_to_dict(self):
+        return dict((rule_no, tuple(self[rule_no]))
+                    for rule_no in self.numbers)
@@ -0,0 +1,132 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Streaming segmenting ingestion for MRWoT.
+
+Reads arbitrarily large (optionally gzip or bzip2 compressed) files in
+bounded memory and splits them into evenly sized segments.  Each
+segment is written as one line of the MRWoT input protocol
+(JSONProtocol): a JSON segment key, a tab, and the JSON encoded
+segment data.  Segment keys have the form "<file name>:<index>", so
+they are stable from run to run as long as the file does not change.
+"""
+
+import bz2, getopt, gzip, json, sys
+
+# ______________________________________________________________________
+
+SEGMENT_SIZE = 1 << 20
+USAGE = """Usage:
+    $ python -m wot.ingest [-fh] [-s segment_size] file1 [file2...]
+
+Writes MRWoT input records for each segment of the input files to
+stdout.  Use '-' to read from stdin.
+
+Flags:
+
+    -f    Split at FASTA record boundaries ('>' at the start of a
+          line) where possible.
+    -h    Print this help.
+    -s    Segment size in bytes (default %d).
+""" % SEGMENT_SIZE
+
+# ______________________________________________________________________
+
+def open_input(path):
+    """Open a file for binary reading, transparently decompressing
+    gzip and bzip2 files.  The path '-' is stdin.
+    """
+    if path == '-':
+        return sys.stdin
+    with open(path, 'rb') as in_file:
+        magic = in_file.read(3)
+    if magic.startswith('\x1f\x8b'):
+        return gzip.open(path, 'rb')
+    elif magic == 'BZh':
+        return bz2.BZ2File(path, 'rb')
+    return open(path, 'rb')
+
+# ______________________________________________________________________
+
+def iter_chunks(istream, segment_size=SEGMENT_SIZE):
+    """Generate fixed size chunks of the input stream."""
+    data = istream.read(segment_size)
+    while len(data) > 0:
+        yield data
+        data = istream.read(segment_size)
+
+# ______________________________________________________________________
+
+def iter_records(istream, segment_size=SEGMENT_SIZE):
+    """Generate chunks of at most segment_size bytes that end at a FASTA
+    record boundary.  Records longer than segment_size are split into
+    fixed size chunks.  Never buffers more than two segments of input.
+    """
+    buf = ''
+    eof = False
+    while True:
+        while not eof and len(buf) <= segment_size:
+            data = istream.read(segment_size)
+            if len(data) == 0:
+                eof = True
+            buf += data
+        if len(buf) <= segment_size:
+            if len(buf) > 0:
+                yield buf
+            break
+        cut = buf.rfind('\n>', 0, segment_size + 1) + 1
+        if cut <= 0:
+            cut = segment_size
+        yield buf[:cut]
+        buf = buf[cut:]
+
+# ______________________________________________________________________
+
+def segment_key(name, index):
+    return '%s:%d' % (name, index)
+
+# ______________________________________________________________________
+
+def iter_segments(paths, segment_size=SEGMENT_SIZE, fasta=False):
+    """Generate (segment key, data) pairs for a sequence of input
+    paths.
+    """
+    splitter = iter_records if fasta else iter_chunks
+    for path in paths:
+        istream = open_input(path)
+        try:
+            for index, data in enumerate(splitter(istream, segment_size)):
+                yield segment_key(path, index), data
+        finally:
+            if istream is not sys.stdin:
+                istream.close()
+
+# ______________________________________________________________________
+
+def format_record(key, data):
+    """Format a segment as a line of the MRWoT input protocol.  Data is
+    treated as Latin-1 so that arbitrary bytes survive the JSON
+    encoding.
+    """
+    return '%s\t%s\n' % (json.dumps(key), json.dumps(data.decode('latin-1')))
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "fhs:")
+    fasta = False
+    segment_size = SEGMENT_SIZE
+    for opt in opts:
+        key, val = opt
+        if key == '-f':
+            fasta = True
+        elif key == '-h':
+            print(USAGE)
+        elif key == '-s':
+            segment_size = int(val)
+    for key, data in iter_segments(args, segment_size, fasta):
+        sys.stdout.write(format_record(key, data))
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,269 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Multi-sample k-mer count matrices.
+
+build() counts the k-mers of many input files in a process pool, the
+way dimer.histogram() counts them in one (line by line, over the dimer
+alphabet), and writes a sparse samples x k-mers matrix.  K-mers are
+numbered in dimer order (the order of itertools.product() over
+dimer.ALPHABET, as in the NIHCC reports), and each sample row holds the
+numbers and counts of its k-mers, sorted by number.
+
+Matrix files hold a fixed header (magic number, k, sample count,
+number of stored counts and the file positions of the sections that
+follow), the sample names (length, then bytes, each), the k-mer numbers
+and counts of all rows as little-endian 32-bit integers, and the row
+offsets into them as 64-bit integers.  KmerMatrix memory-maps a matrix
+file and reads rows and single counts without loading the rest.
+"""
+
+from wot import dimer, ingest
+from collections import Counter, defaultdict
+import array, getopt, itertools, mmap, multiprocessing, re, shutil, \
+    string, struct, sys, tempfile
+
+# ______________________________________________________________________
+
+MAGIC = "WOTK"
+HEADER = struct.Struct("<4sIIQQQQQ")
+DIGITS = string.maketrans(''.join(dimer.ALPHABET), '0123')
+USAGE = """Usage:
+    $ python -m wot.kmers [-h] [-k k] [-m min_count] [-t min_total]
+        [-w workers] -o matrix file1 [file2...]
+    $ python -m wot.kmers -p matrix
+
+Counts the k-mers of each input file (gzip and bzip2 files are
+decompressed) and writes a samples x k-mers count matrix, or prints the
+NIHCC histogram (see wot.dimer) of every sample of a matrix.
+
+Flags:
+
+    -h    Print this help.
+    -k    K-mer length (default 2).
+    -m    Drop the counts below min_count in each sample.
+    -o    Output matrix file.
+    -p    Print the histograms of a matrix file.
+    -t    Drop the k-mers counted fewer than min_total times over all
+          samples.
+    -w    Number of worker processes (default is the CPU count).
+"""
+
+# ______________________________________________________________________
+
+def kmer_index(word):
+    """Return the number of a k-mer in dimer order."""
+    return int(word.translate(DIGITS), 4)
+
+# ______________________________________________________________________
+
+def kmer_word(index, k):
+    return ''.join(dimer.ALPHABET[(index >> (2 * shift)) & 3]
+                   for shift in xrange(k - 1, -1, -1))
+
+# ______________________________________________________________________
+
+def count_kmers(istream, k, min_count=1):
+    """Count the k-mers of each line of a stream.  Returns the k-mer
+    numbers with at least min_count occurrences, in order, and their
+    counts, as two arrays.
+    """
+    fragment_re = re.compile('[%s]{%d,}' % (''.join(dimer.ALPHABET), k))
+    counts = defaultdict(int)
+    for line in istream:
+        for fragment in fragment_re.findall(line):
+            for pos in xrange(len(fragment) - k + 1):
+                counts[fragment[pos:pos + k]] += 1
+    items = sorted((kmer_index(word), count)
+                   for word, count in counts.iteritems()
+                   if count >= min_count)
+    return (array.array('I', (index for index, _ in items)),
+            array.array('I', (count for _, count in items)))
+
+# ______________________________________________________________________
+
+def _count_sample(args):
+    """Pool worker: count the k-mers of one input file."""
+    path, k, min_count = args
+    istream = ingest.open_input(path)
+    try:
+        return count_kmers(istream, k, min_count)
+    finally:
+        if istream is not sys.stdin:
+            istream.close()
+
+# ______________________________________________________________________
+
+def build(paths, out_path, k=2, workers=None, min_count=1, min_total=1):
+    """Count the k-mers of the given files in a pool of worker
+    processes, and write their count matrix to out_path, naming samples
+    after their paths.  Counts below min_count are dropped, as are
+    k-mers counted fewer than min_total times in all.  Rows are spooled
+    to a temporary file, so memory use does not grow with the number of
+    samples.
+    """
+    if not 0 < k <= 16:
+        raise ValueError("K-mer numbers need 0 < k <= 16, not %d" % (k,))
+    totals = Counter()
+    lengths = []
+    pool = multiprocessing.Pool(workers)
+    with tempfile.TemporaryFile() as rows_file, \
+            tempfile.TemporaryFile() as counts_file, \
+            open(out_path, 'wb') as out_file:
+        try:
+            for columns, counts in pool.imap(
+                    _count_sample, ((path, k, min_count) for path in paths)):
+                if min_total > 1:
+                    for column, count in itertools.izip(columns, counts):
+                        totals[column] += count
+                columns.tofile(rows_file)
+                counts.tofile(rows_file)
+                lengths.append(len(columns))
+        finally:
+            pool.terminate()
+        out_file.write(HEADER.pack(MAGIC, k, len(paths), 0, 0, 0, 0, 0))
+        names_pos = out_file.tell()
+        for path in paths:
+            out_file.write(struct.pack("<I", len(path)) + path)
+        columns_pos = out_file.tell()
+        offsets = [0]
+        rows_file.seek(0)
+        for length in lengths:
+            columns = array.array('I')
+            columns.fromfile(rows_file, length)
+            counts = array.array('I')
+            counts.fromfile(rows_file, length)
+            if min_total > 1:
+                keep = [idx for idx, column in enumerate(columns)
+                        if totals[column] >= min_total]
+                columns = array.array('I', (columns[idx] for idx in keep))
+                counts = array.array('I', (counts[idx] for idx in keep))
+            columns.tofile(out_file)
+            counts.tofile(counts_file)
+            offsets.append(offsets[-1] + len(columns))
+        counts_pos = out_file.tell()
+        counts_file.seek(0)
+        shutil.copyfileobj(counts_file, out_file)
+        offsets_pos = out_file.tell()
+        out_file.write(struct.pack("<%dQ" % (len(offsets),), *offsets))
+        out_file.seek(0)
+        out_file.write(HEADER.pack(MAGIC, k, len(paths), offsets[-1],
+                                   names_pos, offsets_pos, columns_pos,
+                                   counts_pos))
+
+# ______________________________________________________________________
+
+class KmerMatrix(object):
+    """Read-only view of a memory-mapped k-mer count matrix file."""
+    def __init__(self, path):
+        with open(path, 'rb') as in_file:
+            self.map = mmap.mmap(in_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        (magic, self.k, samples, self.stored, names_pos, offsets_pos,
+         self.columns_pos, self.counts_pos) = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError("%s is not a k-mer matrix" % (path,))
+        self.offsets = struct.unpack_from("<%dQ" % (samples + 1,),
+                                          self.map, offsets_pos)
+        self.names = []
+        pos = names_pos
+        for _ in xrange(samples):
+            name_len = struct.unpack_from("<I", self.map, pos)[0]
+            self.names.append(self.map[pos + 4:pos + 4 + name_len])
+            pos += 4 + name_len
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _read(self, section_pos, start, end):
+        ret_val = array.array('I')
+        ret_val.fromstring(self.map[section_pos + 4 * start:
+                                    section_pos + 4 * end])
+        return ret_val
+
+    def row(self, sample):
+        """Return the k-mer numbers and counts of a sample."""
+        start, end = self.offsets[sample], self.offsets[sample + 1]
+        return (self._read(self.columns_pos, start, end),
+                self._read(self.counts_pos, start, end))
+
+    def count(self, sample, kmer):
+        """Return the count of a k-mer (a word or its number) in a
+        sample, by binary search of the row.
+        """
+        if isinstance(kmer, basestring):
+            kmer = kmer_index(kmer)
+        low, high = self.offsets[sample], self.offsets[sample + 1]
+        while low < high:
+            middle = (low + high) // 2
+            column = struct.unpack_from("<I", self.map,
+                                        self.columns_pos + 4 * middle)[0]
+            if column < kmer:
+                low = middle + 1
+            elif column > kmer:
+                high = middle
+            else:
+                return struct.unpack_from("<I", self.map,
+                                          self.counts_pos + 4 * middle)[0]
+        return 0
+
+    def column(self, kmer):
+        """Return the counts of a k-mer in every sample."""
+        return [self.count(sample, kmer) for sample in xrange(len(self))]
+
+    def histogram(self, sample):
+        """Return the NIHCC format report of a sample, as returned by
+        dimer.histogram().
+        """
+        counts = dict(itertools.izip(*self.row(sample)))
+        return ''.join("%3.10s%13s\n" % (index, counts.get(index, 0))
+                       for index in xrange(4 ** self.k))
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "hk:m:o:pt:w:")
+    k = 2
+    min_count = 1
+    min_total = 1
+    out_path = None
+    printing = False
+    workers = None
+    for opt in opts:
+        key, val = opt
+        if key == '-h':
+            print(USAGE)
+            return
+        elif key == '-k':
+            k = int(val)
+        elif key == '-m':
+            min_count = int(val)
+        elif key == '-o':
+            out_path = val
+        elif key == '-p':
+            printing = True
+        elif key == '-t':
+            min_total = int(val)
+        elif key == '-w':
+            workers = int(val)
+    if printing:
+        for arg in args:
+            with KmerMatrix(arg) as matrix:
+                for sample, name in enumerate(matrix.names):
+                    sys.stdout.write('%s\n%s' % (name,
+                                                 matrix.histogram(sample)))
+    else:
+        build(args, out_path, k, workers, min_count, min_total)
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
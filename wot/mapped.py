@@ -0,0 +1,281 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Bounded-memory access to .wot files.
+
+MappedGrammar memory-maps a .wot file, reads the header and computes
+the file position of every rule body, but only decodes rule bodies
+when they are needed.  Decoded bodies are kept as packed integer
+arrays (terminal bytes as their value, nonterminals as their rule
+number plus 256) in a least recently used cache with a limit on the
+number of symbols held.  Peak memory is therefore proportional to the
+grammar size, not to the size of the expanded output.
+
+Range coded files (see wot.rangecoder) cannot be paged rule by rule,
+so their bodies are decoded once into a single packed array.  Files
+written with a memory budget hold several framed members, which are
+decoded one after the other.  The leaf rules of nucleotide streams (see
+wot.nucleotide) are unpacked from their header section into one packed
+array when the header is read.
+"""
+
+from wot import codec, nucleotide, rangecoder, runs
+from wot.frozen import TERMINAL_LIMIT, pack_symbol, run_numbers, \
+    unpack_symbol
+from collections import OrderedDict
+import array, bisect, mmap, struct, threading
+
+# ______________________________________________________________________
+
+CACHE_SYMBOLS = 1 << 20
+# Bits of each byte value, most significant first (bitarray's default
+# endianness).
+BYTE_BITS = [tuple((byte >> shift) & 1 for shift in xrange(7, -1, -1))
+             for byte in xrange(256)]
+
+# ______________________________________________________________________
+
+class MappedStream(object):
+    """Minimal file-like reader over a memory map (or string)."""
+    def __init__(self, buf, pos=0):
+        self.buf = buf
+        self.pos = pos
+
+    def read(self, size=-1):
+        start = self.pos
+        if size < 0:
+            self.pos = len(self.buf)
+        else:
+            self.pos = min(start + size, len(self.buf))
+        return self.buf[start:self.pos]
+
+# ______________________________________________________________________
+
+def build_decode_tree(code, packed_runs=None):
+    """Turn a prefix code map (see codec.build_prefix_code_map()) into
+    a nested [zero, one] list tree that can be walked bit by bit.
+    Leaves hold packed symbols (see pack_symbol()).
+    """
+    root = [None, None]
+    for symbol, bits in code.items():
+        node = root
+        bits = bits.to01()
+        for bit in bits[:-1]:
+            idx = int(bit)
+            if node[idx] is None:
+                node[idx] = [None, None]
+            node = node[idx]
+        node[int(bits[-1])] = (pack_symbol(symbol, packed_runs),)
+    return root
+
+# ______________________________________________________________________
+
+class MappedGrammar(object):
+    """Read-only, on demand view of the rules in a .wot file.  Indexing
+    returns a rule body as a list of terminals and nonterminals, like
+    the dictionaries returned by codec.decode_grammar_dict(), so
+    instances can be used with wot.query.  The .wot stream may start at
+    an offset into the file, and end is the offset just past it.  The
+    body cache is guarded by a lock, so threads may share an instance.
+    """
+    def __init__(self, path, cache_symbols=CACHE_SYMBOLS, offset=0):
+        with open(path, 'rb') as in_file:
+            self.map = mmap.mmap(in_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        self.cache_symbols = cache_symbols
+        self.cache = OrderedDict()
+        self.cached_symbols = 0
+        self.lock = threading.Lock()
+        self.packed = None
+        stream = MappedStream(self.map, offset)
+        ingen = codec.process_header(stream)
+        self.flags, hist, symbols, self.sections = codec.decode_header(
+            ingen)
+        self.numbers = array.array('l', symbols)
+        self.runs = sorted(symbol for symbol in hist if runs.is_run(symbol))
+        packed_runs = run_numbers(self.runs)
+        single_int = struct.Struct("<I")
+        def _getint():
+            return single_int.unpack(stream.read(4))[0]
+        if self.flags & ~(codec.FLAG_RANGE | codec.FLAG_FRAMED |
+                          codec.FLAG_RUNS | codec.FLAG_RECORDS |
+                          codec.FLAG_NUCLEOTIDE):
+            raise ValueError("Unsupported .wot flags %#x" % (self.flags,))
+        self.first_leaf = None
+        if codec.FLAG_NUCLEOTIDE in self.sections:
+            section = self.sections[codec.FLAG_NUCLEOTIDE]
+            self.first_leaf = section[1]
+            leaves = nucleotide.unpack_leaves({}, section)
+            self.leaf_starts = array.array('L', [0])
+            self.leaf_packed = array.array('i')
+            for leaf in sorted(leaves):
+                self.leaf_packed.extend(ord(letter)
+                                        for letter in leaves[leaf])
+                self.leaf_starts.append(len(self.leaf_packed))
+        if self.flags & codec.FLAG_RANGE:
+            order = _getint()
+            lengths = [_getint() for _ in symbols]
+            coded = stream.read(_getint())
+            self.starts = array.array('L', [0])
+            self.packed = array.array('i')
+            for body in rangecoder.iter_decode_bodies(
+                    sorted(hist.keys()), lengths, coded, order):
+                self.packed.extend(pack_symbol(symbol, packed_runs)
+                                   for symbol in body)
+                self.starts.append(len(self.packed))
+            self.end = stream.pos
+        else:
+            self.tree = build_decode_tree(codec.build_prefix_code_map(
+                codec.build_tree2(hist)), packed_runs)
+            framed = self.flags & codec.FLAG_FRAMED
+            coded_lens = [_getint()
+                          for _ in (symbols if framed else symbols[:-1])]
+            # Positions of each rule's symbol count, followed by the
+            # coded body.  Unless the stream is framed, the last body
+            # runs to the end of the file.
+            self.starts = array.array('L')
+            pos = stream.pos
+            for coded_len in coded_lens:
+                self.starts.append(pos)
+                pos += 4 + coded_len
+            if not framed:
+                self.starts.append(pos)
+                pos = len(self.map)
+            self.starts.append(pos)
+            self.end = pos
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def index(self, rule_no):
+        idx = bisect.bisect_left(self.numbers, rule_no)
+        if idx >= len(self.numbers) or self.numbers[idx] != rule_no:
+            raise KeyError(rule_no)
+        return idx
+
+    def __contains__(self, rule_no):
+        try:
+            self.index(rule_no)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, rule_no):
+        return [unpack_symbol(packed, self.runs)
+                for packed in self.body(rule_no)]
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def keys(self):
+        return list(self.numbers)
+
+    def body(self, rule_no):
+        """Return the packed body of a rule."""
+        idx = self.index(rule_no)
+        if self.first_leaf is not None and rule_no >= self.first_leaf:
+            leaf_idx = rule_no - self.first_leaf
+            return self.leaf_packed[self.leaf_starts[leaf_idx]:
+                                    self.leaf_starts[leaf_idx + 1]]
+        if self.packed is not None:
+            return self.packed[self.starts[idx]:self.starts[idx + 1]]
+        with self.lock:
+            ret_val = self.cache.pop(rule_no, None)
+            if ret_val is None:
+                ret_val = self.decode_body(idx)
+                self.cached_symbols += len(ret_val)
+                while (self.cached_symbols > self.cache_symbols and
+                       len(self.cache) > 0):
+                    _, evicted = self.cache.popitem(last=False)
+                    self.cached_symbols -= len(evicted)
+            self.cache[rule_no] = ret_val
+        return ret_val
+
+    def memory_estimate(self):
+        """Rough estimate of the number of bytes held in memory, with a
+        full body cache.  The mapped file is not counted.
+        """
+        ret_val = 16 * len(self.numbers) + 8 * self.cache_symbols
+        if self.packed is not None:
+            ret_val += 4 * len(self.packed)
+        if self.first_leaf is not None:
+            ret_val += 4 * len(self.leaf_packed)
+        return ret_val
+
+    def decode_body(self, idx):
+        start = self.starts[idx]
+        sym_count = struct.unpack("<I", self.map[start:start + 4])[0]
+        ret_val = array.array('i')
+        if sym_count == 0:
+            return ret_val
+        node = self.tree
+        for byte in bytearray(self.map[start + 4:self.starts[idx + 1]]):
+            for bit in BYTE_BITS[byte]:
+                node = node[bit]
+                if type(node) is tuple:
+                    ret_val.append(node[0])
+                    if len(ret_val) == sym_count:
+                        return ret_val
+                    node = self.tree
+        return ret_val
+
+    def expand(self, ostream, rule_no=0, buffer_size=codec.SIXTY4K):
+        """Write the expansion of a rule to ostream, holding no more
+        than one rule body per grammar level plus an output buffer.
+        """
+        self.expand_symbols(ostream, self.body(rule_no), buffer_size)
+
+    def symbol_length(self, packed, lengths):
+        """Return the expansion length of a packed symbol, given a map
+        from rule numbers to expansion lengths.
+        """
+        if packed >= TERMINAL_LIMIT:
+            return lengths[packed - TERMINAL_LIMIT]
+        return 1 if packed >= 0 else len(self.runs[-packed - 1])
+
+    def expand_symbols(self, ostream, symbols, buffer_size=codec.SIXTY4K):
+        """Write the expansion of a sequence of packed symbols to
+        ostream.
+        """
+        out = bytearray()
+        bodies = [symbols]
+        positions = [0]
+        while bodies:
+            body = bodies[-1]
+            pos = positions[-1]
+            if pos >= len(body):
+                bodies.pop()
+                positions.pop()
+                continue
+            positions[-1] = pos + 1
+            packed = body[pos]
+            if packed < TERMINAL_LIMIT:
+                if packed >= 0:
+                    out.append(packed)
+                else:
+                    out.extend(self.runs[-packed - 1])
+                if len(out) >= buffer_size:
+                    ostream.write(bytes(out))
+                    del out[:]
+            else:
+                bodies.append(self.body(packed - TERMINAL_LIMIT))
+                positions.append(0)
+        ostream.write(bytes(out))
+
+# ______________________________________________________________________
+
+def decode(path, ostream, cache_symbols=CACHE_SYMBOLS):
+    """Decode a .wot file to ostream in bounded memory."""
+    offset = 0
+    more = True
+    while more:
+        with MappedGrammar(path, cache_symbols, offset) as grammar:
+            grammar.expand(ostream)
+            offset = grammar.end
+            more = offset < len(grammar.map)
+    ostream.flush()
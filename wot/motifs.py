@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Repeated motif reports from grammar rule statistics.
+
+Every rule of a grammar is a repeat of its input, so ranking rules by
+the number of bytes they cover (occurrences times expansion length)
+finds high-copy repeats without a suffix array.  Lengths are computed
+bottom-up and occurrence counts top-down over the rule dictionary (see
+wot.query), so a report takes time proportional to the grammar size,
+plus the size of the motifs and positions actually printed.
+"""
+
+from wot import codec, query
+import getopt, sys
+
+# ______________________________________________________________________
+
+USAGE = """Usage:
+    $ python -m wot.motifs [-h] [-l min_length] [-n count] [-p positions]
+        file1.wot...
+
+Writes one tab separated line per repeated rule, ranked by covered
+length: the rule number, expansion length, occurrence count, covered
+length, first occurrence offsets and the (escaped) motif.
+
+Flags:
+
+    -h    Print this help.
+    -l    Only report motifs at least this long (default 1).
+    -n    Number of motifs to report (default 20, 0 for all).
+    -p    Number of occurrence offsets to report (default 10).
+"""
+
+# ______________________________________________________________________
+
+def occurrences(grammar_dict, root=0):
+    """Return a map from rule numbers to the number of times each rule
+    occurs in the expansion of root.
+    """
+    order = query.topological_order(grammar_dict, root)
+    ret_val = dict((rule_no, 0) for rule_no in order)
+    ret_val[root] = 1
+    for rule_no in reversed(order):
+        count = ret_val[rule_no]
+        for symbol in grammar_dict[rule_no]:
+            if type(symbol) == int:
+                ret_val[symbol] += count
+    return ret_val
+
+# ______________________________________________________________________
+
+class Motifs(object):
+    """Rule statistics of a grammar dictionary."""
+    def __init__(self, grammar_dict, root=0):
+        self.grammar_dict = grammar_dict
+        self.root = root
+        self.lengths = query.rule_lengths(grammar_dict, root)
+        self.occurrences = occurrences(grammar_dict, root)
+
+    def rank(self, min_length=1, limit=None):
+        """Return (rule number, length, occurrences, covered length)
+        tuples for repeated rules at least min_length long, most
+        covered first.
+        """
+        ret_val = [(rule_no, length, self.occurrences[rule_no],
+                    length * self.occurrences[rule_no])
+                   for rule_no, length in self.lengths.items()
+                   if (rule_no != self.root and length >= min_length and
+                       self.occurrences[rule_no] > 1)]
+        ret_val.sort(key=lambda item: (-item[3], -item[1], item[0]))
+        return ret_val[:limit] if limit else ret_val
+
+    def motif(self, rule_no):
+        """Return the expansion of a rule."""
+        return query.extract(self.grammar_dict, self.lengths, 0,
+                             self.lengths[rule_no], rule_no)
+
+    def positions(self, rule_no, limit=None):
+        """Return the offsets of the first limit (default all)
+        occurrences of a rule in the expansion of the root, descending
+        only into rules that contain it.
+        """
+        contains = {}
+        for parent in query.topological_order(self.grammar_dict,
+                                              self.root):
+            contains[parent] = parent == rule_no or any(
+                type(symbol) == int and contains[symbol]
+                for symbol in self.grammar_dict[parent])
+        ret_val = []
+        offset = 0
+        stack = [(self.root, 0)]
+        while stack and (limit is None or len(ret_val) < limit):
+            parent, pos = stack.pop()
+            body = self.grammar_dict[parent]
+            while pos < len(body):
+                symbol = body[pos]
+                pos += 1
+                if type(symbol) != int:
+                    offset += len(symbol)
+                elif symbol == rule_no:
+                    ret_val.append(offset)
+                    offset += self.lengths[symbol]
+                    if len(ret_val) == limit:
+                        break
+                elif contains[symbol]:
+                    stack.append((parent, pos))
+                    stack.append((symbol, 0))
+                    break
+                else:
+                    offset += self.lengths[symbol]
+        return ret_val
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "hl:n:p:")
+    min_length = 1
+    limit = 20
+    max_positions = 10
+    for opt in opts:
+        key, val = opt
+        if key == '-h':
+            print(USAGE)
+            return
+        elif key == '-l':
+            min_length = int(val)
+        elif key == '-n':
+            limit = int(val)
+        elif key == '-p':
+            max_positions = int(val)
+    for path in args:
+        with open(path, 'rb') as in_file:
+            motifs = Motifs(codec.decode_grammar_dict(in_file))
+        for rule_no, length, count, covered in motifs.rank(min_length,
+                                                           limit):
+            sys.stdout.write('%d\t%d\t%d\t%d\t%s\t%s\n' % (
+                rule_no, length, count, covered,
+                ','.join(str(position) for position in
+                         motifs.positions(rule_no, max_positions)),
+                motifs.motif(rule_no).encode('string_escape')))
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
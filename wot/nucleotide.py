@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Nucleotide profile for .wot streams.
+
+Grammars of DNA have few terminals (A, C, G, T and perhaps N), mixed
+into bodies that mostly reference other rules.  split_terminals() moves
+every run of terminals into a leaf rule whose body is only terminals, so
+that all other bodies are only nonterminals.  The codec entropy codes
+those, and stores the leaves packed at a fixed two bits a base (three
+with N) in a header section (see codec.FLAG_NUCLEOTIDE), dropping the
+byte histogram.  Leaves are numbered past every other rule, and have
+empty coded bodies, so codec.decode_grammar_dict() and wot.mapped fill
+them in from the section with unpack_leaves().
+"""
+
+import bitarray, itertools
+
+# ______________________________________________________________________
+
+ALPHABETS = ('ACGT', 'ACGTN')
+
+# ______________________________________________________________________
+
+def detect_alphabet(hist):
+    """Return the smallest nucleotide alphabet holding every terminal
+    of a symbol histogram, or None if there is none.
+    """
+    terminals = set(symbol for symbol in hist if type(symbol) != int)
+    for alphabet in ALPHABETS:
+        if terminals and terminals <= set(alphabet):
+            return alphabet
+    return None
+
+# ______________________________________________________________________
+
+def make_code(alphabet):
+    """Return the fixed width bitarray code of an alphabet."""
+    width = (len(alphabet) - 1).bit_length()
+    return dict((letter, bitarray.bitarray(format(idx, '0%db' % (width,))))
+                for idx, letter in enumerate(alphabet))
+
+# ______________________________________________________________________
+
+def split_terminals(rules_dict, alphabet):
+    """Return a copy of a grammar dictionary (or frozen grammar) whose
+    bodies are only nonterminals, with an empty body for each leaf, and
+    its nucleotide section (see codec.header_outputs()).  Rules whose
+    bodies are only terminals are replaced by the leaf of the same
+    run, keeping the sign of reverse-complement references.
+    """
+    leaves = {}
+    leaf_bodies = []
+    first_leaf = max(rules_dict.keys()) + 1
+    # __________________________________________________
+    def _leaf(run):
+        ret_val = leaves.get(run)
+        if ret_val is None:
+            ret_val = leaves[run] = first_leaf + len(leaf_bodies)
+            leaf_bodies.append(run)
+        return ret_val
+    # __________________________________________________
+    aliases = dict((rule_no, _leaf(''.join(rhs)))
+                   for rule_no, rhs in rules_dict.items()
+                   if rule_no != 0 and rhs and
+                   all(type(symbol) != int for symbol in rhs))
+    ret_val = {}
+    for rule_no, rhs in rules_dict.items():
+        if rule_no in aliases:
+            continue
+        body = []
+        for is_rule, group in itertools.groupby(
+                rhs, lambda symbol: type(symbol) == int):
+            if not is_rule:
+                body.append(_leaf(''.join(group)))
+                continue
+            for symbol in group:
+                alias = aliases.get(abs(symbol))
+                if alias is None:
+                    body.append(symbol)
+                else:
+                    body.append(alias if symbol > 0 else -alias)
+        ret_val[rule_no] = body
+    for leaf in xrange(first_leaf, first_leaf + len(leaf_bodies)):
+        ret_val[leaf] = []
+    packed = bitarray.bitarray()
+    packed.encode(make_code(alphabet), ''.join(leaf_bodies))
+    return ret_val, (alphabet, first_leaf, [len(run) for run in leaf_bodies],
+                     packed.tobytes())
+
+# ______________________________________________________________________
+
+def unpack_leaves(grammar_dict, section):
+    """Fill in the leaf bodies of a decoded grammar dictionary from its
+    nucleotide section.
+    """
+    alphabet, first_leaf, lengths, packed = section
+    code = make_code(alphabet)
+    bits = bitarray.bitarray()
+    bits.frombytes(packed)
+    del bits[len(code[alphabet[0]]) * sum(lengths):]
+    letters = bits.decode(code) if len(bits) else []
+    pos = 0
+    for leaf, length in enumerate(lengths, first_leaf):
+        grammar_dict[leaf] = letters[pos:pos + length]
+        pos += length
+    return grammar_dict
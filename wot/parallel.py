@@ -0,0 +1,288 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Single machine, multi-core grammar construction and decoding.
+
+Splits an input into segments, builds a grammar for each segment in a
+process pool, and merges the segment grammars the same way the MRWoT
+reducer does.  Segment grammars are handed back to the parent process
+as frozen grammars (see wot.frozen) in shared memory (files in a
+temporary directory under /dev/shm where available) instead of as
+pickled tuples.  The directory is removed with any segments left
+unread once the build ends.
+
+decode() splits the root expansion of a .wot file into pieces with
+known output offsets, from the expansion lengths of the rules, and has
+a process pool expand the pieces straight into a memory-mapped output
+file.
+"""
+
+from wot import cache, core, frozen, ingest, mapped, query
+from wot.frozen import TERMINAL_LIMIT
+import array, collections, getopt, itertools, json, mmap, \
+    multiprocessing, os, shutil, sys, tempfile
+
+# ______________________________________________________________________
+
+SEGMENT_SIZE = ingest.SEGMENT_SIZE
+CHUNKS_PER_WORKER = 4
+# Segments submitted to the build pool ahead of the merge, per worker.
+SEGMENTS_PER_WORKER = 2
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+USAGE = """Usage:
+    $ python -m wot.parallel [-fh] [-c cache_dir] [-e engine] [-r min_run]
+        [-w workers] [-s segment_size] file
+
+Builds a merged grammar of the input file and writes it to stdout in
+the same format as the MRWoT reducer output.
+
+Flags:
+
+    -c    Reuse segment grammars cached in this directory, and cache
+          newly built ones there (see wot.cache).
+    -e    Grammar construction engine, 'sequitur' (default) or
+          'repair'.
+    -f    Split segments at FASTA record boundaries where possible.
+    -h    Print this help.
+    -r    Collapse runs of at least this many identical bytes into run
+          terminals before building (see wot.runs).
+    -s    Segment size in bytes (default %d).
+    -w    Number of worker processes (default is the CPU count).
+""" % SEGMENT_SIZE
+
+# ______________________________________________________________________
+
+# The segment cache each build worker has open.
+_segment_cache = None
+
+def _build_segment(args):
+    """Pool worker: build the grammar of one segment, or fetch it from
+    the segment cache, and write its frozen form to a shared memory
+    file in shm_dir.  Returns the segment key and the path of the file.
+    """
+    global _segment_cache
+    engine, segment, data, min_run, cache_dir, shm_dir = args
+    if cache_dir is not None:
+        if _segment_cache is None or _segment_cache.path != cache_dir:
+            _segment_cache = cache.SegmentCache(cache_dir)
+        frozen_bytes = _segment_cache.build_bytes(data, segment, engine,
+                                                  min_run)
+    else:
+        frozen_bytes = cache.build_segment(data, segment, engine,
+                                           min_run).tobytes()
+    fd, path = tempfile.mkstemp(prefix='wot-', dir=shm_dir)
+    with os.fdopen(fd, 'wb') as shm_file:
+        shm_file.write(frozen_bytes)
+    return segment, path
+
+# ______________________________________________________________________
+
+def _load_segment(segment, path):
+    """Read back a segment written by _build_segment(), returning a
+    grammar dump.
+    """
+    try:
+        with frozen.FrozenGrammar.load(path, segment) as grammar:
+            return grammar.dump()
+    finally:
+        os.unlink(path)
+
+# ______________________________________________________________________
+
+def imap_bounded(pool, function, tasks, window):
+    """Like pool.imap(), but reads tasks lazily, keeping at most window
+    of them submitted and not yet consumed.
+    """
+    tasks = iter(tasks)
+    pending = collections.deque(
+        pool.apply_async(function, (task,))
+        for task in itertools.islice(tasks, window))
+    while pending:
+        result = pending.popleft().get()
+        for task in itertools.islice(tasks, 1):
+            pending.append(pool.apply_async(function, (task,)))
+        yield result
+
+# ______________________________________________________________________
+
+def build(source, workers=None, segment_size=SEGMENT_SIZE, fasta=False,
+          engine='sequitur', min_run=None, cache_dir=None):
+    """Build a merged grammar from a file path or stream using a pool
+    of worker processes.  Segment keys count up from zero.  Returns the
+    merged grammar and a map from segment keys to root rule numbers,
+    as per core.merge().  Segment grammars are kept in a SegmentCache
+    under cache_dir if given, so reruns only build changed segments.
+    Only SEGMENTS_PER_WORKER segments per worker are read ahead of the
+    merge.
+    """
+    if isinstance(source, basestring):
+        istream = ingest.open_input(source)
+        try:
+            return build(istream, workers, segment_size, fasta, engine,
+                         min_run, cache_dir)
+        finally:
+            if istream is not sys.stdin:
+                istream.close()
+    splitter = ingest.iter_records if fasta else ingest.iter_chunks
+    workers = workers or multiprocessing.cpu_count()
+    shm_dir = tempfile.mkdtemp(prefix='wot-', dir=SHM_DIR)
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = imap_bounded(pool, _build_segment,
+                               ((engine, segment, data, min_run, cache_dir,
+                                 shm_dir)
+                                for segment, data in enumerate(
+                                    splitter(source, segment_size))),
+                               SEGMENTS_PER_WORKER * workers)
+        return core.merge(_load_segment(segment, path)
+                           for segment, path in results)
+    finally:
+        pool.terminate()
+        # Segments that were built but never read.
+        shutil.rmtree(shm_dir, ignore_errors=True)
+
+# ______________________________________________________________________
+
+class RegionWriter(object):
+    """Writes to a memory-mapped region of an open file."""
+    def __init__(self, out_file, offset, length):
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        self.map = mmap.mmap(out_file.fileno(), offset + length - start,
+                             offset=start)
+        self.pos = offset - start
+
+    def write(self, data):
+        self.map[self.pos:self.pos + len(data)] = data
+        self.pos += len(data)
+
+    def close(self):
+        self.map.close()
+
+# ______________________________________________________________________
+
+def split_member(grammar, lengths, chunk_size):
+    """Yield pieces of the root expansion of a mapped.MappedGrammar in
+    order, as packed symbols (see wot.frozen) and their expansion
+    length, each at least chunk_size bytes long but the last.  lengths
+    maps rule numbers to expansion lengths.  Symbols longer than
+    chunk_size are split along their rule bodies.
+    """
+    piece = array.array('i')
+    piece_len = 0
+    stack = [iter(grammar.body(0))]
+    while stack:
+        for packed in stack[-1]:
+            length = grammar.symbol_length(packed, lengths)
+            if length > chunk_size and packed >= TERMINAL_LIMIT:
+                stack.append(iter(grammar.body(packed - TERMINAL_LIMIT)))
+                break
+            piece.append(packed)
+            piece_len += length
+            if piece_len >= chunk_size:
+                yield piece, piece_len
+                piece = array.array('i')
+                piece_len = 0
+        else:
+            stack.pop()
+    if piece_len > 0:
+        yield piece, piece_len
+
+# ______________________________________________________________________
+
+# The member each decode worker has open, as ((path, offset), grammar).
+_member = (None, None)
+
+def _expand_piece(args):
+    """Pool worker: expand a piece of a member into its region of the
+    output file.  Returns the region length.
+    """
+    global _member
+    path, offset, cache_symbols, symbols, out_path, out_offset, length = \
+        args
+    key, grammar = _member
+    if key != (path, offset):
+        if grammar is not None:
+            grammar.close()
+        grammar = mapped.MappedGrammar(path, cache_symbols, offset)
+        _member = (path, offset), grammar
+    with open(out_path, 'r+b') as out_file:
+        writer = RegionWriter(out_file, out_offset, length)
+        try:
+            grammar.expand_symbols(writer, symbols)
+        finally:
+            writer.close()
+    return length
+
+# ______________________________________________________________________
+
+def decode(path, out_path, workers=None, chunk_size=None,
+           cache_symbols=mapped.CACHE_SYMBOLS):
+    """Decode a .wot file to out_path using a pool of worker processes.
+    Each member is split into pieces of chunk_size bytes (by default,
+    CHUNKS_PER_WORKER pieces per worker), which are expanded in
+    parallel.  Returns the output length.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    pieces = []
+    offset = 0
+    out_len = 0
+    more = True
+    while more:
+        with mapped.MappedGrammar(path, cache_symbols, offset) as grammar:
+            lengths = query.rule_lengths(grammar)
+            member_chunk = chunk_size or max(
+                lengths[0] // (workers * CHUNKS_PER_WORKER), 1)
+            for symbols, length in split_member(grammar, lengths,
+                                                member_chunk):
+                pieces.append((path, offset, cache_symbols, symbols,
+                               out_path, out_len, length))
+                out_len += length
+            offset = grammar.end
+            more = offset < len(grammar.map)
+    with open(out_path, 'wb') as out_file:
+        out_file.truncate(out_len)
+    pool = multiprocessing.Pool(workers)
+    try:
+        pool.map(_expand_piece, pieces, 1)
+    finally:
+        pool.terminate()
+    return out_len
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "c:e:fhr:s:w:")
+    cache_dir = None
+    engine = 'sequitur'
+    min_run = None
+    fasta = False
+    workers = None
+    segment_size = SEGMENT_SIZE
+    for opt in opts:
+        key, val = opt
+        if key == '-c':
+            cache_dir = val
+        elif key == '-e':
+            engine = val
+        elif key == '-f':
+            fasta = True
+        elif key == '-h':
+            print(USAGE)
+        elif key == '-r':
+            min_run = int(val)
+        elif key == '-s':
+            segment_size = int(val)
+        elif key == '-w':
+            workers = int(val)
+    for arg in args:
+        grammar, segments = build(arg, workers, segment_size, fasta,
+                                   engine, min_run, cache_dir)
+        rules = None
+        if grammar is not None:
+            _, rules = grammar.dump()
+        sys.stdout.write('null\t%s\n' % json.dumps((segments.items(),
+                                                     rules)))
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
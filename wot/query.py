@@ -0,0 +1,180 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Compressed-domain queries over grammar dictionaries.
+
+A grammar dictionary maps rule numbers to sequences of terminals
+(strings) and nonterminals (integers), as returned by
+core.Grammar.rules_to_dict() or codec.decode_grammar_dict().  Rule 0
+is the root.
+"""
+
+from collections import OrderedDict
+import threading
+
+# ______________________________________________________________________
+
+# Index keeps the counts of up to COUNT_CACHE_SIZE recent patterns of at
+# most COUNT_PATTERN_BYTES bytes.
+COUNT_CACHE_SIZE = 256
+COUNT_PATTERN_BYTES = 256
+
+# ______________________________________________________________________
+
+def topological_order(grammar_dict, root=0):
+    """Return the rules reachable from root, ordered so that every rule
+    comes after all the rules it refers to.
+    """
+    ret_val = []
+    seen = set([root])
+    stack = [(root, iter(grammar_dict[root]))]
+    while stack:
+        rule_no, symbols = stack[-1]
+        for symbol in symbols:
+            if type(symbol) == int and symbol not in seen:
+                seen.add(symbol)
+                stack.append((symbol, iter(grammar_dict[symbol])))
+                break
+        else:
+            stack.pop()
+            ret_val.append(rule_no)
+    return ret_val
+
+# ______________________________________________________________________
+
+def rule_lengths(grammar_dict, root=0):
+    """Return a map from rule numbers to expansion lengths."""
+    ret_val = {}
+    for rule_no in topological_order(grammar_dict, root):
+        ret_val[rule_no] = sum(ret_val[symbol] if type(symbol) == int
+                               else len(symbol)
+                               for symbol in grammar_dict[rule_no])
+    return ret_val
+
+# ______________________________________________________________________
+
+def extract(grammar_dict, lengths, start, length, root=0):
+    """Return length bytes of the expansion of root, starting at offset
+    start, visiting only the rules that cover the requested range.
+    """
+    ret_val = []
+    end = min(start + length, lengths[root])
+    if start >= end:
+        return ''
+    stack = [(root, 0)]
+    while stack:
+        symbol, offset = stack.pop()
+        if type(symbol) != int:
+            ret_val.append(symbol[max(start - offset, 0):end - offset])
+            continue
+        children = []
+        for child in grammar_dict[symbol]:
+            if offset >= end:
+                break
+            child_len = lengths[child] if type(child) == int else len(child)
+            if offset + child_len > start:
+                children.append((child, offset))
+            offset += child_len
+        children.reverse()
+        stack.extend(children)
+    return ''.join(ret_val)
+
+# ______________________________________________________________________
+
+def count(grammar_dict, pattern, root=0):
+    """Count the (possibly overlapping) occurrences of pattern in the
+    expansion of root without expanding the grammar.  Each rule is
+    summarized by its occurrence count and its first and last
+    len(pattern) - 1 bytes, so occurrences crossing symbol boundaries
+    are found by looking at short windows only.
+    """
+    if len(pattern) == 0:
+        raise ValueError("Empty pattern")
+    overlap = len(pattern) - 1
+    summaries = {}
+    # __________________________________________________
+    def _count(text):
+        ret_val = 0
+        idx = text.find(pattern)
+        while idx >= 0:
+            ret_val += 1
+            idx = text.find(pattern, idx + 1)
+        return ret_val
+    # __________________________________________________
+    for rule_no in topological_order(grammar_dict, root):
+        total = 0
+        prefix = ''
+        tail = ''
+        for symbol in grammar_dict[rule_no]:
+            if type(symbol) == int:
+                sym_count, sym_prefix, sym_suffix, sym_short = \
+                    summaries[symbol]
+            else:
+                sym_count = _count(symbol)
+                sym_prefix = symbol[:overlap]
+                sym_suffix = symbol[len(symbol) - overlap:]
+                sym_short = len(symbol) < overlap
+            if overlap > 0 and tail:
+                # Occurrences starting in tail and ending in symbol.
+                window = tail + sym_prefix
+                idx = window.find(pattern)
+                while 0 <= idx < len(tail):
+                    total += 1
+                    idx = window.find(pattern, idx + 1)
+            total += sym_count
+            if len(prefix) < overlap:
+                prefix = (prefix + sym_prefix)[:overlap]
+            if sym_short:
+                tail = (tail + sym_prefix)[-overlap:]
+            else:
+                tail = sym_suffix
+        summaries[rule_no] = (total, prefix, tail,
+                              len(prefix) < overlap)
+    return summaries[root][0]
+
+# ______________________________________________________________________
+
+class Index(object):
+    """Random access and counting over a grammar dictionary, caching
+    the results of recent count queries for short patterns.
+    """
+    def __init__(self, grammar_dict, root=0):
+        self.grammar_dict = grammar_dict
+        self.root = root
+        self.lengths = rule_lengths(grammar_dict, root)
+        self.counts = OrderedDict()
+        self.lock = threading.Lock()
+
+    def length(self):
+        return self.lengths[self.root]
+
+    def extract(self, start, length):
+        return extract(self.grammar_dict, self.lengths, start, length,
+                       self.root)
+
+    def count(self, pattern):
+        if len(pattern) > COUNT_PATTERN_BYTES:
+            return count(self.grammar_dict, pattern, self.root)
+        with self.lock:
+            ret_val = self.counts.pop(pattern, None)
+            if ret_val is not None:
+                self.counts[pattern] = ret_val
+                return ret_val
+        ret_val = count(self.grammar_dict, pattern, self.root)
+        with self.lock:
+            self.counts[pattern] = ret_val
+            while len(self.counts) > COUNT_CACHE_SIZE:
+                self.counts.popitem(last=False)
+        return ret_val
+
+    def memory_estimate(self):
+        """Rough estimate of the number of bytes held by the index,
+        including a full count cache.  Grammars with their own
+        memory_estimate() (see mapped.MappedGrammar) are asked for it.
+        """
+        if hasattr(self.grammar_dict, 'memory_estimate'):
+            ret_val = (self.grammar_dict.memory_estimate() +
+                       100 * len(self.lengths))
+        else:
+            symbols = sum(len(rhs) for rhs in self.grammar_dict.values())
+            ret_val = 64 * symbols + 200 * len(self.grammar_dict)
+        return ret_val + COUNT_CACHE_SIZE * (COUNT_PATTERN_BYTES + 200)
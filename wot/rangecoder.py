@@ -0,0 +1,280 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Adaptive range coding of grammar rule bodies.
+
+An alternative entropy backend to the static Huffman code used by
+wot.codec.  Symbols are coded with a 64 bit range coder (in the style
+of the LZMA coder, with carry propagation) driven by either an order-0
+adaptive model over the whole alphabet, or an order-1 model that
+predicts each symbol from the previous symbol in the same rule body
+and escapes to the order-0 model for unseen successors.
+"""
+
+# ______________________________________________________________________
+
+TOP = 1 << 56
+MASK = (1 << 64) - 1
+MAX_TOTAL = 1 << 24
+ORDER0_INCREMENT = 32
+ORDER1_LIMIT = 1 << 16
+
+# ______________________________________________________________________
+
+class RangeEncoder(object):
+    def __init__(self):
+        self.low = 0
+        self.range = MASK
+        self.cache = 0
+        self.cache_size = 1
+        self.out = bytearray()
+
+    def encode(self, start, size, total):
+        step = self.range // total
+        self.low += step * start
+        self.range = step * size
+        while self.range < TOP:
+            self.range <<= 8
+            self.shift_low()
+
+    def shift_low(self):
+        if self.low < 0xFF00000000000000 or self.low > MASK:
+            carry = self.low >> 64
+            temp = self.cache
+            while self.cache_size > 0:
+                self.out.append((temp + carry) & 0xFF)
+                temp = 0xFF
+                self.cache_size -= 1
+            self.cache = (self.low >> 56) & 0xFF
+        self.cache_size += 1
+        self.low = (self.low << 8) & MASK
+
+    def finish(self):
+        for _ in xrange(9):
+            self.shift_low()
+        return bytes(self.out)
+
+# ______________________________________________________________________
+
+class RangeDecoder(object):
+    def __init__(self, data):
+        self.data = bytearray(data)
+        self.pos = 9
+        self.range = MASK
+        self.code = 0
+        for byte in self.data[:9]:
+            self.code = ((self.code << 8) | byte) & MASK
+        self.step = 1
+
+    def get_freq(self, total):
+        self.step = self.range // total
+        return min(self.code // self.step, total - 1)
+
+    def decode(self, start, size):
+        self.code -= self.step * start
+        self.range = self.step * size
+        while self.range < TOP:
+            self.range <<= 8
+            byte = self.data[self.pos] if self.pos < len(self.data) else 0
+            self.pos += 1
+            self.code = ((self.code << 8) | byte) & MASK
+
+# ______________________________________________________________________
+
+class FrequencyModel(object):
+    """Adaptive order-0 model over symbol indices 0..size-1, keeping
+    cumulative frequencies in a Fenwick tree.
+    """
+    def __init__(self, size, increment=ORDER0_INCREMENT):
+        self.size = size
+        self.increment = increment
+        self.max_total = max(MAX_TOTAL, 4 * size)
+        self.freqs = [1] * size
+        self.rebuild()
+
+    def rebuild(self):
+        self.tree = [0] * (self.size + 1)
+        for idx, freq in enumerate(self.freqs, 1):
+            self.tree[idx] += freq
+            parent = idx + (idx & -idx)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[idx]
+        self.total = sum(self.freqs)
+        self.mask = 1
+        while self.mask * 2 <= self.size:
+            self.mask *= 2
+
+    def cumulative(self, index):
+        ret_val = 0
+        while index > 0:
+            ret_val += self.tree[index]
+            index -= index & -index
+        return ret_val
+
+    def find(self, target):
+        """Return the index whose cumulative range contains target."""
+        index = 0
+        mask = self.mask
+        while mask > 0:
+            probe = index + mask
+            if probe <= self.size and self.tree[probe] <= target:
+                index = probe
+                target -= self.tree[probe]
+            mask >>= 1
+        return index
+
+    def update(self, index):
+        self.freqs[index] += self.increment
+        self.total += self.increment
+        if self.total > self.max_total:
+            self.freqs = [(freq + 1) >> 1 for freq in self.freqs]
+            self.rebuild()
+        else:
+            index += 1
+            while index <= self.size:
+                self.tree[index] += self.increment
+                index += index & -index
+
+    def encode(self, encoder, index):
+        start = self.cumulative(index)
+        encoder.encode(start, self.freqs[index], self.total)
+        self.update(index)
+
+    def decode(self, decoder):
+        index = self.find(decoder.get_freq(self.total))
+        decoder.decode(self.cumulative(index), self.freqs[index])
+        self.update(index)
+        return index
+
+# ______________________________________________________________________
+
+class ContextModel(object):
+    """Adaptive model over the symbols seen so far in one order-1
+    context.  The escape symbol gets a frequency equal to the number
+    of distinct symbols seen (PPM method C).
+    """
+    def __init__(self):
+        self.symbols = []
+        self.freqs = []
+        self.total = 0
+
+    def encode(self, encoder, index):
+        """Encode index if it has been seen in this context and return
+        True, otherwise encode an escape and return False.
+        """
+        distinct = len(self.symbols)
+        grand_total = self.total + distinct
+        if distinct > 0:
+            start = 0
+            for pos, symbol in enumerate(self.symbols):
+                if symbol == index:
+                    encoder.encode(start, self.freqs[pos], grand_total)
+                    self.update(pos)
+                    return True
+                start += self.freqs[pos]
+            encoder.encode(self.total, distinct, grand_total)
+        self.add(index)
+        return False
+
+    def decode(self, decoder):
+        """Return a decoded index, or None for an escape."""
+        distinct = len(self.symbols)
+        if distinct == 0:
+            return None
+        grand_total = self.total + distinct
+        target = decoder.get_freq(grand_total)
+        if target >= self.total:
+            decoder.decode(self.total, distinct)
+            return None
+        start = 0
+        for pos, freq in enumerate(self.freqs):
+            if target < start + freq:
+                decoder.decode(start, freq)
+                ret_val = self.symbols[pos]
+                self.update(pos)
+                return ret_val
+            start += freq
+        raise ValueError("Corrupt range coded stream")
+
+    def add(self, index):
+        self.symbols.append(index)
+        self.freqs.append(1)
+        self.total += 1
+        self.rescale()
+
+    def update(self, pos):
+        self.freqs[pos] += 1
+        self.total += 1
+        # Keep frequent successors at the front of the linear search.
+        if pos > 0 and self.freqs[pos] > self.freqs[pos - 1]:
+            self.freqs[pos - 1], self.freqs[pos] = (self.freqs[pos],
+                                                    self.freqs[pos - 1])
+            self.symbols[pos - 1], self.symbols[pos] = (
+                self.symbols[pos], self.symbols[pos - 1])
+        self.rescale()
+
+    def rescale(self):
+        if self.total + len(self.symbols) > ORDER1_LIMIT:
+            self.freqs = [(freq + 1) >> 1 for freq in self.freqs]
+            self.total = sum(self.freqs)
+
+# ______________________________________________________________________
+
+def encode_bodies(alphabet, bodies, order=1):
+    """Range code a sequence of rule bodies.  alphabet is the sorted
+    list of all symbols that may occur.  Returns a byte string.
+    """
+    if order not in (0, 1):
+        raise ValueError("Unsupported model order %r" % (order,))
+    indices = dict((symbol, index) for index, symbol in enumerate(alphabet))
+    encoder = RangeEncoder()
+    order0 = FrequencyModel(len(alphabet))
+    contexts = {}
+    for body in bodies:
+        context = -1
+        for symbol in body:
+            index = indices[symbol]
+            if order == 0:
+                order0.encode(encoder, index)
+                continue
+            model = contexts.get(context)
+            if model is None:
+                model = contexts[context] = ContextModel()
+            if not model.encode(encoder, index):
+                order0.encode(encoder, index)
+            context = index
+    return encoder.finish()
+
+# ______________________________________________________________________
+
+def iter_decode_bodies(alphabet, lengths, data, order=1):
+    """Inverse of encode_bodies(), given the length of each body.
+    Generates a list of symbols for each body.
+    """
+    if order not in (0, 1):
+        raise ValueError("Unsupported model order %r" % (order,))
+    decoder = RangeDecoder(data)
+    order0 = FrequencyModel(len(alphabet))
+    contexts = {}
+    for length in lengths:
+        body = []
+        context = -1
+        for _ in xrange(length):
+            if order == 0:
+                body.append(alphabet[order0.decode(decoder)])
+                continue
+            model = contexts.get(context)
+            if model is None:
+                model = contexts[context] = ContextModel()
+            index = model.decode(decoder)
+            if index is None:
+                index = order0.decode(decoder)
+                model.add(index)
+            body.append(alphabet[index])
+            context = index
+        yield body
+
+# ______________________________________________________________________
+
+def decode_bodies(alphabet, lengths, data, order=1):
+    """Like iter_decode_bodies(), but returns a list of bodies."""
+    return list(iter_decode_bodies(alphabet, lengths, data, order))
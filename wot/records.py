@@ -0,0 +1,258 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Record-level access to .wot files.
+
+Multi-record FASTA files and line-oriented text are sequences of
+records separated by a delimiter byte: records start with '>' in FASTA
+files and end with '\\n' in text.  Given the expansion length and the
+number of delimiters in every rule, the i-th delimiter (select) and the
+number of delimiters before an offset (rank) are found by descending
+the grammar from the root, so a record is extracted without expanding
+anything else.
+
+Files written with a record index (see codec.FLAG_RECORDS) store these
+per-rule values in the header, along with the name (first word of the
+header line) of every FASTA record.  Their root body is split into
+blocks of BLOCK_SYMBOLS symbols, so that together with wot.mapped a
+lookup only decodes the rules on its path.
+"""
+
+from wot import codec, mapped, query
+import getopt, sys
+
+# ______________________________________________________________________
+
+BLOCK_SYMBOLS = 1024
+DELIMITERS = {'fasta': '>', 'lines': '\n'}
+USAGE = """Usage:
+    $ python -m wot.records [-hn] file.wot [record...]
+
+Writes the given records (numbered from 0) of a .wot file with a record
+index to stdout, or lists the number of records and the record names.
+
+Flags:
+
+    -h    Print this help.
+    -n    Look records up by name instead of by number.
+"""
+
+# ______________________________________________________________________
+
+def delimiter_counts(grammar_dict, delimiter, root=0):
+    """Return a map from rule numbers to the number of delimiter bytes
+    in their expansions.
+    """
+    ret_val = {}
+    for rule_no in query.topological_order(grammar_dict, root):
+        ret_val[rule_no] = sum(ret_val[symbol] if type(symbol) == int
+                               else symbol.count(delimiter)
+                               for symbol in grammar_dict[rule_no])
+    return ret_val
+
+# ______________________________________________________________________
+
+def block_root(grammar_dict, block=BLOCK_SYMBOLS):
+    """Return a copy of a grammar dictionary whose root body is split
+    into new rules of at most block symbols each.
+    """
+    ret_val = dict((rule_no, list(rhs))
+                   for rule_no, rhs in grammar_dict.items())
+    root_body = ret_val[0]
+    if len(root_body) > block:
+        next_rule = max(ret_val.keys()) + 1
+        ret_val[0] = []
+        for pos in xrange(0, len(root_body), block):
+            chunk = root_body[pos:pos + block]
+            if len(chunk) == 1:
+                ret_val[0].extend(chunk)
+                continue
+            ret_val[next_rule] = chunk
+            ret_val[0].append(next_rule)
+            next_rule += 1
+    return ret_val
+
+# ______________________________________________________________________
+
+class RecordIndex(object):
+    """Rank, select and record lookups over a grammar dictionary (or a
+    mapped.MappedGrammar).  lengths and counts map rule numbers to
+    expansion lengths and delimiter counts, and are computed if not
+    given.  names is a sequence of (name, record number) pairs.
+    """
+    def __init__(self, grammar_dict, delimiter, lengths=None, counts=None,
+                 names=()):
+        self.grammar_dict = grammar_dict
+        self.delimiter = delimiter
+        if lengths is None:
+            lengths = query.rule_lengths(grammar_dict)
+        self.lengths = lengths
+        if counts is None:
+            counts = delimiter_counts(grammar_dict, delimiter)
+        self.counts = counts
+        self.names = {}
+        for name, record_no in names:
+            self.names.setdefault(name, record_no)
+
+    @classmethod
+    def load(cls, path, cache_symbols=mapped.CACHE_SYMBOLS):
+        """Open the record index of a .wot file, paging rules in from
+        the memory-mapped file as needed.
+        """
+        grammar = mapped.MappedGrammar(path, cache_symbols)
+        section = grammar.sections.get(codec.FLAG_RECORDS)
+        if section is None:
+            grammar.close()
+            raise ValueError("%s has no record index" % (path,))
+        delimiter, lengths, counts, names = section
+        return cls(grammar, delimiter, dict(zip(grammar.numbers, lengths)),
+                   dict(zip(grammar.numbers, counts)), names)
+
+    def close(self):
+        if hasattr(self.grammar_dict, 'close'):
+            self.grammar_dict.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def length(self):
+        return self.lengths[0]
+
+    def symbol_length(self, symbol):
+        return self.lengths[symbol] if type(symbol) == int else len(symbol)
+
+    def symbol_count(self, symbol):
+        if type(symbol) == int:
+            return self.counts[symbol]
+        return symbol.count(self.delimiter)
+
+    def rank(self, offset):
+        """Return the number of delimiters before offset."""
+        ret_val = 0
+        rule_no = 0
+        while True:
+            for symbol in self.grammar_dict[rule_no]:
+                symbol_len = self.symbol_length(symbol)
+                if offset >= symbol_len:
+                    offset -= symbol_len
+                    ret_val += self.symbol_count(symbol)
+                elif type(symbol) != int:
+                    return ret_val + symbol[:offset].count(self.delimiter)
+                else:
+                    rule_no = symbol
+                    break
+            else:
+                return ret_val
+
+    def select(self, idx):
+        """Return the offset of the delimiter with index idx."""
+        if not 0 <= idx < self.counts[0]:
+            raise IndexError(idx)
+        ret_val = 0
+        rule_no = 0
+        while True:
+            for symbol in self.grammar_dict[rule_no]:
+                count = self.symbol_count(symbol)
+                if idx >= count:
+                    idx -= count
+                    ret_val += self.symbol_length(symbol)
+                elif type(symbol) != int:
+                    pos = -1
+                    for _ in xrange(idx + 1):
+                        pos = symbol.index(self.delimiter, pos + 1)
+                    return ret_val + pos
+                else:
+                    rule_no = symbol
+                    break
+
+    def __len__(self):
+        count = self.counts[0]
+        if self.delimiter == '>':
+            return count
+        elif count == 0:
+            return 1 if self.length() else 0
+        return count + (self.select(count - 1) + 1 < self.length())
+
+    def bounds(self, record_no):
+        """Return the start and end offsets of a record.  FASTA records
+        include their header line, text records their newline.
+        """
+        if not 0 <= record_no < len(self):
+            raise IndexError(record_no)
+        count = self.counts[0]
+        if self.delimiter == '>':
+            start = self.select(record_no)
+            end = (self.select(record_no + 1) if record_no + 1 < count
+                   else self.length())
+        else:
+            start = self.select(record_no - 1) + 1 if record_no else 0
+            end = (self.select(record_no) + 1 if record_no < count
+                   else self.length())
+        return start, end
+
+    def record(self, record_no):
+        start, end = self.bounds(record_no)
+        return query.extract(self.grammar_dict, self.lengths, start,
+                             end - start)
+
+    def find(self, name):
+        """Return the FASTA record with the given name."""
+        return self.record(self.names[name])
+
+    def read_names(self):
+        """Return (name, record number) pairs for FASTA records, read
+        from their header lines.
+        """
+        ret_val = []
+        for record_no in xrange(len(self)):
+            start, end = self.bounds(record_no)
+            header = ''
+            while '\n' not in header and start + 1 + len(header) < end:
+                header += query.extract(self.grammar_dict, self.lengths,
+                                        start + 1 + len(header), 256)
+            words = header.split('\n', 1)[0].split()
+            ret_val.append((words[0] if words else '', record_no))
+        return ret_val
+
+# ______________________________________________________________________
+
+def index_grammar(grammar, delimiter):
+    """Return a copy of a grammar dictionary (or frozen grammar) with
+    its root split into blocks, and its record index section (see
+    codec.header_outputs()).
+    """
+    grammar_dict = block_root(grammar)
+    index = RecordIndex(grammar_dict, delimiter)
+    names = index.read_names() if delimiter == '>' else []
+    keys = sorted(grammar_dict.keys())
+    return grammar_dict, (delimiter, [index.lengths[key] for key in keys],
+                          [index.counts[key] for key in keys], names)
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "hn")
+    by_name = False
+    for opt in opts:
+        key, val = opt
+        if key == '-h':
+            print(USAGE)
+            return
+        elif key == '-n':
+            by_name = True
+    with RecordIndex.load(args[0]) as index:
+        if len(args) == 1:
+            sys.stdout.write('%d\n' % (len(index),))
+            for name, record_no in sorted(index.names.items(),
+                                          key=lambda item: item[1]):
+                sys.stdout.write('%d\t%s\n' % (record_no, name))
+        for key in args[1:]:
+            sys.stdout.write(index.find(key) if by_name
+                             else index.record(int(key)))
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,258 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Compression against a reference grammar.
+
+Resequenced samples share almost all of their content with a reference
+genome, so relearning its repeats for every sample is wasted work.  A
+Reference holds the decoded grammar of a reference .wot file, read
+only.  compress() finds stretches of the input that occur in the
+reference, through an index of every ANCHOR-th reference k-mer.
+Matches are extended in both directions, and continue along the same
+alignment past single mismatching bytes, so substitutions cost one
+literal byte.  Each match becomes an imported rule, stored as a range
+of the reference expansion.  RePair then pairs up the sequence of
+imports and literal bytes, so only the rules new to the sample are
+stored.
+
+The import table goes in the header of the output stream along with
+the reference fingerprint (see codec.FLAG_REFERENCE).  The decoder
+turns each range back into the largest reference rules that cover it
+(cover(), which descends the reference grammar from its root), so
+decoding needs the same reference, but only its rule lengths: the
+reference expansion and its k-mer index are built on first use, when
+compressing.
+"""
+
+from wot import codec, query, repair
+import bisect, getopt, hashlib, sys
+
+# ______________________________________________________________________
+
+ANCHOR = 32
+USAGE = """Usage:
+    $ python -m wot.reference [-dh] [-b backend] [-k anchor] reference.wot
+        [input [output]]
+
+Compresses input (stdin by default) against the grammar of a reference
+.wot file, writing a .wot stream that only holds the rules not found in
+the reference to output (stdout by default).
+
+Flags:
+
+    -b    Entropy coding backend, 'huffman' (default) or 'range'.
+    -d    Decompress instead.
+    -h    Print this help.
+    -k    Length of the reference k-mers indexed to find matches
+          (default %d).
+""" % ANCHOR
+
+# ______________________________________________________________________
+
+def fingerprint(grammar_dict):
+    """Return the SHA-1 digest of the numbered rules of a grammar
+    dictionary.
+    """
+    hasher = hashlib.sha1()
+    for rule_no in sorted(grammar_dict.keys()):
+        hasher.update('r%d:' % rule_no)
+        for symbol in grammar_dict[rule_no]:
+            if type(symbol) == int:
+                hasher.update('n%d' % symbol)
+            else:
+                hasher.update('t%d:%s' % (len(symbol), symbol))
+    return hasher.digest()
+
+# ______________________________________________________________________
+
+def common_length(data_a, pos_a, data_b, pos_b, step=4096):
+    """Return the length of the common prefix of data_a[pos_a:] and
+    data_b[pos_b:], comparing slices rather than bytes.
+    """
+    ret_val = 0
+    limit = min(len(data_a) - pos_a, len(data_b) - pos_b)
+    while ret_val < limit:
+        size = min(step, limit - ret_val)
+        if (data_a[pos_a + ret_val:pos_a + ret_val + size] ==
+                data_b[pos_b + ret_val:pos_b + ret_val + size]):
+            ret_val += size
+        elif size == 1:
+            break
+        else:
+            step = size // 2
+    return ret_val
+
+# ______________________________________________________________________
+
+class Reference(object):
+    def __init__(self, grammar_dict, anchor=ANCHOR):
+        self.grammar_dict = grammar_dict
+        self.anchor = anchor
+        # Shortest match that continues an alignment past a mismatch.
+        self.resume = max(anchor // 4, 1)
+        self.fingerprint = fingerprint(grammar_dict)
+        self.lengths = query.rule_lengths(grammar_dict)
+        self._text = None
+        self._anchors = None
+        self.starts = {}
+
+    @property
+    def text(self):
+        """The reference expansion."""
+        if self._text is None:
+            self._text = query.extract(self.grammar_dict, self.lengths, 0,
+                                       self.lengths[0])
+        return self._text
+
+    @property
+    def anchors(self):
+        """Map from every anchor-th reference k-mer to its first
+        offset.
+        """
+        if self._anchors is None:
+            text = self.text
+            self._anchors = {}
+            for pos in xrange(0, len(text) - self.anchor + 1, self.anchor):
+                self._anchors.setdefault(text[pos:pos + self.anchor], pos)
+        return self._anchors
+
+    @classmethod
+    def load(cls, path, anchor=ANCHOR):
+        with open(path, 'rb') as in_file:
+            return cls(codec.decode_grammar_dict(in_file), anchor)
+
+    def symbol_starts(self, rule_no):
+        """Return the offsets of the symbols of a rule within its
+        expansion, followed by the expansion length.
+        """
+        ret_val = self.starts.get(rule_no)
+        if ret_val is None:
+            ret_val = [0]
+            for symbol in self.grammar_dict[rule_no]:
+                ret_val.append(ret_val[-1] + (self.lengths[symbol]
+                                              if type(symbol) == int
+                                              else len(symbol)))
+            self.starts[rule_no] = ret_val
+        return ret_val
+
+    def matches(self, data):
+        """Generate (start, end, reference offset) for stretches of data
+        that occur in the reference.
+        """
+        anchor = self.anchor
+        text = self.text
+        literal_start = 0
+        pos = 0
+        while pos + anchor <= len(data):
+            ref_pos = self.anchors.get(data[pos:pos + anchor])
+            if ref_pos is None:
+                pos += 1
+                continue
+            while (pos > literal_start and ref_pos > 0 and
+                   data[pos - 1] == text[ref_pos - 1]):
+                pos -= 1
+                ref_pos -= 1
+            end = pos + common_length(data, pos, text, ref_pos)
+            while True:
+                yield pos, end, ref_pos
+                # Skip one mismatching byte, and carry on along the same
+                # alignment if enough of the input matches after it.
+                ref_pos += end + 1 - pos
+                pos = end + 1
+                length = common_length(data, pos, text, ref_pos)
+                if length < self.resume:
+                    break
+                end = pos + length
+            pos = literal_start = end
+
+    def cover(self, start, end):
+        """Return the reference symbols whose expansions concatenate to
+        text[start:end], using the largest rules that fit.
+        """
+        ret_val = []
+        starts = self.symbol_starts(0)
+        stack = [(0, 0, bisect.bisect_right(starts, start) - 1)]
+        while stack:
+            rule_no, base, idx = stack.pop()
+            body = self.grammar_dict[rule_no]
+            starts = self.symbol_starts(rule_no)
+            while idx < len(body) and base + starts[idx] < end:
+                symbol = body[idx]
+                sym_start = base + starts[idx]
+                sym_end = base + starts[idx + 1]
+                idx += 1
+                if start <= sym_start and sym_end <= end:
+                    ret_val.append(symbol)
+                elif type(symbol) != int:
+                    ret_val.extend(symbol[max(start - sym_start, 0):
+                                          end - sym_start])
+                else:
+                    stack.append((rule_no, base, idx))
+                    child_starts = self.symbol_starts(symbol)
+                    stack.append((symbol, sym_start, max(bisect.bisect_right(
+                        child_starts, start - sym_start) - 1, 0)))
+                    break
+        return ret_val
+
+    def compress(self, data):
+        """Return a rules dictionary for data and the list of imported
+        (offset, length) reference ranges.  Rule i (counting from 1) of
+        the dictionary stands for the i-th import and has an empty
+        body.
+        """
+        imports = {}
+        sequence = []
+        pos = 0
+        for start, end, ref_pos in self.matches(data):
+            sequence.extend(data[pos:start])
+            sequence.append(imports.setdefault((ref_pos, end - start),
+                                               len(imports) + 1))
+            pos = end
+        sequence.extend(data[pos:])
+        first_rule = len(imports) + 1
+        sequence, bodies = repair.prune(*repair.repair(sequence, first_rule),
+                                        first_rule=first_rule)
+        rules_dict = {0: sequence}
+        ranges = [None] * len(imports)
+        for ref_range, import_no in imports.items():
+            rules_dict[import_no] = []
+            ranges[import_no - 1] = ref_range
+        for rule_no, body in enumerate(bodies, first_rule):
+            rules_dict[rule_no] = body
+        return rules_dict, ranges
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "b:dhk:")
+    backend = 'huffman'
+    encoding = True
+    anchor = ANCHOR
+    for opt in opts:
+        key, val = opt
+        if key == '-b':
+            backend = val
+        elif key == '-d':
+            encoding = False
+        elif key == '-h':
+            print(USAGE)
+            return
+        elif key == '-k':
+            anchor = int(val)
+    reference = Reference.load(args[0], anchor)
+    in_file = open(args[1], 'rb') if len(args) > 1 else sys.stdin
+    out_file = open(args[2], 'wb') if len(args) > 2 else sys.stdout
+    try:
+        if encoding:
+            codec.encode(in_file, out_file, backend=backend,
+                         reference=reference)
+        else:
+            codec.decode(in_file, out_file, reference)
+    finally:
+        for stream in in_file, out_file:
+            if stream not in (sys.stdin, sys.stdout):
+                stream.close()
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
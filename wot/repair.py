@@ -0,0 +1,221 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Offline RePair grammar construction.
+
+RePair repeatedly replaces the most frequent pair of adjacent symbols
+with a new rule until no pair occurs twice.  It needs the whole input
+up front, but usually produces smaller grammars than Sequitur.  The
+Grammar class below mirrors the parts of core.Grammar used by the
+codec and by MRWoT (build(), dump(), freeze(), rules_to_dict() and the
+rules list), so either engine can be used to produce the same rule
+structure.
+"""
+
+from wot import frozen
+import heapq, itertools
+
+# ______________________________________________________________________
+
+# Rough memory cost of pairing one input symbol (the sequence, its
+# links and its pair occurrence entries), see Grammar.memory_estimate().
+SYMBOL_BYTES = 256
+
+# ______________________________________________________________________
+
+class Rule(object):
+    __slots__ = ('number', 'body')
+
+    def __init__(self, number, body):
+        self.number = number
+        self.body = body
+
+    def dump(self):
+        return self.number, self.symbols()
+
+    def symbols(self):
+        return tuple(self.body)
+
+# ______________________________________________________________________
+
+def _remove_pair(occurrences, pair, position, changed):
+    positions = occurrences.get(pair)
+    if positions is not None:
+        positions.discard(position)
+        changed.add(pair)
+
+# ______________________________________________________________________
+
+def repair(sequence, first_rule=1):
+    """Run RePair over a sequence of symbols.  Returns the reduced
+    sequence and a list of the new rule bodies, where the rule at
+    index i is numbered first_rule + i.  Rule bodies only refer to
+    symbols created before them.
+    """
+    seq = list(sequence)
+    seq_len = len(seq)
+    nxt = range(1, seq_len + 1)
+    prv = range(-1, seq_len - 1)
+    occurrences = {}
+    for idx in xrange(seq_len - 1):
+        occurrences.setdefault((seq[idx], seq[idx + 1]), set()).add(idx)
+    heap = [(-len(positions), pair)
+            for pair, positions in occurrences.items()
+            if len(positions) > 1]
+    heapq.heapify(heap)
+    rules = []
+    while heap:
+        neg_count, pair = heapq.heappop(heap)
+        positions = occurrences.get(pair)
+        if positions is None or len(positions) != -neg_count:
+            # Stale entry, the pair has been pushed again with its
+            # current count if it is still a candidate.
+            continue
+        del occurrences[pair]
+        rule_no = first_rule + len(rules)
+        rules.append(list(pair))
+        left_sym, right_sym = pair
+        changed = set()
+        for idx in sorted(positions):
+            if seq[idx] != left_sym:
+                continue
+            right = nxt[idx]
+            if right >= seq_len or seq[right] != right_sym:
+                continue
+            before = prv[idx]
+            after = nxt[right]
+            if before >= 0:
+                _remove_pair(occurrences, (seq[before], left_sym), before,
+                             changed)
+            if after < seq_len:
+                _remove_pair(occurrences, (right_sym, seq[after]), right,
+                             changed)
+            seq[idx] = rule_no
+            seq[right] = None
+            nxt[idx] = after
+            if after < seq_len:
+                prv[after] = idx
+                new_pair = rule_no, seq[after]
+                occurrences.setdefault(new_pair, set()).add(idx)
+                changed.add(new_pair)
+            if before >= 0:
+                new_pair = seq[before], rule_no
+                occurrences.setdefault(new_pair, set()).add(before)
+                changed.add(new_pair)
+        for changed_pair in changed:
+            changed_positions = occurrences.get(changed_pair)
+            if changed_positions is not None:
+                if len(changed_positions) > 1:
+                    heapq.heappush(heap, (-len(changed_positions),
+                                          changed_pair))
+                elif len(changed_positions) == 0:
+                    del occurrences[changed_pair]
+    ret_val = []
+    idx = 0
+    while idx < seq_len:
+        ret_val.append(seq[idx])
+        idx = nxt[idx]
+    return ret_val, rules
+
+# ______________________________________________________________________
+
+def prune(sequence, bodies, first_rule=1):
+    """Inline the rules of a repair() result that are used only once.
+    Rules are numbered from first_rule; smaller numbers are left alone.
+    Returns the rewritten sequence and the remaining rule bodies,
+    renumbered from first_rule.
+    """
+    ref_counts = [0] * (len(bodies) + 1)
+    for body in bodies + [sequence]:
+        for symbol in body:
+            if type(symbol) == int and symbol >= first_rule:
+                ref_counts[symbol - first_rule + 1] += 1
+    # Rules only refer to earlier rules, so a single forward pass
+    # finds the final bodies and numbers.
+    numbers = [0] * (len(bodies) + 1)
+    inlined = [None] * (len(bodies) + 1)
+    ret_val = []
+    # __________________________________________________
+    def _rewrite(body):
+        rewritten = []
+        for symbol in body:
+            if type(symbol) != int or symbol < first_rule:
+                rewritten.append(symbol)
+                continue
+            idx = symbol - first_rule + 1
+            if ref_counts[idx] == 1:
+                rewritten.extend(inlined[idx])
+            else:
+                rewritten.append(numbers[idx])
+        return rewritten
+    # __________________________________________________
+    for idx, body in enumerate(bodies, 1):
+        new_body = _rewrite(body)
+        if ref_counts[idx] == 1:
+            inlined[idx] = new_body
+        elif ref_counts[idx] > 1:
+            numbers[idx] = first_rule + len(ret_val)
+            ret_val.append(new_body)
+    return _rewrite(sequence), ret_val
+
+# ______________________________________________________________________
+
+class Grammar(object):
+    """A grammar built with RePair.  Input passed to build() is
+    buffered, and the pairing runs the first time the rules are
+    needed.
+    """
+    def __init__(self):
+        self.root = Rule(0, [])
+        self._rules = [self.root]
+        self.pending = []
+        self.segment = None
+
+    @property
+    def rules(self):
+        if self.pending:
+            self.compress()
+        return self._rules
+
+    def build(self, sequence, segment=None, max_bytes=None):
+        """Buffer sequence, returning the number of elements consumed.
+        If max_bytes is given, buffer no more than would make
+        memory_estimate() exceed it (but always at least one element).
+        """
+        self.segment = segment
+        pending_len = len(self.pending)
+        if max_bytes is None:
+            self.pending.extend(sequence)
+        else:
+            limit = max(1, (max_bytes - self.memory_estimate()) //
+                        SYMBOL_BYTES)
+            self.pending.extend(itertools.islice(sequence, limit))
+        return len(self.pending) - pending_len
+
+    def compress(self):
+        """Pair the buffered input (following the current root body),
+        then inline rules that are used only once and renumber the
+        rules from 1.
+        """
+        sequence, bodies = repair(self.root.body + self.pending,
+                                  len(self._rules))
+        self.pending = []
+        bodies = [rule.body for rule in self._rules[1:]] + bodies
+        sequence, bodies = prune(sequence, bodies)
+        self._rules = [self.root]
+        for rule_no, body in enumerate(bodies, 1):
+            self._rules.append(Rule(rule_no, body))
+        self.root.body = sequence
+
+    def dump(self):
+        return self.segment, tuple(rule.dump() for rule in self.rules)
+
+    def freeze(self):
+        return frozen.FrozenGrammar.from_rules(
+            (rule.dump() for rule in self.rules), self.segment)
+
+    def memory_estimate(self):
+        """Estimate the peak bytes needed to pair the buffered input."""
+        return (len(self.root.body) + len(self.pending)) * SYMBOL_BYTES
+
+    def rules_to_dict(self):
+        return dict(rule.dump() for rule in self.rules)
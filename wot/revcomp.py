@@ -0,0 +1,233 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Reverse-complement aware RePair for DNA.
+
+DNA repeats often occur on the opposite strand, as the reverse
+complement of an earlier stretch.  The RePair variant below counts a
+pair of symbols together with its reverse complement, so that both
+orientations are replaced by the same rule: a rule referenced as the
+negative of its number stands for the reverse complement of its
+expansion.  Terminals are complemented byte by byte (A and T, C and G,
+either case); other bytes are their own complement.
+
+Grammars with reverse-complement references cannot be frozen (see
+wot.frozen) or merged, so they are only built by the codec (engine
+'revcomp', see codec.ENGINES), which marks them with
+codec.FLAG_REVCOMP.  codec.decode_grammar_dict() resolves these
+references with forward_rules(), so the tools that read grammar
+dictionaries (wot.query and the modules built on it) only see forward
+rules.
+"""
+
+from wot import repair as _repair
+import heapq, itertools, string
+
+# ______________________________________________________________________
+
+COMPLEMENT = string.maketrans('ACGTacgt', 'TGCAtgca')
+
+# ______________________________________________________________________
+
+def reverse_complement(data):
+    return data.translate(COMPLEMENT)[::-1]
+
+# ______________________________________________________________________
+
+def reverse_symbol(symbol):
+    """Return the reverse complement of a terminal or nonterminal."""
+    if type(symbol) == int:
+        return -symbol
+    return reverse_complement(symbol)
+
+# ______________________________________________________________________
+
+def reverse_body(body):
+    """Return the reverse complement of a sequence of symbols."""
+    return [reverse_symbol(symbol) for symbol in reversed(body)]
+
+# ______________________________________________________________________
+
+def forward_rules(grammar_dict):
+    """Return a copy of a grammar dictionary without reverse-complement
+    references: every rule referenced in reverse gets a forward rule for
+    its reverse complement, numbered past the other rules.
+    """
+    ret_val = {}
+    reverse_rules = {}
+    first_rule = max(grammar_dict.keys()) + 1
+    pending = []
+    # __________________________________________________
+    def _forward(symbol):
+        if type(symbol) != int or symbol >= 0:
+            return symbol
+        rule_no = reverse_rules.get(-symbol)
+        if rule_no is None:
+            rule_no = reverse_rules[-symbol] = first_rule + len(
+                reverse_rules)
+            pending.append(-symbol)
+        return rule_no
+    # __________________________________________________
+    for rule_no, rhs in grammar_dict.items():
+        ret_val[rule_no] = [_forward(symbol) for symbol in rhs]
+    while pending:
+        rule_no = pending.pop()
+        ret_val[reverse_rules[rule_no]] = [
+            _forward(symbol) for symbol in reverse_body(grammar_dict[rule_no])]
+    return ret_val
+
+# ______________________________________________________________________
+
+def repair(sequence, first_rule=1):
+    """Like repair.repair(), but pairs are counted and replaced in both
+    orientations: the most frequent canonical pair becomes a new rule,
+    and its reverse complement occurrences become references to the
+    negated rule number.  Rules that are their own reverse complement
+    (palindromes) are only referenced forwards.
+    """
+    palindromes = set()
+    # __________________________________________________
+    def _reverse(symbol):
+        if symbol in palindromes:
+            return symbol
+        return reverse_symbol(symbol)
+    # __________________________________________________
+    def _canonical(left_sym, right_sym):
+        return min((left_sym, right_sym),
+                   (_reverse(right_sym), _reverse(left_sym)))
+    # __________________________________________________
+    seq = list(sequence)
+    seq_len = len(seq)
+    nxt = range(1, seq_len + 1)
+    prv = range(-1, seq_len - 1)
+    occurrences = {}
+    for idx in xrange(seq_len - 1):
+        occurrences.setdefault(_canonical(seq[idx], seq[idx + 1]),
+                               set()).add(idx)
+    heap = [(-len(positions), pair)
+            for pair, positions in occurrences.items()
+            if len(positions) > 1]
+    heapq.heapify(heap)
+    rules = []
+    while heap:
+        neg_count, pair = heapq.heappop(heap)
+        positions = occurrences.get(pair)
+        if positions is None or len(positions) != -neg_count:
+            continue
+        del occurrences[pair]
+        rule_no = first_rule + len(rules)
+        rules.append(list(pair))
+        reverse_pair = _reverse(pair[1]), _reverse(pair[0])
+        if reverse_pair == pair:
+            palindromes.add(rule_no)
+        changed = set()
+        # Occurrences only overlap in runs of a repeated symbol.  Those
+        # of the reverse complement are replaced from right to left,
+        # so that both strands of a repeat are paired alike.
+        ordered = sorted(positions)
+        for idx, symbol, target in itertools.chain(
+                ((idx, rule_no, pair) for idx in ordered),
+                ((idx, -rule_no, reverse_pair)
+                 for idx in reversed(ordered))):
+            left_sym = seq[idx]
+            right = nxt[idx]
+            if left_sym is None or right >= seq_len:
+                continue
+            right_sym = seq[right]
+            if (left_sym, right_sym) != target:
+                continue
+            before = prv[idx]
+            after = nxt[right]
+            if before >= 0:
+                _repair._remove_pair(
+                    occurrences, _canonical(seq[before], left_sym),
+                    before, changed)
+            if after < seq_len:
+                _repair._remove_pair(
+                    occurrences, _canonical(right_sym, seq[after]),
+                    right, changed)
+            seq[idx] = symbol
+            seq[right] = None
+            nxt[idx] = after
+            if after < seq_len:
+                prv[after] = idx
+                new_pair = _canonical(symbol, seq[after])
+                occurrences.setdefault(new_pair, set()).add(idx)
+                changed.add(new_pair)
+            if before >= 0:
+                new_pair = _canonical(seq[before], symbol)
+                occurrences.setdefault(new_pair, set()).add(before)
+                changed.add(new_pair)
+        for changed_pair in changed:
+            changed_positions = occurrences.get(changed_pair)
+            if changed_positions is not None:
+                if len(changed_positions) > 1:
+                    heapq.heappush(heap, (-len(changed_positions),
+                                          changed_pair))
+                elif len(changed_positions) == 0:
+                    del occurrences[changed_pair]
+    ret_val = []
+    idx = 0
+    while idx < seq_len:
+        ret_val.append(seq[idx])
+        idx = nxt[idx]
+    return ret_val, rules
+
+# ______________________________________________________________________
+
+def prune(sequence, bodies, first_rule=1):
+    """Like repair.prune(), for rules that may be referenced in either
+    orientation.
+    """
+    ref_counts = [0] * (len(bodies) + 1)
+    for body in bodies + [sequence]:
+        for symbol in body:
+            if type(symbol) == int and abs(symbol) >= first_rule:
+                ref_counts[abs(symbol) - first_rule + 1] += 1
+    numbers = [0] * (len(bodies) + 1)
+    inlined = [None] * (len(bodies) + 1)
+    ret_val = []
+    # __________________________________________________
+    def _rewrite(body):
+        rewritten = []
+        for symbol in body:
+            if type(symbol) != int or abs(symbol) < first_rule:
+                rewritten.append(symbol)
+                continue
+            idx = abs(symbol) - first_rule + 1
+            if ref_counts[idx] == 1:
+                rewritten.extend(inlined[idx] if symbol > 0
+                                 else reverse_body(inlined[idx]))
+            else:
+                rewritten.append(numbers[idx] if symbol > 0
+                                 else -numbers[idx])
+        return rewritten
+    # __________________________________________________
+    for idx, body in enumerate(bodies, 1):
+        new_body = _rewrite(body)
+        if ref_counts[idx] == 1:
+            inlined[idx] = new_body
+        elif ref_counts[idx] > 1:
+            numbers[idx] = first_rule + len(ret_val)
+            ret_val.append(new_body)
+    return _rewrite(sequence), ret_val
+
+# ______________________________________________________________________
+
+class Grammar(_repair.Grammar):
+    """A grammar built with reverse-complement aware RePair."""
+    def compress(self):
+        sequence, bodies = repair(self.root.body + self.pending,
+                                  len(self._rules))
+        self.pending = []
+        bodies = [rule.body for rule in self._rules[1:]] + bodies
+        sequence, bodies = prune(sequence, bodies)
+        self._rules = [self.root]
+        for rule_no, body in enumerate(bodies, 1):
+            self._rules.append(_repair.Rule(rule_no, body))
+        self.root.body = sequence
+
+    def freeze(self):
+        """Return the grammar itself, which codec.encode_grammar()
+        accepts in place of a frozen grammar.
+        """
+        return self
@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Run-length pre-encoding of grammar input.
+
+Long runs of one byte (poly-A tails, gaps of N in assemblies) make
+Sequitur build chains of doubling rules, one digram at a time.  A
+RunEncoder collapses every run of at least min_run identical bytes
+into a single run terminal, the run itself as one string, before the
+input reaches Grammar.build().  Terminals are expanded by
+concatenation everywhere (wot.codec, wot.query and so on), so run
+terminals need no special decoding; .wot files list them in a run
+table (see codec.FLAG_RUNS).
+"""
+
+import re
+
+# ______________________________________________________________________
+
+MIN_RUN = 16
+
+# ______________________________________________________________________
+
+class RunEncoder(object):
+    """Turns a sequence of input chunks into lists of terminals.  The
+    run at the end of each chunk is held back, so runs that cross chunk
+    boundaries are collapsed as a whole.
+    """
+    def __init__(self, min_run=MIN_RUN):
+        if min_run < 2:
+            raise ValueError("Bad minimum run length %r" % (min_run,))
+        self.min_run = min_run
+        self.pattern = re.compile(r'(.)\1{%d,}' % (min_run - 1), re.S)
+        self.run_char = None
+        self.run_len = 0
+
+    def feed(self, data):
+        ret_val = []
+        if not data:
+            return ret_val
+        if self.run_char is not None:
+            rest = data.lstrip(self.run_char)
+            self.run_len += len(data) - len(rest)
+            if not rest:
+                return ret_val
+            ret_val.extend(self.flush())
+            data = rest
+        self.run_char = data[-1]
+        body = data.rstrip(self.run_char)
+        self.run_len = len(data) - len(body)
+        pos = 0
+        for match in self.pattern.finditer(body):
+            ret_val.extend(body[pos:match.start()])
+            ret_val.append(match.group())
+            pos = match.end()
+        ret_val.extend(body[pos:])
+        return ret_val
+
+    def flush(self):
+        """Return the terminals of the run held back, if any."""
+        ret_val = []
+        if self.run_char is not None:
+            if self.run_len >= self.min_run:
+                ret_val.append(self.run_char * self.run_len)
+            else:
+                ret_val.extend(self.run_char * self.run_len)
+            self.run_char = None
+            self.run_len = 0
+        return ret_val
+
+# ______________________________________________________________________
+
+def encode_runs(data, min_run=MIN_RUN):
+    """Return the terminals of a string, with runs collapsed."""
+    encoder = RunEncoder(min_run)
+    return encoder.feed(data) + encoder.flush()
+
+# ______________________________________________________________________
+
+def is_run(symbol):
+    return type(symbol) != int and len(symbol) > 1
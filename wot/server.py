@@ -0,0 +1,193 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Long running query server over .wot files.
+
+Memory-maps .wot files (see wot.mapped), decoding rule bodies on
+demand into a bounded cache, and keeps the resulting query.Index
+objects in a least recently used cache with a memory limit.  Files that
+wot.mapped cannot page (reverse-complement or reference streams, and
+files of several members) are decoded into memory instead.  Requests
+are served concurrently, one thread per connection, over a Unix socket
+or a localhost TCP port.
+
+The protocol is line oriented JSON.  Each request is an object with an
+"op" ("extract", "length" or "count") and a "path", plus "start" and
+"length" for extract, and "pattern" for count.  Each response is an
+object holding either a "result" or an "error".  Strings are sent as
+Latin-1 so arbitrary bytes survive the JSON encoding.  See wot.client
+for a client library.
+"""
+
+from wot import codec, mapped, query
+from collections import OrderedDict
+import getopt, json, os, SocketServer, stat, sys, threading
+
+# ______________________________________________________________________
+
+MAX_BYTES = 1 << 30
+USAGE = """Usage:
+    $ python -m wot.server [-h] [-m max_bytes] [-p port | -u socket_path]
+
+Flags:
+
+    -h    Print this help.
+    -m    Limit on the memory used by cached indexes (default %d).
+    -p    Listen on this localhost TCP port.
+    -u    Listen on this Unix socket (default).
+""" % MAX_BYTES
+
+# ______________________________________________________________________
+
+def load_index(path):
+    """Return a query.Index over a .wot file, backed by a
+    mapped.MappedGrammar where possible.
+    """
+    try:
+        grammar = mapped.MappedGrammar(path)
+    except ValueError:
+        grammar = None
+    if grammar is not None:
+        if grammar.end == len(grammar.map):
+            return query.Index(grammar)
+        grammar.close()
+    with open(path, 'rb') as in_file:
+        return query.Index(codec.decode_grammar_dict(in_file))
+
+# ______________________________________________________________________
+
+class IndexCache(object):
+    """Thread safe LRU cache of query indexes keyed by path.  Entries
+    are reloaded when the file changes, and the least recently used
+    entries are evicted once their estimated size exceeds max_bytes.
+    Indexes are loaded outside the lock, so requests for cached indexes
+    do not wait for a cold load; concurrent requests for the same file
+    wait for a single load.
+    """
+    def __init__(self, max_bytes=MAX_BYTES, loader=load_index):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.entries = OrderedDict()
+        self.loading = {}
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime
+        while True:
+            with self.lock:
+                entry = self.entries.pop(path, None)
+                if entry is not None and entry[0] != mtime:
+                    self.total_bytes -= entry[1].memory_estimate()
+                    entry = None
+                if entry is not None:
+                    self.entries[path] = entry
+                    return entry[1]
+                loaded = self.loading.get((path, mtime))
+                if loaded is None:
+                    loaded = self.loading[path, mtime] = threading.Event()
+                    break
+            loaded.wait()
+        try:
+            index = self.loader(path)
+            with self.lock:
+                entry = self.entries.pop(path, None)
+                if entry is not None:
+                    self.total_bytes -= entry[1].memory_estimate()
+                self.entries[path] = mtime, index
+                self.total_bytes += index.memory_estimate()
+                while (self.total_bytes > self.max_bytes and
+                       len(self.entries) > 1):
+                    _, (_, evicted) = self.entries.popitem(last=False)
+                    self.total_bytes -= evicted.memory_estimate()
+        finally:
+            with self.lock:
+                del self.loading[path, mtime]
+            loaded.set()
+        return index
+
+# ______________________________________________________________________
+
+def handle_request(cache, request):
+    """Answer a single decoded request, returning the result value."""
+    op = request['op']
+    index = cache.get(request['path'])
+    if op == 'extract':
+        return index.extract(request['start'],
+                             request['length']).decode('latin-1')
+    elif op == 'length':
+        return index.length()
+    elif op == 'count':
+        return index.count(request['pattern'].encode('latin-1'))
+    raise ValueError("Unknown operation %r" % (op,))
+
+# ______________________________________________________________________
+
+class QueryHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = {'result': handle_request(self.server.cache,
+                                                     json.loads(line))}
+            except Exception as exc:
+                response = {'error': '%s: %s' % (type(exc).__name__, exc)}
+            self.wfile.write(json.dumps(response) + '\n')
+            self.wfile.flush()
+
+# ______________________________________________________________________
+
+class UnixQueryServer(SocketServer.ThreadingMixIn,
+                      SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+class TCPQueryServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+# ______________________________________________________________________
+
+def make_server(address, max_bytes=MAX_BYTES):
+    """Create a query server.  A string address is a Unix socket path,
+    and a (host, port) tuple is a TCP address.  A stale socket at the
+    path is replaced, but any other file raises ValueError.
+    """
+    if isinstance(address, basestring):
+        if os.path.exists(address):
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                raise ValueError("%s exists and is not a socket" % address)
+            os.unlink(address)
+        server = UnixQueryServer(address, QueryHandler)
+    else:
+        server = TCPQueryServer(address, QueryHandler)
+    server.cache = IndexCache(max_bytes)
+    return server
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "hm:p:u:")
+    address = 'wot.sock'
+    max_bytes = MAX_BYTES
+    for opt in opts:
+        key, val = opt
+        if key == '-h':
+            print(USAGE)
+            return
+        elif key == '-m':
+            max_bytes = int(val)
+        elif key == '-p':
+            address = ('localhost', int(val))
+        elif key == '-u':
+            address = val
+    server = make_server(address, max_bytes)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if isinstance(address, basestring):
+            os.unlink(address)
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,168 @@
+#! /usr/bin/env python
+# ______________________________________________________________________
+"""Compressed-domain similarity between grammars.
+
+Two rules are considered common when they are structurally identical,
+as in core.Grammar.map_common_rules(): the same terminals, and
+nonterminals that are themselves common, in the same order.  Each rule
+gets a hash of its body with nonterminals replaced by their own hashes,
+so common rules can be found across any number of grammars without
+expanding them.  Similarity is reported as the Jaccard index of the
+two sets of rule hashes, and as the fraction of each expansion covered
+by common rules.
+"""
+
+from wot import codec, query
+import getopt, hashlib, itertools, multiprocessing, sys
+
+# ______________________________________________________________________
+
+USAGE = """Usage:
+    $ python -m wot.similarity [-h] [-w workers] file1.wot file2.wot...
+
+Compares every pair of .wot files, writing one tab separated line per
+pair: both paths, the Jaccard index of their rule hashes, and the
+fraction of each file covered by common rules.
+
+Flags:
+
+    -h    Print this help.
+    -w    Number of worker processes (default is the CPU count).
+"""
+
+# ______________________________________________________________________
+
+def rule_hashes(grammar_dict, root=0):
+    """Return a map from the rules reachable from root to the SHA-1
+    digests of their structure.
+    """
+    ret_val = {}
+    for rule_no in query.topological_order(grammar_dict, root):
+        hasher = hashlib.sha1()
+        for symbol in grammar_dict[rule_no]:
+            if type(symbol) == int:
+                hasher.update('n' + ret_val[symbol])
+            else:
+                hasher.update('t%d:%s' % (len(symbol), symbol))
+        ret_val[rule_no] = hasher.digest()
+    return ret_val
+
+# ______________________________________________________________________
+
+class Profile(object):
+    """The rule structure of a grammar, keyed by rule hash.  lengths
+    and children map each hash to the expansion length and to the
+    hashes of the nonterminals in the rule body.  order lists the
+    hashes so that children come before their parents.
+    """
+    def __init__(self, grammar_dict, root=0):
+        hashes = rule_hashes(grammar_dict, root)
+        lengths = query.rule_lengths(grammar_dict, root)
+        self.order = []
+        self.lengths = {}
+        self.children = {}
+        for rule_no in query.topological_order(grammar_dict, root):
+            digest = hashes[rule_no]
+            if digest in self.lengths:
+                continue
+            self.order.append(digest)
+            self.lengths[digest] = lengths[rule_no]
+            self.children[digest] = tuple(hashes[symbol]
+                                          for symbol in grammar_dict[rule_no]
+                                          if type(symbol) == int)
+        self.root = hashes[root]
+
+    def length(self):
+        return self.lengths[self.root]
+
+    def hash_set(self):
+        return set(self.order)
+
+    def covered(self, common):
+        """Return the number of bytes in the expansion covered by rules
+        whose hashes are in common.
+        """
+        ret_val = {}
+        for digest in self.order:
+            if digest in common:
+                ret_val[digest] = self.lengths[digest]
+            else:
+                ret_val[digest] = sum(ret_val[child]
+                                      for child in self.children[digest])
+        return ret_val[self.root]
+
+# ______________________________________________________________________
+
+def load_profile(path):
+    """Decode the grammar of a .wot file and return its Profile."""
+    with open(path, 'rb') as in_file:
+        return Profile(codec.decode_grammar_dict(in_file))
+
+# ______________________________________________________________________
+
+def compare(profile_a, profile_b):
+    """Return (jaccard, coverage_a, coverage_b) for two profiles."""
+    hashes_a = profile_a.hash_set()
+    hashes_b = profile_b.hash_set()
+    common = hashes_a & hashes_b
+    union_size = len(hashes_a | hashes_b)
+    # __________________________________________________
+    def _coverage(profile):
+        length = profile.length()
+        return float(profile.covered(common)) / length if length else 1.
+    # __________________________________________________
+    return (float(len(common)) / union_size if union_size else 1.,
+            _coverage(profile_a), _coverage(profile_b))
+
+# ______________________________________________________________________
+
+_PROFILES = None
+
+def _init_worker(profiles):
+    global _PROFILES
+    _PROFILES = profiles
+
+def _compare_pair(pair):
+    idx_a, idx_b = pair
+    return idx_a, idx_b, compare(_PROFILES[idx_a], _PROFILES[idx_b])
+
+# ______________________________________________________________________
+
+def compare_all(paths, workers=None):
+    """Compare every pair of .wot files using a pool of worker
+    processes.  Generates (path_a, path_b, (jaccard, coverage_a,
+    coverage_b)) tuples.
+    """
+    pool = multiprocessing.Pool(workers)
+    try:
+        profiles = pool.map(load_profile, paths)
+    finally:
+        pool.terminate()
+    pool = multiprocessing.Pool(workers, _init_worker, (profiles,))
+    try:
+        for idx_a, idx_b, result in pool.imap(
+                _compare_pair, itertools.combinations(range(len(paths)), 2),
+                chunksize=64):
+            yield paths[idx_a], paths[idx_b], result
+    finally:
+        pool.terminate()
+
+# ______________________________________________________________________
+
+def main(*args):
+    opts, args = getopt.getopt(args, "hw:")
+    workers = None
+    for opt in opts:
+        key, val = opt
+        if key == '-h':
+            print(USAGE)
+        elif key == '-w':
+            workers = int(val)
+    for path_a, path_b, result in compare_all(args, workers):
+        sys.stdout.write('%s\t%s\t%.6f\t%.6f\t%.6f\n' %
+                         ((path_a, path_b) + result))
+
+# ______________________________________________________________________
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])